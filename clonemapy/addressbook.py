@@ -0,0 +1,331 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements the address book of the agency which maps remote agents to their agency.
+
+Unknown addresses are requested from the AMS asynchronously. Messages to an agent whose address is
+being resolved are buffered until the address is known; each buffer holds at most max_pending
+messages, further messages are dropped. Only one request is sent to the AMS for each agent,
+regardless of the number of buffered messages. The buffered messages are forwarded without holding
+the lock of the address book; messages to the agent arriving in the meantime are buffered as well
+and forwarded in order before the address is used directly. Failed requests are stored in a
+negative cache so that messages to an invalid agent are dropped without repeatedly contacting the
+AMS.
+
+The addresses of all agents in the MAS can be loaded with one request at startup. Then, the AMS is
+only contacted for agents that have been created afterwards. Cached addresses are refreshed
+incrementally: in each refresh the addresses of the least recently fetched agents are requested
+again one by one, so that the load on the AMS does not grow with the size of the MAS. The AMS offers
+no request for the addresses that have changed since a given time; a refresh therefore does not
+discover changes of agents outside of its batch. Messages sent to an outdated address are returned
+by the remote agency and rerouted, which invalidates the cached address.
+"""
+
+import threading
+import time
+import heapq
+import logging
+import requests
+from concurrent import futures
+from typing import Callable, List
+import clonemapy.ams as ams
+import clonemapy.datamodels as datamodels
+
+
+class AddressBook:
+    """
+    Resolves and caches the agency of remote agents
+
+    Attributes
+    ----------
+    host : string
+           address of the AMS
+    masid : integer
+            ID of MAS
+    agency : string
+             name of the own agency; local agents are not stored in the address book
+    on_resolved : function
+                  called with agent ID, agency name and buffered messages once an address has been
+                  resolved; it is called repeatedly until no further messages have been buffered,
+                  i.e. the buffered messages are forwarded before any subsequent message to the
+                  agent; it is not executed while the address book is locked and may block; it must
+                  only forward the messages, not publish the address
+    on_published : function
+                   called with agent ID and agency name after the last buffered messages have been
+                   forwarded; it is executed while the address book is locked, i.e. before any
+                   subsequent message is routed to the agency directly, and must not block
+    on_changed : function
+                 called with a list of agent IDs whose address has changed or has been removed by
+                 a refresh
+    negative_ttl : float
+                   time in seconds a failed address request is cached
+    max_pending : integer
+                  maximum number of buffered messages per agent
+    hits : integer
+           number of lookups answered from the cache
+    misses : integer
+             number of lookups that required a request to the AMS or waited for one
+    negative : integer
+               number of lookups answered from the negative cache (message dropped)
+    overflow : integer
+               number of messages dropped because the buffer of the agent was full
+    """
+    def __init__(self, host: str, masid: int, agency: str,
+                 on_resolved: Callable[[int, str, List[datamodels.ACLMessage]], None],
+                 on_published: Callable[[int, str], None],
+                 on_changed: Callable[[List[int]], None],
+                 workers: int, negative_ttl: float, max_pending: int = 1000):
+        super().__init__()
+        self.host = host
+        self.masid = masid
+        self.agency = agency
+        self.on_resolved = on_resolved
+        self.on_published = on_published
+        self.on_changed = on_changed
+        self.negative_ttl = negative_ttl
+        self.max_pending = max_pending
+        self.hits = 0
+        self.misses = 0
+        self.negative = 0
+        self.overflow = 0
+        self._addresses = {}
+        self._pending = {}
+        self._failed = {}
+        self._fetched = {}
+        self._lock = threading.Lock()
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers)
+
+    def resolve(self, agentid: int, msg: datamodels.ACLMessage) -> str:
+        """
+        returns the agency of the agent if known; otherwise the message is buffered until the
+        address is resolved (or dropped if resolving has failed recently) and None is returned
+        """
+        self._lock.acquire()
+        pending = self._pending.get(agentid, None)
+        if pending is not None:
+            # address is already requested or buffered messages are being forwarded
+            self.misses += 1
+            if len(pending) >= self.max_pending:
+                self.overflow += 1
+                self._lock.release()
+                logging.error("Agency: Buffer for agent "+str(agentid)+" full; dropped message")
+                return None
+            pending.append(msg)
+            self._lock.release()
+            return None
+        agency = self._addresses.get(agentid, None)
+        if agency is not None:
+            self.hits += 1
+            self._lock.release()
+            return agency
+        expiry = self._failed.get(agentid, None)
+        if expiry is not None:
+            if expiry > time.monotonic():
+                self.negative += 1
+                self._lock.release()
+                logging.error("Agency: Invalid agent address for agent "+str(agentid))
+                return None
+            del self._failed[agentid]
+        self.misses += 1
+        self._pending[agentid] = [msg]
+        self._lock.release()
+        self._executor.submit(self._request_address, agentid)
+        return None
+
+    def refresh(self) -> bool:
+        """
+        requests the addresses of all agents in the MAS from the AMS with one request and updates
+        the cache; returns False if the request failed
+        """
+        try:
+            agents = ams.get_agents(self.host, self.masid)
+        except requests.RequestException as e:
+            logging.error("Agency: Request of agent addresses failed: "+str(e))
+            return False
+        if agents is None:
+            return False
+        addresses = {}
+        for i in agents.instances:
+            agency = i.address.agency
+            if agency is None or agency == "" or agency == self.agency:
+                continue
+            addresses[i.id] = agency
+        changed = []
+        added = 0
+        now = time.monotonic()
+        self._lock.acquire()
+        for agentid in list(self._addresses):
+            if agentid not in addresses:
+                del self._addresses[agentid]
+                del self._fetched[agentid]
+                changed.append(agentid)
+        for agentid in addresses:
+            self._fetched[agentid] = now
+            old = self._addresses.get(agentid, None)
+            if old == addresses[agentid]:
+                continue
+            if old is None:
+                added += 1
+            else:
+                changed.append(agentid)
+            self._addresses[agentid] = addresses[agentid]
+            self._failed.pop(agentid, None)
+        self._lock.release()
+        logging.info("Agency: Refreshed agent addresses; "+str(added)+" added, " +
+                     str(len(changed))+" changed or removed")
+        if len(changed) > 0:
+            self.on_changed(changed)
+        return True
+
+    def refresh_stale(self, batch: int) -> int:
+        """
+        requests the addresses of the batch least recently fetched agents from the AMS one by one
+        and updates the cache; returns the number of requested addresses
+        """
+        self._lock.acquire()
+        stale = heapq.nsmallest(batch, self._fetched, key=self._fetched.get)
+        self._lock.release()
+        reqs = [self._executor.submit(self._fetch_address, agentid) for agentid in stale]
+        addrs = [req.result() for req in reqs]
+        changed = []
+        now = time.monotonic()
+        self._lock.acquire()
+        for agentid, addr in zip(stale, addrs):
+            if addr is None or agentid not in self._addresses:
+                # request failed or address invalidated in the meantime
+                continue
+            if addr.agency is None or addr.agency == "" or addr.agency == self.agency:
+                del self._addresses[agentid]
+                del self._fetched[agentid]
+                changed.append(agentid)
+                continue
+            self._fetched[agentid] = now
+            if addr.agency != self._addresses[agentid]:
+                self._addresses[agentid] = addr.agency
+                changed.append(agentid)
+        self._lock.release()
+        logging.info("Agency: Refreshed "+str(len(stale))+" agent addresses; " +
+                     str(len(changed))+" changed or removed")
+        if len(changed) > 0:
+            self.on_changed(changed)
+        return len(stale)
+
+    def refresh_periodically(self, interval: float, batch: int):
+        """
+        refreshes the addresses of batch agents every interval seconds or all addresses with one
+        request if batch is 0 (to be executed in seperate thread)
+        """
+        while True:
+            time.sleep(interval)
+            if batch > 0:
+                self.refresh_stale(batch)
+            else:
+                self.refresh()
+
+    def stats(self) -> dict:
+        """
+        returns the lookup statistics and the size of the cache
+        """
+        self._lock.acquire()
+        ret = {"hits": self.hits, "misses": self.misses, "negative": self.negative,
+               "overflow": self.overflow, "cached": len(self._addresses),
+               "pending": len(self._pending)}
+        self._lock.release()
+        return ret
+
+    def invalidate(self, agentid: int):
+        """
+        removes the address of the agent from the cache
+        """
+        self._lock.acquire()
+        self._addresses.pop(agentid, None)
+        self._fetched.pop(agentid, None)
+        self._failed.pop(agentid, None)
+        self._lock.release()
+
+    def _request_address(self, agentid: int):
+        """
+        requests the address of the agent from the AMS and forwards the buffered messages
+        """
+        addr = self._fetch_address(agentid)
+        self._lock.acquire()
+        if addr is None or addr.agency is None or addr.agency == "":
+            msgs = self._pending.pop(agentid)
+            self._failed[agentid] = time.monotonic() + self.negative_ttl
+            self._lock.release()
+            logging.error("Agency: Invalid agent address for agent "+str(agentid) +
+                          "; dropped "+str(len(msgs))+" messages")
+            return
+        # the pending entry is kept while forwarding, so that further messages are buffered behind
+        # the ones being forwarded
+        msgs = self._pending[agentid]
+        self._pending[agentid] = []
+        self._lock.release()
+        while True:
+            try:
+                self.on_resolved(agentid, addr.agency, msgs)
+            except Exception:
+                logging.exception("Agency: Forwarding messages to agent "+str(agentid)+" failed")
+            self._lock.acquire()
+            msgs = self._pending[agentid]
+            if len(msgs) == 0:
+                del self._pending[agentid]
+                self._addresses[agentid] = addr.agency
+                self._fetched[agentid] = time.monotonic()
+                try:
+                    self.on_published(agentid, addr.agency)
+                finally:
+                    self._lock.release()
+                return
+            self._pending[agentid] = []
+            self._lock.release()
+
+    def _fetch_address(self, agentid: int) -> datamodels.Address:
+        """
+        requests the address of the agent from the AMS; returns None if the request failed
+        """
+        try:
+            return ams.get_agent_address(self.host, self.masid, agentid)
+        except requests.RequestException as e:
+            logging.error("Agency: Address request for agent "+str(agentid)+" failed: "+str(e))
+            return None
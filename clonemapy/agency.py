@@ -54,29 +54,98 @@ remote agents.
 
 import os
 import socket
+import random
+import http.client
 import http.server as server
+import socketserver
+import select
+from concurrent import futures
+from typing import Callable, List
 import threading
 import multiprocessing
+import multiprocessing.forkserver
 import time
 import json
-import requests
 import queue
 import logging
 import signal
+import shutil
 import sys
+import tempfile
+import urllib.parse
+import requests
+import clonemapy.config as config
 import clonemapy.datamodels as datamodels
+import clonemapy.message as message
 import clonemapy.ams as ams
 import clonemapy.agent as agent
 import clonemapy.logger as logger
+import clonemapy.df as df
+import clonemapy.direct as direct
+import clonemapy.dfcache as dfcache
+import clonemapy.transport as transport
+import clonemapy.addressbook as addressbook
+import clonemapy.ipc as ipc
+import clonemapy.queues as queues
+import clonemapy.metrics as metrics
+import clonemapy.tracing as tracing
+import clonemapy.routing as routing
 
 
 class AgencyHandler(server.BaseHTTPRequestHandler):
     """
     Handles http requests to the agency
+
+    Connections are kept open (HTTP/1.1) until they have been idle for the idle timeout of the
+    server. Hence, every response has to contain a Content-Length header and the request body has to
+    be read completely.
     """
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; avoid delayed ACKs on persistent connections
+    disable_nagle_algorithm = True
+
     def log_message(self, format, *args):
         return
 
+    def setup(self):
+        self.timeout = self.server.idle_timeout
+        self._body = None
+        super().setup()
+
+    def handle(self):
+        """
+        handles requests until the connection is closed by the client, is idle for longer than the
+        idle timeout or the server needs the worker for another connection
+        """
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self.server.wait_for_request(self.connection, self.timeout):
+                break
+            self.handle_one_request()
+
+    def read_body(self) -> bytes:
+        """
+        reads the request body
+        """
+        if self._body is None:
+            content_len = int(self.headers.get('Content-Length', 0))
+            self._body = self.rfile.read(content_len)
+        return self._body
+
+    def send_body(self, code: int, content_type: str, ret: str):
+        """
+        sends the response; an unread request body is discarded
+        """
+        self.read_body()
+        self._body = None
+        body = ret.encode()
+        self.send_response(code)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
         """
         handler function for GET requests
@@ -84,12 +153,18 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
         path = self.path.split("/")
         ret = ""
         resvalid = False
+        content_type = "application/json"
         logging.info("Agency: Received Request: GET " + self.path)
 
         if len(path) == 3:
             if path[2] == "agency":
                 ret = self.handle_get_agency()
                 resvalid = True
+        elif len(path) == 4:
+            if path[2] == "agency" and path[3] == "metrics":
+                ret = self.handle_get_metrics()
+                content_type = metrics.CONTENT_TYPE
+                resvalid = True
         elif len(path) == 6:
             if path[2] == "agency" and path[3] == "agents" and path[5] == "status":
                 try:
@@ -98,20 +173,66 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
                     resvalid = True
                 except ValueError:
                     pass
+            elif (path[2] == "agency" and path[3] == "dfcache" and path[5] == "graph" and
+                    self.server.agency.df_cache is not None):
+                try:
+                    ret = self.server.agency.df_cache.graph(int(path[4]))
+                except ValueError:
+                    pass
+                except requests.RequestException as e:
+                    self.send_dfcache_error(e)
+                    return
+                else:
+                    if ret is None:
+                        self.send_body(404, "text/plain", "Not Found")
+                        return
+                    resvalid = True
+        elif len(path) == 8 or len(path) == 12:
+            if (path[2] == "agency" and path[3] == "dfcache" and path[5] == "svc" and
+                    path[6] == "desc" and self.server.agency.df_cache is not None):
+                try:
+                    ret = self.handle_get_dfcache_svc(path)
+                    resvalid = True
+                except ValueError:
+                    pass
+                except requests.RequestException as e:
+                    self.send_dfcache_error(e)
+                    return
 
         if resvalid:
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(200, content_type, ret)
         else:
             ret = "Method Not Allowed"
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(405, "text/plain", ret)
             logging.error("Agency: " + ret)
 
+    def send_dfcache_error(self, e: Exception):
+        """
+        responds to a request to the DF cache which could not be forwarded to the DF
+        """
+        ret = "DF not reachable"
+        self.send_body(502, "text/plain", ret)
+        logging.error("Agency: DF request failed: "+str(e))
+
+    def handle_get_dfcache_svc(self, path: list) -> str:
+        """
+        handler function for GET request to /api/agency/dfcache/{masid}/svc/desc/{desc} and
+        /api/agency/dfcache/{masid}/svc/desc/{desc}/node/{nodeid}/dist/{dist}
+        """
+        masid = int(path[4])
+        desc = urllib.parse.unquote(path[7])
+        if len(path) == 8:
+            return self.server.agency.df_cache.search(masid, desc)
+        if path[8] != "node" or path[10] != "dist":
+            raise ValueError("invalid path")
+        return self.server.agency.df_cache.search(masid, desc, int(path[9]), float(path[11]))
+
+    def handle_get_metrics(self):
+        """
+        handler function for GET request to /api/agency/metrics
+        """
+        return self.server.agency.metrics.render()
+
     def handle_get_agency(self):
         """
         handler function for GET request to /api/agency
@@ -148,27 +269,33 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
             elif path[2] == "agency" and path[3] == "msgundeliv":
                 self.handle_post_uneliv_msg()
                 resvalid = True
+        elif len(path) == 6:
+            if (path[2] == "agency" and path[3] == "dfcache" and path[5] == "svc" and
+                    self.server.agency.df_cache is not None):
+                try:
+                    ret = self.handle_post_dfcache_svc(int(path[4]))
+                except ValueError:
+                    pass
+                except requests.RequestException as e:
+                    self.send_dfcache_error(e)
+                    return
+                else:
+                    self.send_body(201, "application/json", ret)
+                    return
 
         if resvalid:
             ret = "Ressource Created"
-            self.send_response(201)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(201, "text/plain", ret)
         else:
             ret = "Method Not Allowed"
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(405, "text/plain", ret)
             logging.error("Agency: "+ret)
 
     def handle_post_agent(self):
         """
         handler function for post request to /api/agency/agents
         """
-        content_len = int(self.headers.get('Content-Length'))
-        body = self.rfile.read(content_len)
+        body = self.read_body()
         # agentinfo_dict = json.loads(str(body, 'utf-8'))
         agentinfo = datamodels.AgentInfo.parse_raw(body, encoding='utf8')
         self.server.agency.create_agent(agentinfo)
@@ -177,26 +304,50 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
         """
         handler function for post requests to /api/agency/msgs
         """
-        content_len = int(self.headers.get('Content-Length'))
-        body = self.rfile.read(content_len)
+        start = time.monotonic()
+        body = self.read_body()
         msg_dicts = json.loads(str(body, 'utf-8'))
         msgs = []
         for i in msg_dicts:
-            msg = datamodels.ACLMessage.parse_obj(i)
-            # msg.from_json_dict(i)
+            msg = message.Message.from_dict(i)
+            if msg.trace is not None:
+                tracing.start(msg, "recv", start)
             msgs.append(msg)
+        undeliverable = []
+        local_agents = self.server.agency.routes.local
         for i in msgs:
-            self.server.agency.lock.acquire()
-            local_agent = self.server.agency.local_agents.get(i.receiver, None)
-            self.server.agency.lock.release()
+            local_agent = local_agents.get(i.receiver, None)
             if local_agent is not None:
+                self.server.agency.msgs_received.labels(i.receiver).inc()
+                tracing.stamp(i, "handle_post")
                 local_agent.msg_in.put(i)
+            else:
+                undeliverable.append(i)
+        if len(undeliverable) > 0:
+            self.server.agency.report_undeliverable(undeliverable)
+
+    def handle_post_dfcache_svc(self, masid: int) -> str:
+        """
+        handler function for post request to /api/agency/dfcache/{masid}/svc
+        """
+        body = self.read_body()
+        svc = datamodels.Service.parse_raw(body, encoding='utf8')
+        svc = self.server.agency.df_cache.register(masid, svc)
+        return svc.json()
 
     def handle_post_uneliv_msg(self):
         """
         handler function for post request to /api/agency/msgundeliv
         """
-        pass
+        body = self.read_body()
+        msg_dicts = json.loads(str(body, 'utf-8'))
+        if isinstance(msg_dicts, dict):
+            msg_dicts = [msg_dicts]
+        msgs = []
+        for i in msg_dicts:
+            msg = message.Message.from_dict(i)
+            msgs.append(msg)
+        self.server.agency.reroute_later(msgs)
 
     def do_PUT(self):
         """
@@ -218,33 +369,22 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
 
         if resvalid:
             ret = "Ressource Updated"
-            self.send_response(200)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(200, "text/plain", ret)
         else:
             ret = "Method Not Allowed"
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(405, "text/plain", ret)
             logging.error("Agency: "+ret)
 
     def handle_put_agent_custom(self, agentid: int):
         """
         handler function for put request to /api/agency/agents/{agentid}/custom
         """
-        content_len = int(self.headers.get('Content-Length'))
-        body = self.rfile.read(content_len)
+        body = self.read_body()
         custom = str(body, 'utf-8')
-        self.server.agency.lock.acquire()
-        handler = self.server.agency.local_agents.get(agentid, None)
-        if handler is None:
-            pass
-        else:
-            msg = datamodels.ACLMessage(receiver=agentid, sender=-1, prot=-1, content=custom)
+        handler = self.server.agency.routes.local_agent(agentid)
+        if handler is not None:
+            msg = message.Message(receiver=agentid, sender=-1, prot=-1, content=custom)
             handler.msg_in.put(msg)
-        self.server.agency.lock.release()
 
     def do_DELETE(self):
         """
@@ -262,46 +402,167 @@ class AgencyHandler(server.BaseHTTPRequestHandler):
                     resvalid, ret = self.handle_delete_agent(agentid)
                 except ValueError:
                     pass
+        elif len(path) == 8:
+            if (path[2] == "agency" and path[3] == "dfcache" and path[5] == "svc" and
+                    path[6] == "id" and self.server.agency.df_cache is not None):
+                try:
+                    self.server.agency.df_cache.deregister(int(path[4]), path[7])
+                    resvalid = True
+                    ret = "Resource deleted"
+                except ValueError:
+                    pass
+                except requests.RequestException as e:
+                    self.send_dfcache_error(e)
+                    return
 
         if resvalid:
-            self.send_response(200)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(200, "text/plain", ret)
         else:
-            self.send_response(405)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
-            self.wfile.write(ret.encode())
+            self.send_body(405, "text/plain", ret)
             logging.error("Agency: "+ret)
 
     def handle_delete_agent(self, agentid: int):
         """
         handler function for delete request to /api/agency/agents/{agent-id}
         """
-        self.server.agency.lock.acquire()
-        handler = self.server.agency.local_agents.get(agentid, None)
+        agency = self.server.agency
+        agency.lock.acquire()
+        handler = agency.routes.local_agent(agentid)
         if handler is None:
+            agency.lock.release()
             logging.error("Agency: Agent with id='%s' does not exist. "
                          "Can't perform DELETE.", agentid)
-            deleted = False
-            msg = "Resource not found"
-        else:
+            return False, "Resource not found"
+        if handler.worker is not None and len(handler.worker.agents) > 1:
+            # the thread of the agent cannot be stopped without terminating the other agents
+            agency.lock.release()
+            return False, "Agent is executed in a worker process together with other agents"
+        agency.routes.remove_local(agentid)
+        if agency.direct_dir != "":
+            direct.remove(agency.direct_dir, agentid)
+        if handler.worker is None:
             handler.proc.terminate()
-            del self.server.agency.local_agents[agentid]
-            deleted = True
-            msg = "Resource deleted"
-        self.server.agency.lock.release()
-        return deleted, msg
+            agency.release_channels(handler.msg_in, handler.msg_out)
+        else:
+            agency.stop_worker(handler.worker)
+        agency.lock.release()
+        return True, "Resource deleted"
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, server.HTTPServer):
+    """
+    http server handling each connection in a separate thread; required for persistent connections
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def wait_for_request(self, conn: socket.socket, timeout: float) -> bool:
+        """
+        called by the handler before reading the next request of a persistent connection; the
+        handler blocks until the idle timeout is reached
+        """
+        return True
+
+
+class PooledHTTPServer(server.HTTPServer):
+    """
+    http server handling connections with a bounded number of worker threads
+
+    A persistent connection occupies a worker only as long as it is active or no other connection
+    is waiting for a worker. Idle connections are closed as soon as another connection is waiting.
+    """
+    poll_interval = 0.05
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers: int):
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._closing = False
+
+    def process_request(self, request, client_address):
+        self._lock.acquire()
+        self._waiting += 1
+        self._lock.release()
+        self._executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        self._lock.acquire()
+        self._waiting -= 1
+        self._lock.release()
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def wait_for_request(self, conn: socket.socket, timeout: float) -> bool:
+        """
+        waits until the next request of a persistent connection arrives; returns False if the idle
+        timeout is reached or another connection is waiting for a worker
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        while True:
+            readable, _, _ = select.select([conn], [], [], self.poll_interval)
+            if len(readable) > 0:
+                return True
+            if self._waiting > 0 or self._closing:
+                return False
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+
+    def server_close(self):
+        # idle persistent connections are closed so that the workers can terminate
+        self._closing = True
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+def new_server(agency, port: int, workers: int) -> server.HTTPServer:
+    """
+    creates the http server of the agency; connections are handled by a pool of workers threads or
+    by one thread per connection if workers is 0
+    """
+    if workers > 0:
+        httpd = PooledHTTPServer(('', port), AgencyHandler, workers)
+    else:
+        httpd = ThreadingHTTPServer(('', port), AgencyHandler)
+    httpd.agency = agency
+    httpd.idle_timeout = config.get_float("CLONEMAP_HTTP_SERVER_IDLE_TIMEOUT", 60)
+    return httpd
 
 
 class AgentHandler:
     """
-    Contains the queue for incoming messages of local agents
+    Contains the queue for incoming messages of local agents; agents executed in a worker process
+    share the queue of the worker
     """
-    def __init__(self):
+    def __init__(self, msg_in, msg_out, worker=None):
         super().__init__()
-        self.msg_in = multiprocessing.Queue(100)
+        self.msg_in = msg_in
+        self.msg_out = msg_out
+        self.worker = worker
+        if worker is not None:
+            self.proc = worker.proc
+
+
+class WorkerHandler:
+    """
+    Contains the process and the queue for incoming messages of a worker process which executes
+    several agents
+    """
+    def __init__(self, size: int, msg_in, msg_out):
+        super().__init__()
+        self.size = size
+        self.agents = set()
+        self.msg_in = msg_in
+        self.msg_out = msg_out
+        self.proc = None
 
 
 class Agency:
@@ -309,12 +570,33 @@ class Agency:
     Handles the http REST API and manages the agents as well as messaging among agents
 
     Following threads are started
-    - one thread for http server
-    - one thread for sending of logs
+    - CLONEMAP_DISPATCH_SHARDS (default 1) threads dispatching the outgoing messages of local
+      agents; each agent or worker process is assigned to one shard with its own queue, hence the
+      messages of one sender are dispatched in order and a blocked receiver only stalls the senders
+      of one shard
+    - one thread for http server and a pool of CLONEMAP_HTTP_SERVER_WORKERS (default 32) threads
+      handling the connections (one thread per connection if set to 0)
+    - two threads for collecting and sending of logs
+    - two threads for collecting and sending of timeseries data
     - one thread for each remote agency for sending of messages
+    - one thread rerouting messages whose delivery has failed
+    - a pool of threads for requesting addresses of remote agents from the AMS
+    - one thread for refreshing the addresses of remote agents
+
+    All queues apply the overflow policy configured by CLONEMAP_QUEUE_<NAME>_POLICY, _SIZE and
+    _TIMEOUT (see module queues); by default producers block while a queue is full.
 
     Following processes are started:
-    - one process for each agent
+    - one process for each agent or, if CLONEMAP_AGENTS_PER_WORKER is larger than 1, one worker
+      process for each CLONEMAP_AGENTS_PER_WORKER agents; an agent executed in a worker process
+      can only be deleted if the worker does not execute any other agent
+
+    At startup the processes are started in parallel by CLONEMAP_SPAWN_WORKERS (default 8) threads.
+    CLONEMAP_START_METHOD selects the multiprocessing start method ("fork", "forkserver" or
+    "spawn"; default of the platform). The fork server is started while the configuration is
+    requested and has clonemapy and the module of the agent class already imported; with
+    "forkserver" and "spawn" the agent class has to be importable and the main module has to be
+    guarded by if __name__ == "__main__".
 
     Attributes
     ----------
@@ -323,34 +605,126 @@ class Agency:
     ag_class : class derived from agent.Agent
                implementation of agent behavior; one ag_class object for each agent is created in a
                seperate process
-    local_agents : dictionary of AgentHandler
-                   each local agent has a queue for incoming messages; this is stored in its handler
-    msg_out : multiprocessing.Queue
-              queue for outgoing messages
-    log_out : multiprocessing.Queue
+    routes : routing.RoutingTable
+             handlers of local agents (each local agent has a queue for incoming messages; this is
+             stored in its handler), queues of the agencies of remote agents and queues of remote
+             agencies (sending to each remote agency is handled in a seperate thread); lookups
+             do not acquire a lock
+    agents_per_worker : int
+                        number of agents executed in one worker process
+                        (CLONEMAP_AGENTS_PER_WORKER, default 1, i.e. one process per agent)
+    workers : list of WorkerHandler
+              worker processes in case several agents are executed in one process
+    msg_out : list of queues.OverflowQueue or ipc.RingGroup
+              queue for outgoing messages of each dispatch shard; within the agency and between
+              agency and agents messages are represented by message.Message
+    ipc : string
+          transport of messages between agency and agent processes (CLONEMAP_IPC); "queue"
+          (default) uses multiprocessing queues, "shm" uses shared memory ring buffers of
+          CLONEMAP_IPC_RING_SIZE bytes (default 1 MiB) per agent
+    direct_dir : string
+                 directory of the sockets for the direct delivery of messages among local agents
+                 if CLONEMAP_DIRECT_DELIVERY is "ON" (default "OFF"; see module direct), "" if
+                 disabled
+    log_out : queues.OverflowQueue
               queue for outgoing log messages
-    ts_out : multiprocessing.Queue
+    ts_out : queues.OverflowQueue
               queue for outgoing timeseries data
-    lock : multiprocessing.Lock
+    log_shipper : logger.LogShipper
+                  sends the logs of all agents to the logger in batches
+    ts_shipper : logger.TimeSeriesShipper
+                 sends the timeseries data of all agents to the logger in bulk
+    lock : threading.Lock
            lock to protect variables from concurrent access
-    remote_agents : dictionary of queue.Queue
-                    stores the outgoing queue of remote (non-local) agents
-    remote_agencies : dictionary of queue.Queue
-                      stores the outgoing queue of remote agencies (sending to each remote agency is
-                      handled in a seperate thread)
+    msg_batch_size : int
+                     maximum number of messages sent to a remote agency in one request
+                     (CLONEMAP_MSG_BATCH_SIZE, default 100)
+    msg_batch_wait : int
+                     maximum time in µs to wait for further messages before a batch is sent
+                     (CLONEMAP_MSG_BATCH_WAIT, default 0, i.e. only already queued messages are
+                     batched)
+    remote_pools : dictionary of transport.ConnectionPool
+                   pool of persistent connections for each remote agency; the pool size and the
+                   idle timeout are set by CLONEMAP_HTTP_POOL_SIZE (default 4) and
+                   CLONEMAP_HTTP_POOL_IDLE_TIMEOUT (seconds, default 30); idle connections are
+                   closed by the server after CLONEMAP_HTTP_SERVER_IDLE_TIMEOUT (seconds,
+                   default 60)
+    addresses : addressbook.AddressBook
+                resolves the addresses of remote agents with CLONEMAP_ADDR_WORKERS (default 4)
+                threads; failed requests are cached for CLONEMAP_ADDR_NEGATIVE_TTL (seconds,
+                default 10); at most CLONEMAP_ADDR_MAX_PENDING (default 1000) messages are
+                buffered per agent whose address is being resolved; the addresses of all agents
+                are loaded at startup unless CLONEMAP_ADDR_PREFETCH is "OFF"; every
+                CLONEMAP_ADDR_REFRESH (seconds, default 60, 0 disables refreshing) the
+                CLONEMAP_ADDR_REFRESH_BATCH (default 100) least recently fetched addresses are
+                requested again (0 requests the addresses of all agents with one request)
+    msg_retries : int
+                  maximum number of attempts to send a batch of messages to a remote agency
+                  (CLONEMAP_MSG_RETRIES, default 5); undelivered messages are rerouted
+    msg_backoff : float
+                  delay in seconds after the first failed attempt (CLONEMAP_MSG_RETRY_BACKOFF in
+                  ms, default 50); the delay doubles with each consecutive failure and is randomized
+                  by up to 50 percent
+    msg_max_backoff : float
+                      maximum delay in seconds between two attempts
+                      (CLONEMAP_MSG_RETRY_MAX_BACKOFF in ms, default 2000)
+    reroute_interval : float
+                       minimum time in seconds between two reroutings of messages to the same
+                       agent (CLONEMAP_MSG_REROUTE_INTERVAL, default 10); messages to an agent that
+                       cannot be delivered again within this time are dropped
+    rerouted : dictionary of float
+               time until which messages to an agent are not rerouted again
+    reroute_queue : queue.Queue
+                    unbounded queue of messages to be rerouted; senders of remote agencies and
+                    http handlers never block on it, so that a sender does not wait for space in
+                    its own full queue
+    delivery_stats : dictionary of int
+                     number of rerouted, dropped and undeliverable messages
+    metrics : metrics.Registry
+              metrics of the agency served at /api/agency/metrics
+    msgs_sent : metrics.Counter
+                number of messages sent by each local agent
+    msgs_received : metrics.Counter
+                    number of messages delivered to each local agent
+    route_hits : metrics.Counter
+                 number of messages to remote agents whose agency queue was cached
+    direct_msgs : metrics.Counter
+                  number of messages delivered directly among local agents as reported by the
+                  senders; these are also contained in msgs_sent and msgs_received
+    post_latency : metrics.Histogram
+                   latency of the requests sending messages to each remote agency
+    tracer : tracing.Tracer
+             aggregates the latency of each stage of traced messages (CLONEMAP_TRACE_SAMPLE)
+    ams_host : string
+               address of the AMS (CLONEMAP_AMS_HOST, default "ams:9000"); the configuration is
+               requested up to CLONEMAP_AMS_RETRIES (default 10) times with a randomized,
+               exponentially growing delay starting at CLONEMAP_AMS_RETRY_BACKOFF (ms, default
+               100) of at most CLONEMAP_AMS_RETRY_MAX_BACKOFF (ms, default 5000)
+    startup_time : metrics.Gauge
+                   duration of each startup phase; the phase "ready" lasts until the http server
+                   serves requests, "first_message" until the first message of a local agent has
+                   been dispatched
+    port : int
+           port of the http server (CLONEMAP_AGENCY_PORT, default 10000)
+    df_cache : dfcache.DFCache
+               cache of the DF searches of all local agents, which send their DF requests to the
+               agency (df_cache_url) if CLONEMAP_DF_CACHE_TTL (seconds, default 0) is larger than 0;
+               None if disabled
+
+    The addresses of logger and DF can be set with CLONEMAP_LOGGER_HOST (default "logger:11000")
+    and CLONEMAP_DF_HOST (default "df:12000").
+
+    The hostname of the agency, which determines MAS, image group and agency ID, and the name of
+    the agency, by which it is reached by other agencies, are set by Kubernetes. They can be
+    overridden by CLONEMAP_AGENCY_HOSTNAME and CLONEMAP_AGENCY_NAME (e.g. "localhost:10001") to
+    execute agencies outside of a cluster.
     """
     def __init__(self, ag_class: agent.Agent):
         super().__init__()
         signal.signal(signal.SIGINT, self.terminate)
         signal.signal(signal.SIGTERM, self.terminate)
         self.ag_class = ag_class
-        self.local_agents = {}
-        self.msg_out = multiprocessing.Queue(1000)
-        self.log_out = multiprocessing.Queue(1000)
-        self.ts_out = multiprocessing.Queue(1000)
-        self.lock = multiprocessing.Lock()
-        self.remote_agents = {}
-        self.remote_agencies = {}
+        started = time.monotonic()
         try:
             log_type = os.environ['CLONEMAP_LOG_LEVEL']
             if log_type == "info":
@@ -363,7 +737,75 @@ class Agency:
             logging.basicConfig(format='%(asctime)s - [%(levelname)s] - %(message)s',
                                 level=logging.ERROR)
 
-        temp = socket.gethostname()
+        start_method = config.get_str("CLONEMAP_START_METHOD", "")
+        if start_method != "":
+            self.set_start_method(start_method)
+        self.routes = routing.RoutingTable()
+        self.agents_per_worker = config.get_int("CLONEMAP_AGENTS_PER_WORKER", 1)
+        self.workers = []
+        self.starting_workers = 0
+        self.ipc = config.get_str("CLONEMAP_IPC", "queue")
+        self.ring_size = config.get_int("CLONEMAP_IPC_RING_SIZE", 1 << 20)
+        if self.ipc == "shm" and not ipc.AVAILABLE:
+            logging.error("Agency: Shared memory not available; using queues")
+            self.ipc = "queue"
+        self.direct_dir = ""
+        if config.get_switch("CLONEMAP_DIRECT_DELIVERY", False):
+            if direct.AVAILABLE:
+                self.direct_dir = tempfile.mkdtemp(prefix="clonemapy-direct-")
+            else:
+                logging.error("Agency: Unix sockets not available; direct delivery disabled")
+        self.dispatch_shards = max(config.get_int("CLONEMAP_DISPATCH_SHARDS", 1), 1)
+        if self.ipc == "shm":
+            self.msg_out = [ipc.RingGroup() for i in range(self.dispatch_shards)]
+        else:
+            self.msg_out = [queues.new_queue("MSG_OUT", 1000, multiprocessing.Queue)
+                            for i in range(self.dispatch_shards)]
+        self.dispatching = False
+        self.log_out = queues.new_queue("LOG_OUT", 1000, multiprocessing.Queue)
+        self.ts_out = queues.new_queue("TS_OUT", 1000, multiprocessing.Queue)
+        self.lock = threading.Lock()
+        self.msg_batch_size = config.get_int("CLONEMAP_MSG_BATCH_SIZE", 100)
+        self.msg_batch_wait = config.get_int("CLONEMAP_MSG_BATCH_WAIT", 0)
+        self.remote_pools = {}
+        self.pool_size = config.get_int("CLONEMAP_HTTP_POOL_SIZE", 4)
+        self.pool_idle_timeout = config.get_float("CLONEMAP_HTTP_POOL_IDLE_TIMEOUT", 30)
+        self.msg_retries = max(config.get_int("CLONEMAP_MSG_RETRIES", 5), 1)
+        self.msg_backoff = config.get_float("CLONEMAP_MSG_RETRY_BACKOFF", 50)/1000
+        self.msg_max_backoff = config.get_float("CLONEMAP_MSG_RETRY_MAX_BACKOFF", 2000)/1000
+        self.reroute_interval = config.get_float("CLONEMAP_MSG_REROUTE_INTERVAL", 10)
+        self.rerouted = {}
+        self.reroute_queue = queue.Queue()
+        self.delivery_stats = {"rerouted": 0, "dropped": 0, "undeliverable": 0}
+        self.undeliv_executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.metrics = metrics.Registry()
+        self.msgs_sent = self.metrics.counter("clonemap_agent_messages_sent_total",
+                                              "Messages sent by local agents", ("agent",))
+        self.msgs_received = self.metrics.counter("clonemap_agent_messages_received_total",
+                                                  "Messages delivered to local agents", ("agent",))
+        self.route_hits = self.metrics.counter("clonemap_route_cache_hits_total",
+                                               "Messages to remote agents with cached agency")
+        self.direct_msgs = self.metrics.counter("clonemap_direct_messages_total",
+                                                "Messages delivered directly among local agents")
+        self.post_latency = self.metrics.histogram("clonemap_remote_post_seconds",
+                                                   "Latency of message requests to remote agencies",
+                                                   ("agency",))
+        self.metrics.register_callback(self.collect_metrics)
+        self.tracer = tracing.Tracer(self.metrics)
+        self.startup_time = self.metrics.gauge("clonemap_agency_startup_seconds",
+                                               "Duration of the startup phases of the agency",
+                                               ("phase",))
+        self.ams_host = config.get_str("CLONEMAP_AMS_HOST", "ams:9000")
+        logger.set_host(config.get_str("CLONEMAP_LOGGER_HOST", "logger:11000"))
+        df.set_host(config.get_str("CLONEMAP_DF_HOST", "df:12000"))
+        self.port = config.get_int("CLONEMAP_AGENCY_PORT", 10000)
+        self.df_cache = None
+        self.df_cache_url = ""
+        ttl = config.get_float("CLONEMAP_DF_CACHE_TTL", 0)
+        if ttl > 0:
+            self.df_cache = dfcache.DFCache(ttl)
+            self.df_cache_url = "http://127.0.0.1:" + str(self.port) + "/api/agency/dfcache"
+        temp = config.get_str("CLONEMAP_AGENCY_HOSTNAME", socket.gethostname())
         logging.info("Agency: Starting agency " + temp)
         hostname = temp.split("-")
         self.hostname = hostname
@@ -373,151 +815,766 @@ class Agency:
         masid = int(hostname[1])
         imid = int(hostname[3])
         agencyid = int(hostname[5])
-        name = temp + ".mas" + hostname[1] + "agencies"
+        name = config.get_str("CLONEMAP_AGENCY_NAME", temp + ".mas" + hostname[1] + "agencies")
         self.info = datamodels.AgencyInfo(masid=masid, imid=imid, id=agencyid, name=name)
 
-        conf = ams.get_agency_info_full("ams:9000", self.info.masid, self.info.imid, self.info.id)
-        if conf.name != "":
-            # self.info.id = conf.id
-            self.logger_config = conf.logger
-            self.mas_name = conf.masname
-            self.mas_custom = conf.mascustom
-            self.info.agents = conf.agents
-        else:
+        t = time.monotonic()
+        conf = self.request_config()
+        if conf is None:
             logging.error("Agency: Received invalid agency info from AMS")
             return
+        # self.info.id = conf.id
+        self.logger_config = conf.logger
+        self.mas_name = conf.masname
+        self.mas_custom = conf.mascustom
+        self.info.agents = conf.agents
+        t = self.startup_phase("config", t)
+
+        self.addresses = addressbook.AddressBook(
+            self.ams_host, self.info.masid, self.info.name, self.address_resolved,
+            self.address_published, self.addresses_changed,
+            config.get_int("CLONEMAP_ADDR_WORKERS", 4),
+            config.get_float("CLONEMAP_ADDR_NEGATIVE_TTL", 10),
+            config.get_int("CLONEMAP_ADDR_MAX_PENDING", 1000))
+        if config.get_switch("CLONEMAP_ADDR_PREFETCH", True):
+            self.addresses.refresh()
+            t = self.startup_phase("addresses", t)
+        refresh = config.get_float("CLONEMAP_ADDR_REFRESH", 60)
+        batch = config.get_int("CLONEMAP_ADDR_REFRESH_BATCH", 100)
+        if refresh > 0:
+            y = threading.Thread(target=self.addresses.refresh_periodically,
+                                 args=(refresh, batch,), daemon=True)
+            y.start()
 
-        x = threading.Thread(target=self.send_msg, daemon=True)
+        for i in self.msg_out:
+            x = threading.Thread(target=self.send_msg, args=(i, started,), daemon=True)
+            x.start()
+        x = threading.Thread(target=self.reroute_failed, daemon=True)
         x.start()
-        y = threading.Thread(target=logger.send_logs,
-                             args=(self.info.masid, self.logger_config, self.log_out,),
-                             daemon=True)
+        self.log_shipper = logger.LogShipper(self.info.masid, self.logger_config)
+        y = threading.Thread(target=self.log_shipper.run, args=(self.log_out,), daemon=True)
         y.start()
-        y = threading.Thread(target=logger.send_timeseries_data,
-                             args=(self.info.masid, self.ts_out,),
+        self.ts_shipper = logger.TimeSeriesShipper(self.info.masid)
+        y = threading.Thread(target=self.ts_shipper.run, args=(self.ts_out, self.handle_report,),
                              daemon=True)
         y.start()
+        # connections are accepted by the kernel as soon as the socket is bound and handled once
+        # the agents have been started
+        self.httpd = new_server(self, self.port,
+                                config.get_int("CLONEMAP_HTTP_SERVER_WORKERS", 32))
+        t = self.startup_phase("bind", t)
         self.start_agents()
-        time.sleep(2)
+        t = self.startup_phase("agents", t)
+        self.startup_phase("ready", started)
         self.listen()
 
+    def set_start_method(self, method: str):
+        """
+        sets the start method of agent and worker processes; the fork server is started in a
+        seperate thread
+        """
+        if method not in multiprocessing.get_all_start_methods():
+            logging.error("Agency: Invalid start method: " + method)
+            return
+        multiprocessing.set_start_method(method, force=True)
+        if method == "forkserver":
+            multiprocessing.set_forkserver_preload(["clonemapy.agency", self.ag_class.__module__])
+            x = threading.Thread(target=multiprocessing.forkserver.ensure_running, daemon=True)
+            x.start()
+
+    def request_config(self) -> datamodels.AgencyInfoFull:
+        """
+        requests the configuration of the agency from the AMS; failed requests are retried with
+        backoff; returns None if no valid configuration has been received
+        """
+        retries = max(config.get_int("CLONEMAP_AMS_RETRIES", 10), 1)
+        delay = config.get_float("CLONEMAP_AMS_RETRY_BACKOFF", 100)/1000
+        max_delay = config.get_float("CLONEMAP_AMS_RETRY_MAX_BACKOFF", 5000)/1000
+        for i in range(retries):
+            if i > 0:
+                time.sleep(random.uniform(delay/2, delay))
+                delay = min(delay*2, max_delay)
+            try:
+                conf = ams.get_agency_info_full(self.ams_host, self.info.masid, self.info.imid,
+                                                self.info.id)
+            except requests.RequestException as e:
+                logging.error("Agency: Request to AMS failed: " + str(e))
+                continue
+            if conf is not None and conf.name != "":
+                return conf
+        return None
+
+    def startup_phase(self, phase: str, start: float) -> float:
+        """
+        records the duration of a startup phase which began at start; returns the current time
+        """
+        now = time.monotonic()
+        self.startup_time.labels(phase).set(now - start)
+        logging.info("Agency: Startup phase " + phase + " took " +
+                     str(round((now - start)*1000, 1)) + " ms")
+        return now
+
     def start_agents(self):
         """
-        Requests the agent configuration from the ams and starts the agents
+        starts the agents of the agency configuration in parallel
         """
         logging.info("Agency: Starting agents")
-        for i in self.info.agents:
-            self.create_agent(i)
+        executor = futures.ThreadPoolExecutor(
+            max_workers=max(config.get_int("CLONEMAP_SPAWN_WORKERS", 8), 1))
+        if self.agents_per_worker > 1:
+            # start the required worker processes first; agents are only added to them
+            num = (len(self.info.agents) + self.agents_per_worker - 1) // self.agents_per_worker
+            workers = [executor.submit(self.new_worker) for i in range(num)]
+            for i in workers:
+                i.result()
+        agents = [executor.submit(self.create_agent, i) for i in self.info.agents]
+        for i in agents:
+            i.result()
+        executor.shutdown()
 
     def create_agent(self, agentinfo: datamodels.AgentInfo):
         """
-        executes agent in seperate process
+        executes agent in seperate process or in a worker process
         """
-        # make child process handle signals with default handler
-        signal.signal(signal.SIGINT, signal.SIG_DFL)
-        signal.signal(signal.SIGTERM, signal.SIG_DFL)
-        ag_handler = AgentHandler()
+        if self.agents_per_worker > 1:
+            self.create_worker_agent(agentinfo)
+            return
+        msg_in, msg_out = self.new_channels(1, agentinfo.id)
+        ag_handler = AgentHandler(msg_in, msg_out)
         p = multiprocessing.Process(target=agent_starter, args=(self.ag_class, agentinfo,
                                     self.mas_name, self.mas_custom,
-                                    ag_handler.msg_in, self.msg_out, self.log_out, self.ts_out,))
+                                    msg_in, msg_out, self.log_out, self.ts_out,
+                                    self.logger_config, self.direct_dir,
+                                    self.df_cache_url,))
         p.start()
         ag_handler.proc = p
+        self.routes.add_local(agentinfo.id, ag_handler)
+        logging.info("Agency: Started agent "+str(agentinfo.id))
+
+    def create_worker_agent(self, agentinfo: datamodels.AgentInfo):
+        """
+        executes agent in a worker process with free capacity; a new worker is started if all
+        workers are full
+        """
         self.lock.acquire()
-        self.local_agents[agentinfo.id] = ag_handler
+        worker = None
+        for i in self.workers:
+            if len(i.agents) < i.size:
+                worker = i
+                worker.agents.add(agentinfo.id)
+                break
         self.lock.release()
-        # reset signal handler
-        signal.signal(signal.SIGINT, self.terminate)
-        signal.signal(signal.SIGTERM, self.terminate)
+        if worker is None:
+            worker = self.new_worker(agentinfo.id)
+        self.routes.add_local(agentinfo.id, AgentHandler(worker.msg_in, worker.msg_out, worker))
+        # commands bypass the overflow policy
+        worker.msg_in.queue.put(("start", agentinfo))
         logging.info("Agency: Started agent "+str(agentinfo.id))
 
+    def new_worker(self, agentid: int = None) -> WorkerHandler:
+        """
+        starts a new worker process; the agent with agentid is assigned to the worker before other
+        agents can be added
+        """
+        self.lock.acquire()
+        shard = len(self.workers) + self.starting_workers
+        self.starting_workers += 1
+        self.lock.release()
+        msg_in, msg_out = self.new_channels(self.agents_per_worker, shard)
+        worker = WorkerHandler(self.agents_per_worker, msg_in, msg_out)
+        if agentid is not None:
+            worker.agents.add(agentid)
+        p = multiprocessing.Process(target=worker_starter, args=(self.ag_class,
+                                    self.mas_name, self.mas_custom,
+                                    msg_in, msg_out, self.log_out, self.ts_out,
+                                    self.logger_config, self.direct_dir,
+                                    self.df_cache_url,))
+        p.start()
+        worker.proc = p
+        self.lock.acquire()
+        self.workers.append(worker)
+        self.starting_workers -= 1
+        self.lock.release()
+        logging.info("Agency: Started worker process "+str(p.pid))
+        return worker
+
+    def new_channels(self, size: int, shard: int):
+        """
+        returns the queues for incoming and outgoing messages of a new agent or worker process
+        executing size agents; the outgoing messages are dispatched by shard (modulo the number of
+        shards)
+        """
+        msg_out = self.msg_out[shard % self.dispatch_shards]
+        if self.ipc == "shm":
+            msg_in = queues.wrap("MSG_IN", ipc.ShmQueue(self.ring_size*size))
+            msg_out = queues.wrap("MSG_OUT", msg_out.new_queue(self.ring_size*size))
+            return msg_in, msg_out
+        msg_in = multiprocessing.Queue(config.get_int("CLONEMAP_QUEUE_MSG_IN_SIZE", 100)*size)
+        return queues.wrap("MSG_IN", msg_in), msg_out
+
+    def release_channels(self, msg_in, msg_out):
+        """
+        frees the queues of a terminated agent or worker process
+        """
+        if self.ipc == "shm":
+            msg_in.queue.unlink()
+            for group in self.msg_out:
+                if msg_out.queue in group:
+                    group.remove(msg_out.queue)
+
+    def stop_worker(self, worker: WorkerHandler):
+        """
+        terminates a worker process together with its agents (lock has to be held by caller)
+        """
+        worker.proc.terminate()
+        self.release_channels(worker.msg_in, worker.msg_out)
+        self.workers.remove(worker)
+        logging.info("Agency: Stopped worker process "+str(worker.proc.pid))
+
     def listen(self):
         """
-        open http server
+        serve requests with the http server
         """
-        serv = server.HTTPServer
-        self.httpd = serv(('', 10000), AgencyHandler)
-        self.httpd.agency = self
         self.httpd.serve_forever()
 
-    def send_msg(self):
+    def send_msg(self, msg_out, started: float):
+        """
+        send messages from local agents taken from msg_out (one dispatch shard); the time until the
+        first message is recorded as startup phase
+        """
+        first = True
+        name = self.info.name
+        routes = self.routes
+        while True:
+            msg = msg_out.get()
+            if first:
+                first = False
+                self.lock.acquire()
+                record = not self.dispatching
+                self.dispatching = True
+                self.lock.release()
+                if record:
+                    self.startup_phase("first_message", started)
+            if type(msg) is message.Multicast:
+                self.send_multicast(msg, name)
+                continue
+            tracing.stamp(msg, "msg_out")
+            recv = msg.receiver
+            msg.agencys = name
+            self.msgs_sent.labels(msg.sender).inc()
+            local_agent = routes.local.get(recv, None)
+            if local_agent is not None:
+                # agent is local -> add message to its queue
+                self.msgs_received.labels(recv).inc()
+                tracing.stamp(msg, "dispatch")
+                local_agent.msg_in.put(msg)
+                continue
+            recv_agency = routes.remote.get(recv, None)
+            if recv_agency is None:
+                self.send_remote_msg(msg)
+            else:
+                # add message to queue of remote agent
+                self.route_hits.inc()
+                tracing.stamp(msg, "dispatch")
+                recv_agency.put(msg)
+
+    def send_multicast(self, mc: message.Multicast, name: str):
         """
-        send messages from local agents
+        fans out a message to several receivers in one pass; each local agent gets a copy of the
+        message, while agents executed by the same worker process and agents located at the same
+        remote agency get one multicast; messages to agents with unknown address are sent
+        individually
         """
+        msg = mc.msg
+        msg.agencys = name
+        self.msgs_sent.labels(msg.sender).inc(len(mc.receivers))
+        routes = self.routes
+        local = {}
+        remote = {}
+        for recv in mc.receivers:
+            local_agent = routes.local.get(recv, None)
+            if local_agent is not None:
+                self.msgs_received.labels(recv).inc()
+                local.setdefault(id(local_agent.msg_in), (local_agent, []))[1].append(recv)
+                continue
+            recv_agency = routes.remote.get(recv, None)
+            if recv_agency is None:
+                single = msg.copy()
+                single.receiver = recv
+                self.send_remote_msg(single)
+            else:
+                self.route_hits.inc()
+                remote.setdefault(id(recv_agency), (recv_agency, []))[1].append(recv)
+        for local_agent, receivers in local.values():
+            if local_agent.worker is not None and len(receivers) > 1:
+                local_agent.msg_in.put(message.Multicast(msg, receivers))
+                continue
+            for recv in receivers:
+                single = msg.copy()
+                single.receiver = recv
+                local_agent.msg_in.put(single)
+        for recv_agency, receivers in remote.values():
+            # the sender of the remote agency modifies the message
+            msg = msg.copy()
+            if len(receivers) > 1:
+                recv_agency.put(message.Multicast(msg, receivers))
+            else:
+                msg.receiver = receivers[0]
+                recv_agency.put(msg)
+
+    def send_remote_msg(self, msg: message.Message):
+        """
+        looks up the agency of a non-local agent and adds the message to the queue of the agency;
+        the message is buffered by the address book if the address has to be requested
+        """
+        recv = msg.receiver
+        addr = self.addresses.resolve(recv, msg)
+        if addr is None:
+            return
+        recv_agency = self.remote_agency(addr)
+        self.routes.set_remote(recv, recv_agency)
+        tracing.stamp(msg, "dispatch")
+        recv_agency.put(msg)
+
+    def remote_agency(self, address: str) -> queues.OverflowQueue:
+        """
+        returns the queue of a remote agency; if the remote agency is not known, a queue for
+        messages to this agency is created and a sender is started in a new thread
+        """
+        return self.routes.agency(address, self.new_remote_agency)
+
+    def new_remote_agency(self, address: str) -> queues.OverflowQueue:
+        """
+        creates the queue and the connection pool for messages to a remote agency and starts its
+        sender
+        """
+        agency = queues.new_queue("REMOTE", 1000)
+        pool = transport.ConnectionPool(address, self.pool_size, self.pool_idle_timeout)
         self.lock.acquire()
-        masid = self.info.masid
+        self.remote_pools[address] = pool
         self.lock.release()
+        y = threading.Thread(target=remote_agency_sender,
+                             args=(address, agency, pool, self.msg_batch_size,
+                                   self.msg_batch_wait, self.msg_retries, self.msg_backoff,
+                                   self.msg_max_backoff, self.reroute_later,
+                                   self.post_latency.labels(address),),
+                             daemon=True)
+        y.start()
+        return agency
+
+    def handle_report(self, item):
+        """
+        handles the reports of agents received via the time series queue, i.e. traces of messages
+        and numbers of messages delivered directly among local agents
+        """
+        if isinstance(item, direct.DeliveryReport):
+            total = 0
+            for recv, num in item.counts.items():
+                self.msgs_received.labels(recv).inc(num)
+                total += num
+            self.msgs_sent.labels(item.sender).inc(total)
+            self.direct_msgs.inc(total)
+            return
+        self.tracer.report(item)
+
+    def queue_stats(self) -> dict:
+        """
+        returns depth, high-water mark, dropped and spilled items of all queues; the queues of the
+        same kind are summed up
+        """
+        handlers = list(self.routes.local.values())
+        remote = list(self.routes.agencies.values())
+        msg_in = {}
+        msg_out = {}
+        for i in handlers:
+            msg_in[id(i.msg_in)] = i.msg_in
+            msg_out[id(i.msg_out)] = i.msg_out
+        return {"msg_in": queues.merge_stats([i.stats() for i in msg_in.values()]),
+                "msg_out": queues.merge_stats([i.stats() for i in msg_out.values()]),
+                "log_out": self.log_out.stats(),
+                "ts_out": self.ts_out.stats(),
+                "remote": queues.merge_stats([i.stats() for i in remote])}
+
+    def collect_metrics(self) -> list:
+        """
+        returns the metrics of queues, address book, connection pools and loggers
+        """
+        depth = metrics.Gauge("clonemap_queue_depth", "Items in queue", ("queue", "agency"))
+        high_water = metrics.Gauge("clonemap_queue_high_water", "Maximum number of items in queue",
+                                   ("queue", "agency"))
+        dropped = metrics.Counter("clonemap_queue_dropped_total",
+                                  "Items dropped by the overflow policy", ("queue", "agency"))
+        spilled = metrics.Gauge("clonemap_queue_spilled", "Items spilled to disk",
+                                ("queue", "agency"))
+        stats = self.queue_stats()
+        del stats["remote"]
+        remote = list(self.routes.agencies.items())
+        self.lock.acquire()
+        pools = list(self.remote_pools.items())
+        delivery = dict(self.delivery_stats)
+        self.lock.release()
+        for name in stats:
+            stats[name] = (name, "", stats[name])
+        for address, q in remote:
+            stats["remote " + address] = ("remote", address, q.stats())
+        for name, address, queue_stats in stats.values():
+            depth.labels(name, address).set(max(queue_stats["depth"], 0))
+            high_water.labels(name, address).set(queue_stats["high_water"])
+            dropped.labels(name, address).set(queue_stats["dropped"])
+            spilled.labels(name, address).set(queue_stats["spilled"])
+        ret = [depth, high_water, dropped, spilled]
+
+        msgs = metrics.Counter("clonemap_undelivered_messages_total",
+                               "Messages to remote agents that could not be delivered",
+                               ("result",))
+        for result in delivery:
+            msgs.labels(result).set(delivery[result])
+        ret.append(msgs)
+
+        lookups = metrics.Counter("clonemap_address_lookups_total",
+                                  "Lookups of agent addresses in the address book", ("result",))
+        addr_stats = self.addresses.stats()
+        lookups.labels("hit").set(addr_stats["hits"])
+        lookups.labels("miss").set(addr_stats["misses"])
+        lookups.labels("negative").set(addr_stats["negative"])
+        lookups.labels("overflow").set(addr_stats["overflow"])
+        cached = metrics.Gauge("clonemap_address_cache_size", "Cached agent addresses")
+        cached.set(addr_stats["cached"])
+        ret.extend([lookups, cached])
+
+        pool_requests = metrics.Counter("clonemap_http_pool_requests_total",
+                                        "Requests to remote agencies", ("agency",))
+        conns = metrics.Counter("clonemap_http_pool_connections_total",
+                                "Connections to remote agencies", ("agency", "event"))
+        idle = metrics.Gauge("clonemap_http_pool_idle_connections",
+                             "Idle connections to remote agencies", ("agency",))
+        for address, pool in pools:
+            pool_stats = pool.stats()
+            pool_requests.labels(address).set(pool_stats["requests"])
+            for event in ("created", "reused", "closed"):
+                conns.labels(address, event).set(pool_stats[event])
+            idle.labels(address).set(pool_stats["idle"])
+        ret.extend([pool_requests, conns, idle])
+
+        logs = metrics.Counter("clonemap_logs_total", "Logs handled by the log shipper",
+                               ("result", "topic"))
+        log_stats = self.log_shipper.stats()
+        logs.labels("shipped", "").set(log_stats["shipped"])
+        for topic in log_stats["dropped"]:
+            logs.labels("dropped", topic).set(log_stats["dropped"][topic])
+        samples = metrics.Counter("clonemap_timeseries_samples_total",
+                                  "Time series samples handled by the shipper", ("result",))
+        ts_stats = self.ts_shipper.stats()
+        samples.labels("shipped").set(ts_stats["shipped"])
+        samples.labels("dropped").set(ts_stats["dropped"])
+        ret.extend([logs, samples])
+
+        if self.df_cache is not None:
+            searches = metrics.Counter("clonemap_df_cache_searches_total",
+                                       "Service searches of local agents", ("result",))
+            df_stats = self.df_cache.stats()
+            for result in ("hits", "misses", "coalesced"):
+                searches.labels(result).set(df_stats[result])
+            cached_svcs = metrics.Gauge("clonemap_df_cache_size", "Cached service searches")
+            cached_svcs.set(df_stats["cached"])
+            ret.extend([searches, cached_svcs])
+        return ret
+
+    def reroute_later(self, msgs: list, address: str = None):
+        """
+        hands messages to the reroute thread; never blocks
+        """
+        self.reroute_queue.put((msgs, address))
+
+    def reroute_failed(self):
+        """
+        reroutes the messages handed over by reroute_later (to be executed in seperate thread)
+        """
         while True:
-            msg = self.msg_out.get()
+            msgs, address = self.reroute_queue.get()
+            try:
+                self.reroute(msgs, address)
+            except Exception:
+                logging.exception("Agency: Rerouting of "+str(len(msgs))+" messages failed")
+
+    def reroute(self, msgs: list, address: str = None):
+        """
+        sends messages again whose delivery to a remote agency has failed (after all retries or
+        because the receiver is not located at the remote agency); the cached address of each
+        receiver is invalidated and requested again from the AMS
+
+        Messages to a receiver that has already been rerouted within the last reroute_interval
+        seconds are dropped.
+        """
+        now = time.monotonic()
+        receivers = set()
+        invalidated = set()
+        for msg in msgs:
             recv = msg.receiver
-            msg.agencys = self.info.name
-            log = datamodels.LogMessage(masid=masid, agentid=msg.sender, topic="msg",
-                                        msg="ACL send", data=str(msg))
+            local_agent = self.routes.local_agent(recv)
             self.lock.acquire()
-            local_agent = self.local_agents.get(recv, None)
-            recv_agency = self.remote_agents.get(recv, None)
+            drop = False
+            if local_agent is None and recv not in receivers:
+                expiry = self.rerouted.get(recv, None)
+                if expiry is not None and expiry > now:
+                    drop = True
+                else:
+                    self.rerouted[recv] = now + self.reroute_interval
+                    self.routes.remove_remote([recv])
+                    receivers.add(recv)
+            if drop:
+                self.delivery_stats["dropped"] += 1
+            else:
+                self.delivery_stats["rerouted"] += 1
             self.lock.release()
+            if drop:
+                logging.error("Agency: Dropped undeliverable message to agent "+str(recv))
+                continue
             if local_agent is not None:
-                # agent is local -> add message to its queue
+                # agent has been moved to this agency
+                self.msgs_received.labels(recv).inc()
                 local_agent.msg_in.put(msg)
-                self.log_out.put(log)
                 continue
-            elif recv_agency is None:
-                # agent is non-local, but address of agent is unknown -> request agent address
-                addr = ams.get_agent_address("ams:9000", masid, recv)
-                if addr.agency == "":
-                    logging.error("Agency: Invalid agent address for agent "+str(recv))
-                    continue
-                self.lock.acquire()
-                # check if agency of remote agent is known
-                agency = self.remote_agencies.get(addr.agency, None)
-                self.lock.release()
-                if agency is None:
-                    # remote agency is not known -> create a queue for messages to this agency and
-                    # start a sender in a new thread
-                    agency = queue.Queue(1000)
-                    self.lock.acquire()
-                    self.remote_agencies[addr.agency] = agency
-                    self.lock.release()
-                    y = threading.Thread(target=remote_agency_sender, args=(addr.agency, agency,),
-                                         daemon=True)
-                    y.start()
-                self.lock.acquire()
-                self.remote_agents[recv] = agency
-                self.lock.release()
-                recv_agency = agency
-            # add message to queue of remote agent
+            if recv not in invalidated:
+                invalidated.add(recv)
+                self.addresses.invalidate(recv)
+                if address is not None:
+                    logging.info("Agency: Rerouting messages to agent "+str(recv)+" (not " +
+                                 "delivered to "+address+")")
+            self.send_remote_msg(msg)
+        self.lock.acquire()
+        for recv in list(self.rerouted):
+            if self.rerouted[recv] <= now:
+                del self.rerouted[recv]
+        self.lock.release()
+
+    def report_undeliverable(self, msgs: list):
+        """
+        returns messages to agents which are not executed by this agency to the sending agencies
+        """
+        agencies = {}
+        for msg in msgs:
+            agencies.setdefault(msg.agencys, []).append(msg)
+        self.lock.acquire()
+        self.delivery_stats["undeliverable"] += len(msgs)
+        self.lock.release()
+        for address in agencies:
+            if address == "" or address == self.info.name:
+                logging.error("Agency: Dropped "+str(len(agencies[address])) +
+                              " messages to unknown agents")
+                continue
+            self.remote_agency(address)
+            self.lock.acquire()
+            pool = self.remote_pools[address]
+            self.lock.release()
+            self.undeliv_executor.submit(post_undeliverable, address, pool, agencies[address])
+
+    def address_resolved(self, agentid: int, address: str, msgs: list):
+        """
+        called by the address book once the address of a remote agent has been resolved; forwards
+        the messages that have been buffered during resolving; the route to the agent is only
+        stored by address_published so that subsequent messages cannot overtake buffered ones
+        """
+        recv_agency = self.remote_agency(address)
+        for msg in msgs:
+            tracing.stamp(msg, "dispatch")
             recv_agency.put(msg)
-            self.log_out.put(log)
+
+    def address_published(self, agentid: int, address: str):
+        """
+        called by the address book after all buffered messages to a remote agent have been
+        forwarded; subsequent messages are routed to the agency directly
+        """
+        self.routes.set_remote(agentid, self.remote_agency(address))
+
+    def addresses_changed(self, agentids: list):
+        """
+        called by the address book if the addresses of remote agents have changed; subsequent
+        messages to these agents are routed according to the new address
+        """
+        self.routes.remove_remote(agentids)
 
     def terminate(self, sig, frame):
-        for i in self.local_agents:
-            self.local_agents[i].proc.terminate()
+        local_agents = self.routes.local
+        for i in local_agents:
+            local_agents[i].proc.terminate()
             logging.info("Agency: Stopped agent " + str(i))
+        for i in local_agents:
+            if local_agents[i].worker is None:
+                self.release_channels(local_agents[i].msg_in, local_agents[i].msg_out)
+        for i in self.workers:
+            self.release_channels(i.msg_in, i.msg_out)
+        httpd = getattr(self, "httpd", None)
+        if httpd is not None:
+            httpd.server_close()
+        if self.direct_dir != "":
+            shutil.rmtree(self.direct_dir, ignore_errors=True)
         sys.exit(0)
 
 
-def remote_agency_sender(address: str, out: queue.Queue):
+def remote_agency_sender(address: str, out: queue.Queue, pool: transport.ConnectionPool,
+                         batch_size: int, batch_wait: int, retries: int = 1, backoff: float = 0,
+                         max_backoff: float = 0,
+                         on_failed: Callable[[List[message.Message], str], None] = None,
+                         latency=None):
     """
     sender to remote agency; executed in seperate thread
+
+    After the first message has been taken from the queue all further messages already in the queue
+    are added to the batch. If the queue runs empty the sender waits up to batch_wait µs for more
+    messages. The batch is sent in one request as soon as it contains batch_size messages or the
+    waiting time is over.
+
+    A batch is sent up to retries times if the request fails or the remote agency responds with a
+    server error. Before each attempt after a failure the sender waits for an exponentially growing,
+    randomized delay of at most max_backoff seconds. The number of consecutive failures is kept
+    across batches, i.e. while the remote agency is not reachable each batch is attempted at the
+    maximum delay. Batches that could not be delivered are passed to on_failed, which must not
+    block on this queue. The duration of each successful request is observed by latency (metrics
+    histogram).
     """
+    failures = 0
     while True:
-        msg = out.get()
-        msg.agencyr = address
-        msg_dict = json.loads(msg.json())
-        msg_dicts = []
-        msg_dicts.append(msg_dict)
-        js = json.dumps(msg_dicts)
-        resp = requests.post("http://"+address+":10000/api/agency/msgs", data=js)
-        if resp.status_code != 201:
-            pass
+        msgs = [out.get()]
+        deadline = time.monotonic() + batch_wait/1000000
+        while len(msgs) < batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    msg = out.get(timeout=timeout)
+                else:
+                    msg = out.get(block=False)
+            except queue.Empty:
+                break
+            msgs.append(msg)
+        js = []
+        for msg in msgs:
+            if type(msg) is message.Multicast:
+                msg.msg.agencyr = address
+            else:
+                msg.agencyr = address
+                tracing.stamp(msg, "remote_queue")
+            js.append(msg.to_json())
+        js = "[" + ",".join(js) + "]"
+        delivered = False
+        for _ in range(retries):
+            if failures > 0:
+                delay = min(max_backoff, backoff*2**min(failures-1, 30))
+                time.sleep(random.uniform(delay/2, delay))
+            start = time.monotonic()
+            try:
+                status, _ = pool.request("POST", "/api/agency/msgs", js,
+                                         {"Content-Type": "application/json"})
+            except (http.client.HTTPException, OSError) as e:
+                logging.error("Agency: Sending messages to "+address+" failed: "+str(e))
+                failures += 1
+                continue
+            if status == 201:
+                if latency is not None:
+                    latency.observe(time.monotonic() - start)
+                failures = 0
+                delivered = True
+                break
+            logging.error("Agency: Sending messages to "+address+" failed with code "+str(status))
+            failures += 1
+            if status < 500:
+                # client errors are not retried
+                break
+        if not delivered and on_failed is not None:
+            on_failed(message.expand(msgs), address)
+
+
+def post_undeliverable(address: str, pool: transport.ConnectionPool, msgs: list):
+    """
+    returns messages to the agency which has sent them since the receivers are unknown
+    """
+    js = "[" + ",".join([msg.to_json() for msg in msgs]) + "]"
+    try:
+        status, _ = pool.request("POST", "/api/agency/msgundeliv", js,
+                                 {"Content-Type": "application/json"})
+    except (http.client.HTTPException, OSError) as e:
+        logging.error("Agency: Returning undeliverable messages to "+address+" failed: "+str(e))
+        return
+    if status != 201:
+        logging.error("Agency: Returning undeliverable messages to "+address+" failed with code " +
+                      str(status))
 
 
 def agent_starter(agent_class: agent.Agent, info: datamodels.AgentInfo,
                   mas_name: str, mas_custom: str,
                   msg_in: multiprocessing.Queue, msg_out: multiprocessing.Queue,
-                  log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue):
+                  log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue,
+                  log_config: datamodels.LoggerConfig = None, direct_dir: str = "",
+                  df_cache: str = ""):
     """
     starting agent; this function is to be called in a separate process
     """
-    ag = agent_class(info, mas_name, mas_custom, msg_in, msg_out, log_out, ts_out)
-    ag.task()
+    # handle signals with default handler
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    run_agent(agent_class, info, mas_name, mas_custom, msg_in, msg_out, log_out, ts_out,
+              log_config, direct_dir, df_cache)
+
+
+def run_agent(agent_class: agent.Agent, info: datamodels.AgentInfo,
+              mas_name: str, mas_custom: str,
+              msg_in: queue.Queue, msg_out: multiprocessing.Queue,
+              log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue,
+              log_config: datamodels.LoggerConfig = None, direct_dir: str = "",
+              df_cache: str = ""):
+    """
+    creates the agent and executes its task; messages to local agents are delivered directly if
+    direct_dir is set and DF requests are sent to the DF cache of the agency if df_cache is set
+    """
+    try:
+        ag = agent_class(info, mas_name, mas_custom, msg_in, msg_out, log_out, ts_out)
+        if log_config is not None:
+            ag.logger.set_config(log_config)
+        if direct_dir != "":
+            ag.acl.set_direct_delivery(direct_dir)
+        if df_cache != "":
+            ag.df.set_cache(df_cache)
+        ag.task()
+    except Exception:
+        logging.exception("Agency: Agent "+str(info.id)+" terminated with error")
+
+
+def worker_starter(agent_class: agent.Agent, mas_name: str, mas_custom: str,
+                   msg_in: multiprocessing.Queue, msg_out: multiprocessing.Queue,
+                   log_out: multiprocessing.Queue, ts_out: multiprocessing.Queue,
+                   log_config: datamodels.LoggerConfig = None, direct_dir: str = "",
+                   df_cache: str = ""):
+    """
+    executes several agents in one process; this function is to be called in a separate process
+
+    Each agent is executed in a seperate thread. Incoming messages of all agents are received via
+    one queue and forwarded to the agent by receiver. The queue also carries the command
+    ("start", agentinfo). Agents cannot be stopped individually; they are terminated together with
+    the worker process.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    agents = {}
+    while True:
+        item = msg_in.get()
+        if isinstance(item, tuple):
+            cmd, arg = item
+            if cmd == "start":
+                q = queue.Queue()
+                agents[arg.id] = q
+                x = threading.Thread(target=run_agent, args=(agent_class, arg, mas_name,
+                                     mas_custom, q, msg_out, log_out, ts_out, log_config,
+                                     direct_dir, df_cache,),
+                                     daemon=True)
+                x.start()
+            continue
+        if type(item) is message.Multicast:
+            msgs = item.split()
+        else:
+            msgs = [item]
+        for msg in msgs:
+            q = agents.get(msg.receiver, None)
+            if q is None:
+                logging.error("Agency: Received message for unknown agent "+str(msg.receiver))
+                continue
+            q.put(msg)
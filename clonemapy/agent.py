@@ -47,12 +47,20 @@ implementation
 
 import os
 from datetime import datetime
+from concurrent import futures
 import paho.mqtt.client as mqtt
 import multiprocessing
 import queue
+import random
 import threading
+import clonemapy.config as config
 import clonemapy.datamodels as datamodels
 import clonemapy.df as df
+import clonemapy.direct as direct
+import clonemapy.graphindex as graphindex
+import clonemapy.logger as logger
+import clonemapy.message as message
+import clonemapy.tracing as tracing
 from typing import Callable, Dict
 import time
 import logging
@@ -224,20 +232,71 @@ class Logger():
             ID of MAS agent is located in
     log_out : multiprocessing.Queue
               queue for log messages of agent
+    log_config : datamodels.LoggerConfig
+                 activation of log topics; logs of inactive topics are discarded before they are
+                 created (all topics are active if None)
+    ts_out : multiprocessing.Queue
+             queue for timeseries data of agent; samples are sent in chunks of up to
+             CLONEMAP_TS_CHUNK_SIZE (default 100) samples per series at least every
+             CLONEMAP_TS_FLUSH_INTERVAL ms (default 1000); samples are discarded if
+             CLONEMAP_LOGGING is not "ON"
     """
-    def __init__(self, masid: int, agentid: int, log_out, ts_out):
+    def __init__(self, masid: int, agentid: int, log_out, ts_out,
+                 log_config: datamodels.LoggerConfig = None):
         super().__init__()
         self._id = agentid
         self._masid = masid
         self._log_out = log_out
         self._ts_out = ts_out
+        self._ts_on = config.get_switch("CLONEMAP_LOGGING", False)
+        self._ts_chunk_size = config.get_int("CLONEMAP_TS_CHUNK_SIZE", 100)
+        self._ts_flush_interval = config.get_float("CLONEMAP_TS_FLUSH_INTERVAL", 1000)/1000
+        self._ts_chunks = {}
+        self._ts_lock = threading.Lock()
+        self._ts_flusher = None
+        self.set_config(log_config)
+
+    def set_config(self, log_config: datamodels.LoggerConfig):
+        """
+        sets the activation of log topics
+        """
+        topics = {"msg", "error", "debug", "app", "status"}
+        if log_config is not None:
+            topics = {"error"}
+            if log_config.msg:
+                topics.add("msg")
+            if log_config.app:
+                topics.add("app")
+            if log_config.status:
+                topics.add("status")
+            if log_config.debug:
+                topics.add("debug")
+        self._topics = topics
+        self.msg_on = "msg" in topics
+
+    def send_trace(self, trace: list):
+        """
+        reports the trace of a received message to the agency
+        """
+        self._ts_out.put(tracing.TraceReport(trace))
+
+    def send_report(self, report: direct.DeliveryReport):
+        """
+        reports the messages delivered directly to local agents to the agency
+        """
+        self._ts_out.put(report)
+
+    def enabled(self, topic: str) -> bool:
+        """
+        returns True if logs of the topic are active
+        """
+        return topic in self._topics
 
     def new_log(self, topic: str, msg: str, data: str):
         """
         stores one log messages
         """
-        if (topic != "msg" and topic != "error" and topic != "debug" and topic != "app" and
-                topic != "status"):
+        if topic not in self._topics:
             return
         log = datamodels.LogMessage(masid=self._masid, agentid=self._id, topic=topic, msg=msg,
                                     data=data)
@@ -247,9 +306,38 @@ class Logger():
         """
         stores one timeseries sample
         """
-        ts = datamodels.TimeSeriesData(masid=self._masid, agentid=self._id, name=ts_name,
-                                       value=value)
-        self._ts_out.put(ts)
+        if not self._ts_on:
+            return
+        timestamp = time.time()
+        full = None
+        self._ts_lock.acquire()
+        chunk = self._ts_chunks.get(ts_name, None)
+        if chunk is None:
+            chunk = logger.TimeSeriesChunk(self._masid, self._id, ts_name)
+            self._ts_chunks[ts_name] = chunk
+            if self._ts_flusher is None:
+                self._ts_flusher = threading.Thread(target=self._flush_timeseries_data,
+                                                    daemon=True)
+                self._ts_flusher.start()
+        chunk.append(timestamp, float(value))
+        if len(chunk) >= self._ts_chunk_size:
+            full = self._ts_chunks.pop(ts_name)
+        self._ts_lock.release()
+        if full is not None:
+            self._ts_out.put(full)
+
+    def _flush_timeseries_data(self):
+        """
+        periodically sends the samples of all series which have not been sent yet
+        """
+        while True:
+            time.sleep(self._ts_flush_interval)
+            self._ts_lock.acquire()
+            chunks = self._ts_chunks
+            self._ts_chunks = {}
+            self._ts_lock.release()
+            for chunk in chunks.values():
+                self._ts_out.put(chunk)
 
 
 class ACL():
@@ -266,6 +354,11 @@ class ACL():
               queue of outgoing messages of agent
     _msg_in_protocol : dict
         dict mapping protocols to incoming queues which are checked by behaviors
+    _trace_sample : float
+                    share of sent messages that are traced (CLONEMAP_TRACE_SAMPLE, default 0)
+    _direct : direct.Endpoint
+              socket for the direct delivery of messages to agents of the same agency (None if
+              disabled)
     """
     def __init__(self, agent_id: int, msg_in: multiprocessing.Queue, msg_out: multiprocessing.Queue,
                  custom_callback: Callable[[str], None], log: Logger):
@@ -278,9 +371,19 @@ class ACL():
         self._custom_callback = custom_callback
         self._logger = log
         self._lock = threading.Lock()
+        self._trace_sample = config.get_float("CLONEMAP_TRACE_SAMPLE", 0)
+        self._direct = None
         x = threading.Thread(target=self._handle_messages, daemon=True)
         x.start()
 
+    def set_direct_delivery(self, directory: str):
+        """
+        enables the direct delivery of messages among the agents whose sockets are located in
+        directory (see module direct)
+        """
+        self._direct = direct.Endpoint(directory, self._id, self._handle_message,
+                                       self._logger.send_report)
+
     def recv_message_wait(self) -> datamodels.ACLMessage:
         """
         reads one message from incoming message queue; blocks if empty
@@ -302,18 +405,61 @@ class ACL():
                 break
         return msgs
 
-    def send_message(self, msg: datamodels.ACLMessage):
+    def send_message(self, msg: datamodels.ACLMessage, receivers=None):
         """
-        sends message to receiver
+        sends message to receiver or, if an iterable of receivers is given, to each of the
+        receivers; a message to several receivers is passed to the agency only once and is not
+        traced; messages to local agents are delivered directly if enabled
         """
         msg.sender = self._id
-        self._msg_out.put(msg)
+        out = message.Message.from_acl(msg)
+        if receivers is not None:
+            receivers = list(receivers)
+            if len(receivers) == 0:
+                return
+            remaining = receivers
+            if self._direct is not None:
+                remaining = [i for i in receivers if not self._send_direct(out, i)]
+            if len(remaining) > 0:
+                self._msg_out.put(message.Multicast(out, remaining))
+            if self._logger.msg_on:
+                # the receiver field of out is the receiver of the original message
+                logged = out.copy()
+                logged.receiver = receivers
+                self._logger.new_log("msg", "ACL send", str(logged))
+            return
+        if self._trace_sample > 0 and random.random() < self._trace_sample:
+            tracing.start(out)
+        if self._direct is None or not self._direct.send(out):
+            self._msg_out.put(out)
+        if self._logger.msg_on:
+            self._logger.new_log("msg", "ACL send", str(out))
+
+    def _send_direct(self, msg: message.Message, receiver: int) -> bool:
+        """
+        sends a copy of a multicast message directly to one of its receivers
+        """
+        single = msg.copy()
+        single.receiver = receiver
+        return self._direct.send(single)
 
     def _handle_messages(self):
         while True:
             msg = self._msg_in.get()
-            self._route_message(msg)
-            self._logger.new_log("msg", "ACL receive", str(msg))
+            self._handle_message(msg)
+
+    def _handle_message(self, msg: message.Message):
+        """
+        routes a message received via the agency or directly from a local agent
+        """
+        tracing.stamp(msg, "msg_in")
+        acl = msg.to_acl()
+        self._route_message(acl)
+        if msg.trace is not None:
+            tracing.stamp(msg, "route")
+            self._logger.send_trace(msg.trace)
+        if self._logger.msg_on:
+            self._logger.new_log("msg", "ACL receive", str(acl))
 
     def _route_message(self, msg: datamodels.ACLMessage):
         """
@@ -363,6 +509,8 @@ class MQTT():
                   mqtt client
     mqtt_on: bool
              switch for mqtt
+
+    The broker is reached at CLONEMAP_MQTT_HOST (default "mqtt:1883").
     """
     def __init__(self, log: Logger):
         super().__init__()
@@ -392,7 +540,8 @@ class MQTT():
         if not self._on:
             return
         self._client.publish(topic, payload, qos, retain)
-        self._logger.new_log("msg", "MQTT publish", "Topic: "+topic+";Content: "+payload)
+        if self._logger.msg_on:
+            self._logger.new_log("msg", "MQTT publish", "Topic: "+topic+";Content: "+payload)
 
     def recv_msg(self) -> mqtt.MQTTMessage:
         """
@@ -428,8 +577,9 @@ class MQTT():
         """
         add received mqtt message to message queue
         """
-        self._logger.new_log("msg", "MQTT receive",
-                             "Topic: "+msg.topic+";Content: "+str(msg.payload))
+        if self._logger.msg_on:
+            self._logger.new_log("msg", "MQTT receive",
+                                 "Topic: "+msg.topic+";Content: "+str(msg.payload))
         self._route_message(msg)
 
     def _connect(self):
@@ -439,7 +589,11 @@ class MQTT():
         self._client = mqtt.Client()
         self._client.on_connect = self._on_connect
         self._client.on_message = self._on_message
-        self._client.connect("mqtt", 1883, 60)
+        host = config.get_str("CLONEMAP_MQTT_HOST", "mqtt:1883").split(":")
+        port = 1883
+        if len(host) > 1:
+            port = int(host[1])
+        self._client.connect(host[0], port, 60)
         self._client.loop_start()
 
     def _disconnect(self):
@@ -505,9 +659,23 @@ class DF():
     masid : integer
             ID of MAS agent is located in
     registered_svcs : dictionary of datamodels.Service
-                      all services that have been registered with DF by agent
+                      all services that have been registered with DF by agent by service ID
+    registered_descs : set of string
+                       descriptions of the registered services and of those being registered; only
+                       one service per description can be registered
     df_on: bool
            switch for df
+    workers : integer
+              maximum number of services registered in parallel by register_services
+              (CLONEMAP_DF_WORKERS, default 8)
+    cache : string
+            url of the DF cache of the agency to which all requests are sent (None if requests are
+            sent to the DF directly)
+    graph_ttl : float
+                time in seconds the graph of the MAS is kept (CLONEMAP_DF_GRAPH_TTL, default 0); if
+                larger than 0, searches for local services are answered with an index of the graph
+                and the matching services of the whole MAS (see module graphindex) instead of by
+                the DF
     """
     def __init__(self, masid, agentid, nodeid):
         super().__init__()
@@ -515,30 +683,91 @@ class DF():
         self._nodeid = nodeid
         self._masid = masid
         self._registered_svcs = {}
+        self._registered_descs = set()
+        self._lock = threading.Lock()
+        self._workers = max(config.get_int("CLONEMAP_DF_WORKERS", 8), 1)
+        self._executor = None
+        self._cache = None
+        self._graph_ttl = config.get_float("CLONEMAP_DF_GRAPH_TTL", 0)
+        self._graph = None
+        self._graph_expiry = 0
         df_on = os.environ['CLONEMAP_DF']
         if df_on == "ON":
             self._df_on = True
         else:
             self._df_on = False
 
+    def set_cache(self, url: str):
+        """
+        sends all requests to the DF cache of the agency with the given url (see module dfcache)
+        """
+        self._cache = url
+
     def register_service(self, svc: datamodels.Service) -> int:
         """
         registers one service with the DF if service has not been registered before; returns svc ID
         """
-        if not self._df_on:
-            return -1
-        if svc.desc == "":
-            return -1
-        temp = self._registered_svcs.get(svc.desc, None)
-        if temp is not None:
+        if not self._reserve(svc.desc):
             return -1
+        return self._post(svc)
+
+    def register_services(self, svcs: list) -> list:
+        """
+        registers several services with the DF in parallel; returns one future for each service
+        which resolves to the svc ID like register_service
+        """
+        ret = []
+        for svc in svcs:
+            if not self._reserve(svc.desc):
+                fut = futures.Future()
+                fut.set_result(-1)
+                ret.append(fut)
+                continue
+            self._lock.acquire()
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(max_workers=self._workers)
+            executor = self._executor
+            self._lock.release()
+            ret.append(executor.submit(self._post, svc))
+        return ret
+
+    def _reserve(self, desc: str) -> bool:
+        """
+        reserves the description for a new service; returns False if the DF is not active or the
+        description is empty or already in use
+        """
+        if not self._df_on:
+            return False
+        if desc == "":
+            return False
+        self._lock.acquire()
+        reserved = desc not in self._registered_descs
+        if reserved:
+            self._registered_descs.add(desc)
+        self._lock.release()
+        return reserved
+
+    def _post(self, svc: datamodels.Service) -> int:
+        """
+        posts a service whose description has been reserved; the reservation is released if the
+        request fails
+        """
+        desc = svc.desc
         svc.createdat = datetime.now()
         svc.changedat = datetime.now()
         svc.masid = self._masid
         svc.agentid = self._id
         svc.nodeid = self._nodeid
-        svc = df.post_svc(self._masid, svc)
-        self._registered_svcs[svc.desc] = svc
+        try:
+            svc = df.post_svc(self._masid, svc, self._cache)
+        except Exception:
+            self._lock.acquire()
+            self._registered_descs.discard(desc)
+            self._lock.release()
+            raise
+        self._lock.acquire()
+        self._registered_svcs[svc.id] = svc
+        self._lock.release()
         return svc.id
 
     def search_for_service(self, desc: str) -> list:
@@ -548,7 +777,7 @@ class DF():
         svcs = []
         if not self._df_on:
             return svcs
-        temp = df.get_svc(self._masid, desc)
+        temp = df.get_svc(self._masid, desc, self._cache)
         for i in temp:
             if i.agentid != self._id:
                 svcs.append(i)
@@ -561,27 +790,60 @@ class DF():
         svcs = []
         if not self._df_on:
             return svcs
-        temp = df.get_local_svc(self._masid, desc, self._nodeid, dist)
+        index = self._graph_index()
+        if index is None:
+            temp = df.get_local_svc(self._masid, desc, self._nodeid, dist, self._cache)
+        else:
+            temp = []
+            dists = index.distances(self._nodeid)
+            for i in df.get_svc(self._masid, desc, self._cache):
+                d = dists.get(i.nodeid, None)
+                if d is not None and d <= dist:
+                    i.dist = d
+                    temp.append(i)
         for i in temp:
             if i.agentid != self._id:
                 svcs.append(i)
         return svcs
 
+    def _graph_index(self) -> graphindex.GraphIndex:
+        """
+        returns the index of the graph of the MAS, which is requested again after graph_ttl; None if
+        disabled or the MAS has no graph
+        """
+        if self._graph_ttl <= 0:
+            return None
+        now = time.monotonic()
+        self._lock.acquire()
+        index = self._graph
+        expiry = self._graph_expiry
+        self._lock.release()
+        if expiry > now:
+            return index
+        graph = df.get_graph(self._masid, self._cache)
+        index = None
+        if graph is not None:
+            index = graphindex.GraphIndex(graph)
+        self._lock.acquire()
+        self._graph = index
+        self._graph_expiry = now + self._graph_ttl
+        self._lock.release()
+        return index
+
     def deregister_service(self, svcid: int):
         """
         deregisters the service with svcid
         """
         if not self._df_on:
             return
-        desc = ""
-        for temp in self._registered_svcs:
-            if self._registered_svcs[temp].id == svcid:
-                desc = temp
-                break
-        if desc == "":
+        self._lock.acquire()
+        svc = self._registered_svcs.pop(svcid, None)
+        if svc is not None:
+            self._registered_descs.discard(svc.desc)
+        self._lock.release()
+        if svc is None:
             return
-        del self._registered_svcs[desc]
-        df.delete_svc(self._masid, svcid)
+        df.delete_svc(self._masid, svcid, self._cache)
 
 
 class ACLBehavior(Behavior):
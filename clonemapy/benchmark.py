@@ -41,25 +41,56 @@
 # THE SOFTWARE.
 
 """
-This module implements the agent class for the pingpong benchmark
+This module implements the pingpong benchmark measuring the round trip time (RTT) of ACL messages.
+
+Agents are configured in pairs via their custom configuration. The starting agent of each pair
+sends a message to its peer, which sends it back; the RTT of each round trip is measured. The
+benchmark covers three cases:
+
+- intra: both agents of each pair are executed by the same agency
+- inter: the agents of each pair are executed by two different agencies
+- varying payload sizes and numbers of agent pairs for both cases
+
+The benchmark starts a stand-in AMS (see module standin) and the agencies as local processes and
+reports the percentiles of the RTT. Environment variables of the agency (e.g. CLONEMAP_IPC) are
+passed to the agencies.
+
+Usage: python -m clonemapy.benchmark [--cases intra,inter] [--pairs 1,4] [--payloads 16,1024,16384]
+                                     [--iterations 1000] [--warmup 100] [--json results.json]
+
+Within a clonemap MAS the agent is executed with python -m clonemapy.benchmark --agency.
 """
 
+import argparse
 import json
+import math
+import multiprocessing
+import os
+import tempfile
 import time
-import paho.mqtt.client as mqtt
 import clonemapy.agent as agent
 import clonemapy.agency as agency
 import clonemapy.datamodels as datamodels
+import clonemapy.standin as standin
 
 
 class CustomData():
+    """
+    custom configuration of pingpong agents
+    """
     def __init__(self):
         self.benchid = 0
         self.peerid = 0
         self.start = False
+        self.iterations = 1000
+        self.warmup = 100
+        self.payload = 16
+        self.output = ""
 
     def to_json_dict(self):
-        js_dict = {'BenchmarkID': self.benchid, 'PeerID': self.peerid, 'Start': self.start}
+        js_dict = {'BenchmarkID': self.benchid, 'PeerID': self.peerid, 'Start': self.start,
+                   'Iterations': self.iterations, 'Warmup': self.warmup, 'Payload': self.payload,
+                   'Output': self.output}
         return js_dict
 
     def to_json(self):
@@ -71,6 +102,10 @@ class CustomData():
         self.benchid = js_dict.get("BenchmarkID", 0)
         self.peerid = js_dict.get("PeerID", 0)
         self.start = js_dict.get("Start", False)
+        self.iterations = js_dict.get("Iterations", 1000)
+        self.warmup = js_dict.get("Warmup", 100)
+        self.payload = js_dict.get("Payload", 16)
+        self.output = js_dict.get("Output", "")
 
     def from_json(self, js):
         js_dict = json.loads(js)
@@ -78,83 +113,204 @@ class CustomData():
 
 
 class Agent(agent.Agent):
-    def __init__(self, info, msg_in, msg_out, log_out):
-        super().__init__(info, msg_in, msg_out, log_out)
-        # self.test()
-
+    """
+    pingpong agent; the starting agent measures the RTT, all other agents echo received messages
+    """
     def task(self):
-        self.logger.new_log("status", "Starting Test Behavior", "")
-        b_acl = self.acl.new_behavior(1, {}, self.handle_acl)
-        b_acl.start()
-        b_mqtt = self.mqtt.new_behavior("testtopic", self.handle_mqtt)
-        b_mqtt.start()
-        msg = datamodels.ACLMessage()
-        if self.id == 0:
-            msg.receiver = 1
-        else:
-            msg.receiver = 0
-        msg.content = "test"
-        msg.protocol = 1
-        time.sleep(10)
-        self.acl.send_message(msg)
-        self.mqtt.subscribe("testtopic")
-        self.mqtt.publish("testtopic", "testpayload"+str(self.id))
-        self.loop_forever()
-
-    def handle_acl(self, msg: datamodels.ACLMessage):
-        print(msg.content)
-        self.logger.new_log("status", msg.content, "")
-
-    def handle_mqtt(self, msg: mqtt.MQTTMessage):
-        print(msg.payload)
-
-    def pingpong(self):
         cust = CustomData()
-        cust.from_json(self.custom)
-        self.logger.new_log("status", "Starting PingPong Behavior; Peer: "+str(cust.peerid) +
-                            ", Start: " + str(cust.start), "")
-        time.sleep(40)
+        if self.custom is not None and self.custom != "":
+            cust.from_json(self.custom)
         if cust.start:
-            rtts = []
-            msg = datamodels.ACLMessage()
+            self.pingpong(cust)
+        self.echo()
+
+    def echo(self):
+        """
+        sends each received message back to its sender
+        """
+        while True:
+            msg = self.acl.recv_message_wait()
+            msg.receiver = msg.sender
+            self.acl.send_message(msg)
+
+    def handshake(self, peerid: int):
+        """
+        sends messages to the peer until it replies; messages may be lost while the agency of the
+        peer is starting
+        """
+        msg = datamodels.ACLMessage(receiver=peerid, content="handshake")
+        while True:
+            self.acl.send_message(msg)
+            deadline = time.monotonic() + 1
+            while time.monotonic() < deadline:
+                if len(self.acl.recv_messages()) > 0:
+                    # wait for replies to repeated handshakes
+                    time.sleep(1)
+                    self.acl.recv_messages()
+                    return
+                time.sleep(0.01)
+
+    def pingpong(self, cust: CustomData):
+        """
+        measures the RTT of messages to the peer and writes the RTTs in µs to the output file
+        """
+        self.logger.new_log("status", "Starting PingPong Behavior; Peer: "+str(cust.peerid), "")
+        self.handshake(cust.peerid)
+        msg = datamodels.ACLMessage(receiver=cust.peerid, content="x"*cust.payload)
+        for i in range(cust.warmup):
+            msg.receiver = cust.peerid
+            self.acl.send_message(msg)
+            msg = self.acl.recv_message_wait()
+        rtts = []
+        for i in range(cust.iterations):
             msg.receiver = cust.peerid
-            msg.content = "test msg"
-            for i in range(1000):
-                msg.receiver = cust.peerid
-                self.acl.send_message(msg)
-                msg = self.acl.recv_message_wait()
-            for i in range(1000):
-                msg.receiver = cust.peerid
-                tstart = time.perf_counter()
-                self.acl.send_message(msg)
-                msg = self.acl.recv_message_wait()
-                tstop = time.perf_counter()
-                rtt = int((tstop - tstart)*1000000)
-                rtts.append(rtt)
-            max = 0
-            min = 1000000
-            sum = 0
-            avg = 0
-            for i in range(1000):
-                if max < rtts[i]:
-                    max = rtts[i]
-                if min > rtts[i]:
-                    min = rtts[i]
-                sum += rtts[i]
-            avg = int(sum/1000)
-            js = json.dumps(rtts)
-            self.logger.new_log("status", "RTT in µs: min: "+str(min)+", max: "+str(max)+", avg: " +
-                                str(avg), js)
-            for i in range(1000):
-                msg.receiver = cust.peerid
-                self.acl.send_message(msg)
-                msg = self.acl.recv_message_wait()
-        else:
-            while True:
-                msg = self.acl.recv_message_wait()
-                msg.receiver = msg.sender
-                self.acl.send_message(msg)
+            tstart = time.perf_counter()
+            self.acl.send_message(msg)
+            msg = self.acl.recv_message_wait()
+            tstop = time.perf_counter()
+            rtts.append((tstop - tstart)*1000000)
+        res = summarize(rtts)
+        self.logger.new_log("status", "RTT in µs: p50: "+str(res["p50_us"])+", p99: " +
+                            str(res["p99_us"])+", max: "+str(res["max_us"]), json.dumps(rtts))
+        if cust.output != "":
+            # write to temporary file first so that the file is complete once it exists
+            with open(cust.output + ".tmp", "w") as f:
+                json.dump({"agent": self.id, "peer": cust.peerid, "rtt_us": rtts}, f)
+            os.rename(cust.output + ".tmp", cust.output)
+
+
+def percentile(vals: list, p: float) -> float:
+    """
+    returns the p-th percentile (nearest rank) of the sorted values
+    """
+    if len(vals) == 0:
+        return 0
+    rank = int(math.ceil(len(vals)*p/100))
+    return vals[min(max(rank, 1), len(vals)) - 1]
+
+
+def summarize(rtts: list) -> dict:
+    """
+    returns the percentiles of the RTTs in µs
+    """
+    vals = sorted(rtts)
+    res = {"samples": len(vals), "min_us": 0, "mean_us": 0, "max_us": 0}
+    if len(vals) > 0:
+        res["min_us"] = round(vals[0], 1)
+        res["mean_us"] = round(sum(vals)/len(vals), 1)
+        res["max_us"] = round(vals[-1], 1)
+    res["p50_us"] = round(percentile(vals, 50), 1)
+    res["p99_us"] = round(percentile(vals, 99), 1)
+    res["p99.9_us"] = round(percentile(vals, 99.9), 1)
+    return res
+
+
+def run_agency(env: dict):
+    """
+    executes an agency with pingpong agents; to be called in a separate process
+    """
+    os.environ.update(env)
+    for key, val in (("CLONEMAP_LOGGING", "OFF"), ("CLONEMAP_MQTT", "OFF"), ("CLONEMAP_DF", "OFF"),
+                     ("CLONEMAP_LOG_LEVEL", "error")):
+        os.environ.setdefault(key, val)
+    agency.Agency(Agent)
+
+
+def run(case: str, pairs: int, payload: int, iterations: int, warmup: int,
+        timeout: float) -> dict:
+    """
+    runs the benchmark for one case ("intra" or "inter") with the given number of agent pairs and
+    payload size; returns the percentiles of the RTTs of all pairs
+    """
+    ams = standin.StandInAMS()
+    ams.start()
+    outdir = tempfile.mkdtemp(prefix="clonemapy-benchmark-")
+    customs = []
+    outputs = []
+    for i in range(pairs):
+        start = CustomData()
+        start.peerid = pairs + i
+        start.start = True
+        start.iterations = iterations
+        start.warmup = warmup
+        start.payload = payload
+        start.output = os.path.join(outdir, str(i) + ".json")
+        outputs.append(start.output)
+        customs.append(start.to_json())
+    for i in range(pairs):
+        echo = CustomData()
+        echo.peerid = i
+        customs.append(echo.to_json())
+    if case == "intra":
+        groups = [customs]
+    else:
+        groups = [customs[:pairs], customs[pairs:]]
+    procs = []
+    first = 0
+    for agencyid, group in enumerate(groups):
+        port = standin.free_port()
+        name = "127.0.0.1:" + str(port)
+        ams.add_agency(agencyid, name, standin.agent_specs(len(group), group), first)
+        first += len(group)
+        env = {"CLONEMAP_AMS_HOST": ams.host, "CLONEMAP_AGENCY_HOSTNAME": ams.hostname(agencyid),
+               "CLONEMAP_AGENCY_NAME": name, "CLONEMAP_AGENCY_PORT": str(port)}
+        p = multiprocessing.Process(target=run_agency, args=(env,))
+        p.start()
+        procs.append(p)
+    rtts = []
+    deadline = time.monotonic() + timeout
+    try:
+        for output in outputs:
+            while not os.path.exists(output):
+                if time.monotonic() > deadline:
+                    raise TimeoutError("benchmark " + case + " did not finish within " +
+                                       str(timeout) + " s")
+                time.sleep(0.1)
+            with open(output) as f:
+                rtts.extend(json.load(f)["rtt_us"])
+            os.remove(output)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+        ams.stop()
+        os.rmdir(outdir)
+    res = {"case": case, "pairs": pairs, "payload": payload, "iterations": iterations}
+    res.update(summarize(rtts))
+    return res
+
+
+def int_list(arg: str) -> list:
+    return [int(i) for i in arg.split(",")]
 
 
 if __name__ == "__main__":
-    ag = agency.Agency(Agent)
+    parser = argparse.ArgumentParser(description="pingpong benchmark of ACL messages")
+    parser.add_argument("--cases", default="intra,inter", help="intra and/or inter agency")
+    parser.add_argument("--pairs", type=int_list, default=[1, 4], help="numbers of agent pairs")
+    parser.add_argument("--payloads", type=int_list, default=[16, 1024, 16384],
+                        help="content sizes in bytes")
+    parser.add_argument("--iterations", type=int, default=1000, help="measured round trips")
+    parser.add_argument("--warmup", type=int, default=100, help="round trips before measuring")
+    parser.add_argument("--timeout", type=float, default=300, help="timeout per run in seconds")
+    parser.add_argument("--json", default="", help="file to write results to")
+    parser.add_argument("--agency", action="store_true",
+                        help="execute agency with pingpong agents within a clonemap MAS")
+    args = parser.parse_args()
+    if args.agency:
+        agency.Agency(Agent)
+    else:
+        results = []
+        print("case   pairs  payload  p50[µs]  p99[µs] p99.9[µs]  max[µs]")
+        for case in args.cases.split(","):
+            for pairs in args.pairs:
+                for payload in args.payloads:
+                    res = run(case, pairs, payload, args.iterations, args.warmup, args.timeout)
+                    results.append(res)
+                    print("{:<6} {:>5} {:>8} {:>8.1f} {:>8.1f} {:>9.1f} {:>8.1f}".format(
+                          case, pairs, payload, res["p50_us"], res["p99_us"], res["p99.9_us"],
+                          res["max_us"]))
+        if args.json != "":
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
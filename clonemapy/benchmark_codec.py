@@ -0,0 +1,127 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements a microbenchmark comparing the pydantic model datamodels.ACLMessage with the
+internal message representation message.Message. It measures the time to serialize and deserialize
+one message with each codec and the memory allocated per message.
+
+Usage: python -m clonemapy.benchmark_codec [--msgs 20000] [--size 100]
+"""
+
+import argparse
+import json
+import pickle
+import time
+import tracemalloc
+import clonemapy.codec as codec
+import clonemapy.datamodels as datamodels
+import clonemapy.message as message
+
+
+def measure(func, arg, num: int) -> tuple:
+    """
+    calls func num times and returns the time per call in µs and the last result
+    """
+    tstart = time.perf_counter()
+    for i in range(num):
+        res = func(arg)
+    return (time.perf_counter()-tstart)*1000000/num, res
+
+
+def memory(create, num: int) -> float:
+    """
+    returns the memory allocated per object in bytes
+    """
+    tracemalloc.start()
+    objs = [create(i) for i in range(num)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return size/num
+
+
+def run(num: int, size: int) -> dict:
+    content = "x"*size
+    acl = datamodels.ACLMessage(sender=1, receiver=2, content=content, prot=1, perf=8)
+    msg = message.Message.from_acl(acl)
+    res = {}
+    t_enc, js = measure(lambda m: m.json(), acl, num)
+    t_dec, _ = measure(lambda s: datamodels.ACLMessage.parse_obj(json.loads(s)), js, num)
+    res["ACLMessage json"] = (t_enc, t_dec)
+    t_enc, pk = measure(lambda m: pickle.dumps(m, pickle.HIGHEST_PROTOCOL), acl, num)
+    t_dec, _ = measure(pickle.loads, pk, num)
+    res["ACLMessage pickle"] = (t_enc, t_dec)
+    t_enc, js = measure(lambda m: m.to_json(), msg, num)
+    t_dec, _ = measure(lambda s: message.Message.from_dict(json.loads(s)), js, num)
+    res["Message json"] = (t_enc, t_dec)
+    t_enc, pk = measure(lambda m: pickle.dumps(m, pickle.HIGHEST_PROTOCOL), msg, num)
+    t_dec, _ = measure(pickle.loads, pk, num)
+    res["Message pickle"] = (t_enc, t_dec)
+    t_enc, buf = measure(codec.encode, msg, num)
+    t_dec, _ = measure(codec.decode, buf, num)
+    res["Message binary"] = (t_enc, t_dec)
+    t_conv, _ = measure(message.Message.from_acl, acl, num)
+    t_back, _ = measure(lambda m: m.to_acl(), msg, num)
+    res["conversion"] = (t_conv, t_back)
+    mem_acl = memory(lambda i: datamodels.ACLMessage(sender=1, receiver=i, content=content), num)
+    mem_msg = memory(lambda i: message.Message(sender=1, receiver=i, content=content), num)
+    return {"codecs": res, "memory": {"ACLMessage": mem_acl, "Message": mem_msg}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of message representations")
+    parser.add_argument("--msgs", type=int, default=20000, help="number of messages")
+    parser.add_argument("--size", type=int, default=100, help="content size in bytes")
+    parser.add_argument("--json", default="", help="file to write results to")
+    args = parser.parse_args()
+    res = run(args.msgs, args.size)
+    print("codec              encode[µs] decode[µs]")
+    for name in res["codecs"]:
+        t_enc, t_dec = res["codecs"][name]
+        print("{:<18} {:>10.2f} {:>10.2f}".format(name, t_enc, t_dec))
+    print("(conversion: ACLMessage -> Message, Message -> ACLMessage)")
+    for name in res["memory"]:
+        print("memory per {:<10} {:>6.0f} bytes".format(name, res["memory"][name]))
+    if args.json != "":
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
@@ -0,0 +1,210 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements a throughput benchmark for the dispatching of outgoing messages within one
+agency with a varying number of dispatch shards (CLONEMAP_DISPATCH_SHARDS).
+
+Sending agents send a fixed number of messages round robin to receiving agents of the same agency,
+all starting at the same time. The throughput is the number of received messages divided by the
+time until the last message has been received. Optionally, one additional slow receiver, which
+processes each message with a delay, gets every tenth message of the first sender; with one shard
+its full queue stalls the dispatching of all messages.
+
+The benchmark starts a stand-in AMS (see module standin) and the agency as local process.
+
+Usage: python -m clonemapy.benchmark_dispatch [--shards 1,4] [--senders 8] [--receivers 8]
+                                              [--msgs 2000] [--slow-delay 0] [--json results.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import clonemapy.agent as agent
+import clonemapy.agency as agency
+import clonemapy.datamodels as datamodels
+import clonemapy.standin as standin
+
+
+class Agent(agent.Agent):
+    """
+    sends messages to the receivers configured in the custom configuration or counts the received
+    messages and writes the time of the first and last one to the output file
+    """
+    def task(self):
+        cust = json.loads(self.custom)
+        if cust["Role"] == "send":
+            self.send(cust)
+        else:
+            self.receive(cust)
+        while True:
+            time.sleep(1)
+
+    def send(self, cust: dict):
+        time.sleep(max(cust["Start"] - time.time(), 0))
+        receivers = cust["Receivers"]
+        slow = cust.get("Slow", None)
+        msg = datamodels.ACLMessage(receiver=receivers[0], content="x"*cust["Payload"])
+        for i in range(cust["Messages"]):
+            msg.receiver = receivers[i % len(receivers)]
+            self.acl.send_message(msg)
+            if slow is not None and i % 10 == 0:
+                msg.receiver = slow
+                self.acl.send_message(msg)
+
+    def receive(self, cust: dict):
+        delay = cust.get("Delay", 0)
+        self.acl.recv_message_wait()
+        first = time.time()
+        for i in range(cust["Expected"] - 1):
+            self.acl.recv_message_wait()
+            if delay > 0:
+                time.sleep(delay)
+        last = time.time()
+        if cust["Output"] != "":
+            with open(cust["Output"] + ".tmp", "w") as f:
+                json.dump({"first": first, "last": last, "msgs": cust["Expected"]}, f)
+            os.rename(cust["Output"] + ".tmp", cust["Output"])
+
+
+def run_agency(env: dict):
+    """
+    executes the agency; to be called in a separate process
+    """
+    os.environ.update(env)
+    for key, val in (("CLONEMAP_LOGGING", "OFF"), ("CLONEMAP_MQTT", "OFF"), ("CLONEMAP_DF", "OFF"),
+                     ("CLONEMAP_LOG_LEVEL", "error")):
+        os.environ.setdefault(key, val)
+    agency.Agency(Agent)
+
+
+def run(shards: int, senders: int, receivers: int, msgs: int, payload: int, slow_delay: float,
+        timeout: float) -> dict:
+    """
+    runs the benchmark with the given number of dispatch shards; returns the throughput in messages
+    per second of all receivers but the slow one
+    """
+    ams = standin.StandInAMS()
+    ams.start()
+    outdir = tempfile.mkdtemp(prefix="clonemapy-benchmark-")
+    # leave time for the startup of the agency
+    start = time.time() + 3 + 0.02*(senders + receivers)
+    recv_ids = list(range(senders, senders + receivers))
+    slow = None
+    if slow_delay > 0:
+        slow = senders + receivers
+    customs = []
+    for i in range(senders):
+        customs.append({"Role": "send", "Start": start, "Receivers": recv_ids, "Messages": msgs,
+                        "Payload": payload, "Slow": slow if i == 0 else None})
+    # messages are sent round robin, hence each receiver gets the same number of messages
+    expected = senders*msgs//receivers
+    outputs = []
+    for i in range(receivers):
+        output = os.path.join(outdir, str(i) + ".json")
+        outputs.append(output)
+        customs.append({"Role": "recv", "Expected": expected, "Output": output})
+    if slow is not None:
+        customs.append({"Role": "recv", "Expected": (msgs + 9)//10, "Delay": slow_delay,
+                        "Output": ""})
+    port = standin.free_port()
+    name = "127.0.0.1:" + str(port)
+    ams.add_agency(0, name, standin.agent_specs(len(customs), customs), 0)
+    env = {"CLONEMAP_AMS_HOST": ams.host, "CLONEMAP_AGENCY_HOSTNAME": ams.hostname(0),
+           "CLONEMAP_AGENCY_NAME": name, "CLONEMAP_AGENCY_PORT": str(port),
+           "CLONEMAP_DISPATCH_SHARDS": str(shards)}
+    p = multiprocessing.Process(target=run_agency, args=(env,))
+    p.start()
+    last = start
+    total = 0
+    deadline = time.monotonic() + timeout
+    try:
+        for output in outputs:
+            while not os.path.exists(output):
+                if time.monotonic() > deadline:
+                    raise TimeoutError("benchmark did not finish within " + str(timeout) + " s")
+                time.sleep(0.1)
+            with open(output) as f:
+                res = json.load(f)
+            last = max(last, res["last"])
+            total += res["msgs"]
+            os.remove(output)
+    finally:
+        p.terminate()
+        p.join()
+        ams.stop()
+        os.rmdir(outdir)
+    return {"shards": shards, "senders": senders, "receivers": receivers, "msgs": total,
+            "slow_delay": slow_delay, "duration_s": round(last - start, 3),
+            "throughput": round(total/(last - start), 1)}
+
+
+def int_list(arg: str) -> list:
+    return [int(i) for i in arg.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="throughput benchmark of the message dispatch")
+    parser.add_argument("--shards", type=int_list, default=[1, 4], help="numbers of shards")
+    parser.add_argument("--senders", type=int, default=8, help="number of sending agents")
+    parser.add_argument("--receivers", type=int, default=8, help="number of receiving agents")
+    parser.add_argument("--msgs", type=int, default=2000, help="messages per sender")
+    parser.add_argument("--payload", type=int, default=16, help="content size in bytes")
+    parser.add_argument("--slow-delay", type=float, default=0,
+                        help="processing time of the slow receiver in ms (0: no slow receiver)")
+    parser.add_argument("--timeout", type=float, default=300, help="timeout per run in seconds")
+    parser.add_argument("--json", default="", help="file to write results to")
+    args = parser.parse_args()
+    results = []
+    print("shards  senders  receivers     msgs  duration[s]    msgs/s")
+    for shards in args.shards:
+        res = run(shards, args.senders, args.receivers, args.msgs, args.payload,
+                  args.slow_delay/1000, args.timeout)
+        results.append(res)
+        print("{:>6} {:>8} {:>10} {:>8} {:>12.3f} {:>9.0f}".format(
+              shards, res["senders"], res["receivers"], res["msgs"], res["duration_s"],
+              res["throughput"]))
+    if args.json != "":
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
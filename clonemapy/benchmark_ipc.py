@@ -0,0 +1,150 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements a microbenchmark comparing the transport of messages between processes
+via multiprocessing queues and via shared memory ring buffers.
+
+Latency is measured as round trip time of a message echoed by a second process. Throughput is
+measured as the rate at which a second process can send messages to the benchmark process. Each
+transport is measured with each of the given start methods of the second process.
+
+Usage: python -m clonemapy.benchmark_ipc [--msgs 20000] [--size 100] [--start fork spawn]
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+import clonemapy.ipc as ipc
+import clonemapy.message as message
+
+
+def new_queue(transport: str):
+    if transport == "shm":
+        return ipc.ShmQueue(1 << 20)
+    return multiprocessing.Queue(1000)
+
+
+def echo(q_in, q_out, num: int):
+    for i in range(num):
+        q_out.put(q_in.get())
+
+
+def produce(q_out, num: int, size: int):
+    msg = message.Message(sender=1, receiver=0, content="x"*size)
+    for i in range(num):
+        q_out.put(msg)
+
+
+def latency(transport: str, num: int, size: int) -> list:
+    """
+    returns the round trip times in µs of num messages
+    """
+    q_in = new_queue(transport)
+    q_out = new_queue(transport)
+    p = multiprocessing.Process(target=echo, args=(q_in, q_out, num,))
+    p.start()
+    msg = message.Message(sender=0, receiver=1, content="x"*size)
+    rtts = []
+    for i in range(num):
+        tstart = time.perf_counter()
+        q_in.put(msg)
+        q_out.get()
+        rtts.append((time.perf_counter()-tstart)*1000000)
+    p.join()
+    if transport == "shm":
+        q_in.unlink()
+        q_out.unlink()
+    return rtts
+
+
+def throughput(transport: str, num: int, size: int) -> float:
+    """
+    returns the number of messages per second transferred from one process to another
+    """
+    q = new_queue(transport)
+    p = multiprocessing.Process(target=produce, args=(q, num, size,))
+    tstart = time.perf_counter()
+    p.start()
+    for i in range(num):
+        q.get()
+    tstop = time.perf_counter()
+    p.join()
+    if transport == "shm":
+        q.unlink()
+    return num / (tstop-tstart)
+
+
+def percentile(vals: list, p: float) -> float:
+    vals = sorted(vals)
+    return vals[min(len(vals)-1, int(len(vals)*p/100))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of agency-agent message transport")
+    parser.add_argument("--msgs", type=int, default=20000, help="number of messages")
+    parser.add_argument("--size", type=int, default=100, help="content size in bytes")
+    parser.add_argument("--start", nargs="+", default=multiprocessing.get_all_start_methods(),
+                        choices=multiprocessing.get_all_start_methods(),
+                        help="start methods of the second process")
+    parser.add_argument("--json", default="", help="file to write results to")
+    args = parser.parse_args()
+    transports = ["queue"]
+    if ipc.AVAILABLE:
+        transports.append("shm")
+    res = {}
+    for method in args.start:
+        multiprocessing.set_start_method(method, force=True)
+        res[method] = {}
+        print("start method: " + method)
+        print("transport  p50[µs]  p99[µs]    msgs/s")
+        for transport in transports:
+            rtts = latency(transport, args.msgs, args.size)
+            tp = throughput(transport, args.msgs, args.size)
+            res[method][transport] = {"rtt_p50_us": percentile(rtts, 50),
+                                      "rtt_p99_us": percentile(rtts, 99), "msgs_per_s": tp}
+            print("{:<9} {:>8.1f} {:>8.1f} {:>9.0f}".format(transport, percentile(rtts, 50),
+                                                            percentile(rtts, 99), tp))
+    if args.json != "":
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
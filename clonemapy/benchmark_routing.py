@@ -0,0 +1,192 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements a microbenchmark for the routing of outgoing messages in the agency. It
+compares the dispatch rate of the routing table (see routing) with the previous routing state, i.e.
+dictionaries protected by one multiprocessing.Lock, which was acquired for each lookup.
+
+The dispatcher looks up the receiver of each message; half of the receivers are local agents, half
+are remote agents with known agency. Concurrently, reader threads look up local agents as the http
+handlers do for incoming messages and one writer thread changes the cached agency of remote agents
+every millisecond.
+
+Usage: python -m clonemapy.benchmark_routing [--msgs 200000] [--agents 1000] [--readers 0,4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import threading
+import time
+import clonemapy.routing as routing
+
+
+class LockedTable:
+    """
+    previous routing state of the agency
+    """
+    def __init__(self):
+        super().__init__()
+        self.lock = multiprocessing.Lock()
+        self.local_agents = {}
+        self.remote_agents = {}
+
+    def dispatch(self, receivers: list) -> int:
+        found = 0
+        for recv in receivers:
+            self.lock.acquire()
+            local_agent = self.local_agents.get(recv, None)
+            recv_agency = self.remote_agents.get(recv, None)
+            self.lock.release()
+            if local_agent is not None or recv_agency is not None:
+                found += 1
+        return found
+
+    def lookup(self, recv: int):
+        self.lock.acquire()
+        local_agent = self.local_agents.get(recv, None)
+        self.lock.release()
+        return local_agent
+
+    def set_remote(self, agentid: int, agency):
+        self.lock.acquire()
+        self.remote_agents[agentid] = agency
+        self.lock.release()
+
+    def remove_remote(self, agentid: int):
+        self.lock.acquire()
+        self.remote_agents.pop(agentid, None)
+        self.lock.release()
+
+
+class Table(routing.RoutingTable):
+    """
+    routing table with the access pattern of the agency
+    """
+    def dispatch(self, receivers: list) -> int:
+        found = 0
+        for recv in receivers:
+            local_agent = self.local.get(recv, None)
+            if local_agent is not None:
+                found += 1
+                continue
+            if self.remote.get(recv, None) is not None:
+                found += 1
+        return found
+
+    def lookup(self, recv: int):
+        return self.local.get(recv, None)
+
+    def remove_remote(self, agentid: int):
+        super().remove_remote([agentid])
+
+
+def fill(table, agents: int):
+    for i in range(agents):
+        if isinstance(table, LockedTable):
+            table.local_agents[i] = object()
+        else:
+            table.add_local(i, object())
+        table.set_remote(agents + i, object())
+
+
+def reader(table, agents: int, stop: threading.Event):
+    i = 0
+    while not stop.is_set():
+        for j in range(100):
+            table.lookup(i % agents)
+            i += 1
+
+
+def writer(table, agents: int, stop: threading.Event):
+    i = 0
+    agency = object()
+    while not stop.wait(0.001):
+        agentid = agents + i % agents
+        table.remove_remote(agentid)
+        table.set_remote(agentid, agency)
+        i += 1
+
+
+def run(kind: str, msgs: int, agents: int, readers: int) -> float:
+    """
+    returns the number of dispatched messages per second
+    """
+    if kind == "lock":
+        table = LockedTable()
+    else:
+        table = Table()
+    fill(table, agents)
+    receivers = [i % (2*agents) for i in range(msgs)]
+    stop = threading.Event()
+    threads = [threading.Thread(target=writer, args=(table, agents, stop,), daemon=True)]
+    for i in range(readers):
+        threads.append(threading.Thread(target=reader, args=(table, agents, stop,), daemon=True))
+    for x in threads:
+        x.start()
+    tstart = time.perf_counter()
+    table.dispatch(receivers)
+    rate = msgs/(time.perf_counter() - tstart)
+    stop.set()
+    for x in threads:
+        x.join()
+    return rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of the routing of messages")
+    parser.add_argument("--msgs", type=int, default=200000, help="number of dispatched messages")
+    parser.add_argument("--agents", type=int, default=1000,
+                        help="number of local and of remote agents")
+    parser.add_argument("--readers", default="0,4", help="numbers of concurrent reader threads")
+    parser.add_argument("--json", default="", help="file to write results to")
+    args = parser.parse_args()
+    res = []
+    print("routing  readers    msgs/s")
+    for readers in args.readers.split(","):
+        for kind in ("lock", "table"):
+            rate = run(kind, args.msgs, args.agents, int(readers))
+            res.append({"routing": kind, "readers": int(readers), "rate": rate})
+            print("{:<8} {:>7} {:>9.0f}".format(kind, readers, rate))
+    if args.json != "":
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
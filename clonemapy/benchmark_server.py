@@ -0,0 +1,195 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements a benchmark for the http server of the agency. It measures the request
+throughput of POST /api/agency/msgs as the number of concurrent peer agencies grows.
+
+The server is started in a separate process with a stand-in agency that hosts one agent. The agent
+consumes its incoming messages with a configurable delay in order to emulate a slow agent. Each
+peer agency is emulated by a thread with its own connection pool.
+
+Usage: python -m clonemapy.benchmark_server [--peers 1,2,4,8,16] [--duration 5] [--batch 10]
+"""
+
+import argparse
+import json
+import multiprocessing
+import queue
+import threading
+import time
+import http.server as server
+import clonemapy.agency as agency
+import clonemapy.datamodels as datamodels
+import clonemapy.metrics as metrics
+import clonemapy.routing as routing
+import clonemapy.transport as transport
+
+
+class StandInAgency:
+    """
+    stand-in for the agency providing the attributes required by AgencyHandler
+    """
+    def __init__(self, delay: float):
+        super().__init__()
+        handler = agency.AgentHandler.__new__(agency.AgentHandler)
+        handler.msg_in = queue.Queue(100)
+        self.routes = routing.RoutingTable()
+        self.routes.add_local(0, handler)
+        self.msgs_received = metrics.Counter("clonemap_agent_messages_received_total",
+                                             "Messages delivered to local agents", ("agent",))
+        x = threading.Thread(target=self._consume, args=(handler.msg_in, delay,), daemon=True)
+        x.start()
+
+    def _consume(self, msg_in: queue.Queue, delay: float):
+        while True:
+            msg_in.get()
+            if delay > 0:
+                time.sleep(delay)
+
+
+class SingleThreadedHandler(agency.AgencyHandler):
+    """
+    handler closing each connection after one request (behavior of a single-threaded server)
+    """
+    protocol_version = "HTTP/1.0"
+
+
+def serve(mode: str, port: int, workers: int, delay: float):
+    """
+    runs the server; to be executed in a separate process
+    """
+    ag = StandInAgency(delay)
+    if mode == "single":
+        httpd = server.HTTPServer(('', port), SingleThreadedHandler)
+        httpd.agency = ag
+        httpd.idle_timeout = None
+        httpd.wait_for_request = lambda conn, timeout: True
+    elif mode == "threaded":
+        httpd = agency.new_server(ag, port, 0)
+    else:
+        httpd = agency.new_server(ag, port, workers)
+    httpd.serve_forever()
+
+
+def peer(address: str, body: str, duration: float, results: list):
+    """
+    sends requests to the server for duration seconds and stores the number of successful and
+    failed requests
+    """
+    pool = transport.ConnectionPool(address, 1, 30)
+    num = 0
+    failed = 0
+    tstop = time.monotonic() + duration
+    while time.monotonic() < tstop:
+        try:
+            status, _ = pool.request("POST", "/api/agency/msgs", body)
+        except OSError:
+            status = 0
+        if status == 201:
+            num += 1
+        else:
+            failed += 1
+    pool.close()
+    results.append((num, failed))
+
+
+def run(mode: str, port: int, peers: int, duration: float, batch: int, workers: int,
+        delay: float):
+    """
+    runs one benchmark and returns the throughput in requests per second and the number of failed
+    requests
+    """
+    proc = multiprocessing.Process(target=serve, args=(mode, port, workers, delay,), daemon=True)
+    proc.start()
+    address = "127.0.0.1:" + str(port)
+    pool = transport.ConnectionPool(address, 1, 30)
+    while True:
+        try:
+            pool.request("GET", "/api/agency/agents/0/status")
+            break
+        except OSError:
+            time.sleep(0.05)
+    pool.close()
+    msg = datamodels.ACLMessage(sender=1, receiver=0, content="benchmark")
+    body = "[" + ",".join([msg.json()]*batch) + "]"
+    results = []
+    threads = []
+    for i in range(peers):
+        x = threading.Thread(target=peer, args=(address, body, duration, results,), daemon=True)
+        threads.append(x)
+    for x in threads:
+        x.start()
+    for x in threads:
+        x.join()
+    proc.terminate()
+    proc.join()
+    return sum([i[0] for i in results]) / duration, sum([i[1] for i in results])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of the agency http server")
+    parser.add_argument("--peers", default="1,2,4,8,16", help="numbers of concurrent peers")
+    parser.add_argument("--modes", default="single,threaded,pooled", help="server modes")
+    parser.add_argument("--duration", type=float, default=5, help="duration of each run in s")
+    parser.add_argument("--batch", type=int, default=10, help="messages per request")
+    parser.add_argument("--workers", type=int, default=32, help="workers of pooled server")
+    parser.add_argument("--delay", type=float, default=0,
+                        help="processing time of one message by the agent in s")
+    parser.add_argument("--port", type=int, default=10100, help="port of server")
+    parser.add_argument("--json", default="", help="file to write results to")
+    args = parser.parse_args()
+    res = {}
+    port = args.port
+    print("mode      peers   req/s  failed")
+    for mode in args.modes.split(","):
+        res[mode] = {}
+        for peers in args.peers.split(","):
+            # use a new port for each run to avoid connections in TIME_WAIT
+            port += 1
+            tp, failed = run(mode, port, int(peers), args.duration, args.batch, args.workers,
+                             args.delay)
+            res[mode][peers] = {"throughput": tp, "failed": failed}
+            print("{:<9} {:>5} {:>7.0f} {:>7}".format(mode, peers, tp, failed))
+    if args.json != "":
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
@@ -0,0 +1,192 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements a benchmark comparing the execution of one process per agent with the
+execution of several agents in one worker process. It reports the startup time, the memory usage
+of all agent processes and the message throughput.
+
+The agents echo every message back to the benchmark, which acts as the agency: it feeds the
+incoming queues of the agents and reads the replies from the shared outgoing queue.
+
+Usage: python -m clonemapy.benchmark_workers [--agents 100] [--per-worker 1,10,50] [--msgs 100]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+import clonemapy.agency as agency
+import clonemapy.agent as agent
+import clonemapy.datamodels as datamodels
+import clonemapy.message as message
+
+DRIVER = 1000000
+
+
+class EchoAgent(agent.Agent):
+    def task(self):
+        while True:
+            msg = self.acl.recv_message_wait()
+            msg.receiver = msg.sender
+            self.acl.send_message(msg)
+
+
+def agent_info(agentid: int) -> datamodels.AgentInfo:
+    spec = datamodels.AgentSpec(nodeid=0, name="agent"+str(agentid))
+    return datamodels.AgentInfo(spec=spec, masid=0, agencyid=0, imid=0, id=agentid,
+                                address=datamodels.Address(agency="benchmark"),
+                                status=datamodels.Status(code=datamodels.StatusCode.Running))
+
+
+def memory(pid: int) -> tuple:
+    """
+    returns proportional set size and resident set size of the process in kB
+    """
+    pss = 0
+    rss = 0
+    try:
+        with open("/proc/"+str(pid)+"/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+                elif line.startswith("Rss:"):
+                    rss = int(line.split()[1])
+    except OSError:
+        pass
+    return pss, rss
+
+
+def drain(q: multiprocessing.Queue):
+    while True:
+        q.get()
+
+
+def run(num_agents: int, per_worker: int, num_msgs: int) -> dict:
+    """
+    starts num_agents agents with per_worker agents per process (one process per agent if
+    per_worker is 1) and sends num_msgs messages to each agent
+    """
+    msg_out = multiprocessing.Queue(1000)
+    log_out = multiprocessing.Queue(1000)
+    ts_out = multiprocessing.Queue(1000)
+    x = threading.Thread(target=drain, args=(log_out,), daemon=True)
+    x.start()
+    x = threading.Thread(target=drain, args=(ts_out,), daemon=True)
+    x.start()
+    procs = []
+    queues = {}
+    tstart = time.perf_counter()
+    if per_worker == 1:
+        for i in range(num_agents):
+            msg_in = multiprocessing.Queue(100)
+            p = multiprocessing.Process(target=agency.agent_starter, args=(EchoAgent, agent_info(i),
+                                        "benchmark", "", msg_in, msg_out, log_out, ts_out,))
+            p.start()
+            procs.append(p)
+            queues[i] = msg_in
+    else:
+        msg_in = None
+        for i in range(num_agents):
+            if i % per_worker == 0:
+                msg_in = multiprocessing.Queue(100*per_worker)
+                p = multiprocessing.Process(target=agency.worker_starter, args=(EchoAgent,
+                                            "benchmark", "", msg_in, msg_out, log_out, ts_out,))
+                p.start()
+                procs.append(p)
+            msg_in.put(("start", agent_info(i)))
+            queues[i] = msg_in
+
+    # wait until every agent has replied once
+    for i in range(num_agents):
+        queues[i].put(message.Message(sender=DRIVER, receiver=i, content="start"))
+    for i in range(num_agents):
+        msg_out.get()
+    tstartup = time.perf_counter() - tstart
+    pss = 0
+    rss = 0
+    for p in procs:
+        temp = memory(p.pid)
+        pss += temp[0]
+        rss += temp[1]
+
+    def send():
+        for j in range(num_msgs):
+            for i in range(num_agents):
+                queues[i].put(message.Message(sender=DRIVER, receiver=i, content="bench"))
+
+    tstart = time.perf_counter()
+    x = threading.Thread(target=send, daemon=True)
+    x.start()
+    for i in range(num_agents*num_msgs):
+        msg_out.get()
+    tmsgs = time.perf_counter() - tstart
+    for p in procs:
+        p.terminate()
+        p.join()
+    return {"agents": num_agents, "per_worker": per_worker, "processes": len(procs),
+            "startup_s": tstartup, "pss_mb": pss/1024, "rss_mb": rss/1024,
+            "msgs_per_s": num_agents*num_msgs/tmsgs}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of agent worker processes")
+    parser.add_argument("--agents", type=int, default=100, help="number of agents")
+    parser.add_argument("--per-worker", default="1,10,50", help="agents per process")
+    parser.add_argument("--msgs", type=int, default=100, help="messages per agent")
+    parser.add_argument("--json", default="", help="file to write results to")
+    args = parser.parse_args()
+    os.environ.setdefault("CLONEMAP_MQTT", "OFF")
+    os.environ.setdefault("CLONEMAP_DF", "OFF")
+    res = []
+    print("per_worker processes startup[s] pss[MB] rss[MB]   msgs/s")
+    for per_worker in args.per_worker.split(","):
+        r = run(args.agents, int(per_worker), args.msgs)
+        res.append(r)
+        print("{:>10} {:>9} {:>10.2f} {:>7.0f} {:>7.0f} {:>8.0f}".format(
+              r["per_worker"], r["processes"], r["startup_s"], r["pss_mb"], r["rss_mb"],
+              r["msgs_per_s"]))
+    if args.json != "":
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
@@ -0,0 +1,150 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements a compact binary encoding of messages (message.Message) for the
+communication between the agency and the agent processes.
+
+The encoding consists of a fixed header with all integer fields and the timestamp followed by the
+lengths and the utf-8 encoded bytes of all string fields. Optional fields that are None are marked
+in a bit mask. Naive and timezone aware timestamps are encoded without loss of precision; timestamps
+that have not been parsed yet are encoded as string. The trace of a traced message is appended as
+JSON.
+"""
+
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+import clonemapy.message as message
+
+_HEADER = struct.Struct("<Hqqqqqqqq")
+_STR_FIELDS = ("agencys", "agencyr", "content", "lang", "enc", "ont", "repwith", "inrepto", "repby",
+               "ts")
+_STR_LENGTHS = struct.Struct("<" + "I"*len(_STR_FIELDS))
+_OPT_STR = 0x0010
+_REPTO_NONE = 0x0001
+_CONVID_NONE = 0x0002
+_TS_AWARE = 0x0004
+_TS_STR = 0x0008
+_TRACE = 0x4000
+_LEN = struct.Struct("<I")
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+
+def encode(msg: message.Message) -> bytes:
+    """
+    encodes the message
+    """
+    flags = 0
+    ts = msg.ts
+    offset = 0
+    us = 0
+    if isinstance(ts, str):
+        flags |= _TS_STR
+    elif ts.tzinfo is None:
+        us = (ts - _EPOCH) // _US
+    else:
+        flags |= _TS_AWARE
+        us = (ts - _EPOCH_AWARE) // _US
+        offset = ts.utcoffset() // timedelta(seconds=1)
+    repto = msg.repto
+    if repto is None:
+        flags |= _REPTO_NONE
+        repto = 0
+    convid = msg.convid
+    if convid is None:
+        flags |= _CONVID_NONE
+        convid = 0
+    strs = []
+    for i, field in enumerate(_STR_FIELDS):
+        val = getattr(msg, field)
+        if field == "ts" and not flags & _TS_STR:
+            val = None
+        if val is None:
+            flags |= _OPT_STR << i
+            strs.append(b"")
+        else:
+            strs.append(val.encode())
+    if msg.trace is not None:
+        flags |= _TRACE
+        trace = json.dumps(msg.trace).encode()
+        strs.append(_LEN.pack(len(trace)) + trace)
+    head = _HEADER.pack(flags, us, offset, msg.perf, msg.sender, msg.receiver, msg.prot, repto,
+                        convid)
+    return head + _STR_LENGTHS.pack(*[len(i) for i in strs[:len(_STR_FIELDS)]]) + b"".join(strs)
+
+
+def decode(buf: bytes) -> message.Message:
+    """
+    decodes a message encoded by encode
+    """
+    flags, us, offset, perf, sender, receiver, prot, repto, convid = _HEADER.unpack_from(buf, 0)
+    pos = _HEADER.size
+    lengths = _STR_LENGTHS.unpack_from(buf, pos)
+    pos += _STR_LENGTHS.size
+    msg = message.Message.__new__(message.Message)
+    for i, field in enumerate(_STR_FIELDS):
+        end = pos + lengths[i]
+        if flags & (_OPT_STR << i):
+            setattr(msg, field, None)
+        else:
+            setattr(msg, field, str(buf[pos:end], "utf-8"))
+        pos = end
+    if flags & _TS_AWARE:
+        tz = timezone(timedelta(seconds=offset))
+        msg.ts = (_EPOCH_AWARE + us*_US).astimezone(tz)
+    elif not flags & _TS_STR:
+        msg.ts = _EPOCH + us*_US
+    msg.perf = perf
+    msg.sender = sender
+    msg.receiver = receiver
+    msg.prot = prot
+    msg.repto = None if flags & _REPTO_NONE else repto
+    msg.convid = None if flags & _CONVID_NONE else convid
+    msg.trace = None
+    if flags & _TRACE:
+        length, = _LEN.unpack_from(buf, pos)
+        pos += _LEN.size
+        msg.trace = json.loads(str(buf[pos:pos+length], "utf-8"))
+    return msg
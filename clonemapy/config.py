@@ -0,0 +1,92 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements helpers for reading the optional configuration of clonemapy from environment
+variables. Each helper returns the given default value if the variable is not set or invalid.
+"""
+
+import os
+import logging
+
+
+def get_int(key: str, default: int) -> int:
+    """
+    returns the environment variable key as integer
+    """
+    try:
+        return int(os.environ[key])
+    except KeyError:
+        return default
+    except ValueError:
+        logging.error("Invalid value for " + key + ": " + os.environ[key])
+        return default
+
+
+def get_float(key: str, default: float) -> float:
+    """
+    returns the environment variable key as float
+    """
+    try:
+        return float(os.environ[key])
+    except KeyError:
+        return default
+    except ValueError:
+        logging.error("Invalid value for " + key + ": " + os.environ[key])
+        return default
+
+
+def get_str(key: str, default: str) -> str:
+    """
+    returns the environment variable key as string
+    """
+    return os.environ.get(key, default)
+
+
+def get_switch(key: str, default: bool) -> bool:
+    """
+    returns True if the environment variable key is set to "ON"
+    """
+    try:
+        return os.environ[key] == "ON"
+    except KeyError:
+        return default
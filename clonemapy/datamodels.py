@@ -11,6 +11,15 @@ from datetime import datetime
 from enum import Enum
 
 
+def isoformat(v: datetime) -> str:
+    """
+    returns the timestamp in ISO 8601 format; naive timestamps are marked as UTC
+    """
+    if v.tzinfo is None:
+        return v.isoformat("T") + "Z"
+    return v.isoformat("T")
+
+
 class CloneMAP(BaseModel):
     version: Optional[str] = Field(None, description='version of clonemap')
     uptime: Optional[datetime] = Field(None, description='uptime of clonemap')
@@ -71,7 +80,7 @@ class Status(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
 
@@ -143,7 +152,7 @@ class MASInfoShort(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
 
@@ -201,7 +210,7 @@ class MASInfo(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
 
@@ -313,7 +322,7 @@ class ACLMessage(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
     def __str__(self):
@@ -343,7 +352,7 @@ class LogMessage(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
 
@@ -357,7 +366,7 @@ class TimeSeriesData(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
 
@@ -369,7 +378,7 @@ class State(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
 
@@ -391,7 +400,7 @@ class Service(BaseModel):
 
     class Config:
         json_encoders = {
-            datetime: lambda v: v.isoformat("T") + "Z",
+            datetime: isoformat,
         }
 
 
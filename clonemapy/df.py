@@ -42,13 +42,35 @@
 
 """
 This module implements necessary client methods for the cloneMAP DF
+
+The service requests take the url of the DF API as optional parameter base (default Host +
+"/api/df"); agents use it to send their requests to the DF cache of the agency (see module
+dfcache).
 """
 import requests
 import json
 import logging
+import clonemapy.config as config
 import clonemapy.datamodels as datamodels
 
-Host = "http://df:12000"
+Host = "http://" + config.get_str("CLONEMAP_DF_HOST", "df:12000")
+
+
+def set_host(host: str):
+    """
+    sets the address of the DF (e.g. "127.0.0.1:12000")
+    """
+    global Host
+    Host = "http://" + host
+
+
+def api_url(base: str = None) -> str:
+    """
+    returns the url of the DF API or base if given
+    """
+    if base is None:
+        return Host + "/api/df"
+    return base
 
 
 def alive() -> bool:
@@ -58,12 +80,12 @@ def alive() -> bool:
     return False
 
 
-def post_svc(masid: int, svc: datamodels.Service) -> datamodels.Service:
+def post_svc(masid: int, svc: datamodels.Service, base: str = None) -> datamodels.Service:
     """
     post service to DF
     """
     js = svc.json()
-    url = Host+"/api/df/"+str(masid)+"/svc"
+    url = api_url(base)+"/"+str(masid)+"/svc"
     resp = requests.post(url, data=js)
     if resp.status_code == 201:
         svc = datamodels.Service.parse_raw(resp.text)
@@ -72,12 +94,13 @@ def post_svc(masid: int, svc: datamodels.Service) -> datamodels.Service:
     return svc
 
 
-def get_svc(masid: int, desc: str) -> list:
+def get_svc(masid: int, desc: str, base: str = None, strict: bool = False) -> list:
     """
-    request services with matching description
+    request services with matching description; an error response of the DF results in an empty
+    list or, if strict is True, in a requests.HTTPError
     """
     svcs = []
-    url = Host+"/api/df/"+str(masid)+"/svc/desc/"+desc
+    url = api_url(base)+"/"+str(masid)+"/svc/desc/"+desc
     resp = requests.get(url)
     if resp.status_code == 200:
         svc_dicts = json.loads(resp.text)
@@ -88,35 +111,43 @@ def get_svc(masid: int, desc: str) -> list:
             # svc.from_json_dict(i)
             svcs.append(svc)
     else:
-        logging.error("DF error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
+        err = "DF error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text
+        if strict:
+            raise requests.HTTPError(err, response=resp)
+        logging.error(err)
     return svcs
 
 
-def get_local_svc(masid: int, desc: str, nodeid: int, dist: float) -> list:
+def get_local_svc(masid: int, desc: str, nodeid: int, dist: float, base: str = None,
+                  strict: bool = False) -> list:
     """
-    request local services with matching description
+    request local services with matching description; an error response of the DF results in an
+    empty list or, if strict is True, in a requests.HTTPError
     """
     svcs = []
-    url = Host+"/api/df/"+str(masid)+"/svc/desc/"+desc+"/node/"+str(nodeid)+"/dist/" + str(dist)
+    url = api_url(base)+"/"+str(masid)+"/svc/desc/"+desc+"/node/"+str(nodeid)+"/dist/" + str(dist)
     resp = requests.get(url)
     if resp.status_code == 200:
         svc_dicts = json.loads(resp.text)
         if svc_dicts is None:
             return svcs
         for i in svc_dicts:
-            svc = datamodels.Service.parse_raw(i)
+            svc = datamodels.Service.parse_obj(i)
             # svc.from_json_dict(i)
             svcs.append(svc)
     else:
-        logging.error("DF error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
+        err = "DF error for GET "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text
+        if strict:
+            raise requests.HTTPError(err, response=resp)
+        logging.error(err)
     return svcs
 
 
-def delete_svc(masid: int, svcid: int):
+def delete_svc(masid: int, svcid: str, base: str = None):
     """
     delete service with svcid
     """
-    url = Host+"/api/df/"+str(masid)+"/svc/id/"+svcid
+    url = api_url(base)+"/"+str(masid)+"/svc/id/"+svcid
     resp = requests.delete(url)
     if resp.status_code != 200:
         logging.error("DF error for DELETE "+url+" Code: "+str(resp.status_code)+", Body: " +
@@ -134,8 +165,11 @@ def post_graph(masid: int, gr: datamodels.Graph):
         logging.error("DF error for POST "+url+" Code: "+str(resp.status_code)+", Body: "+resp.text)
 
 
-def get_graph(masid: int) -> datamodels.Graph:
-    url = Host+"/api/df/"+str(masid)+"/graph"
+def get_graph(masid: int, base: str = None) -> datamodels.Graph:
+    """
+    request graph of MAS
+    """
+    url = api_url(base)+"/"+str(masid)+"/graph"
     resp = requests.get(url)
     if resp.status_code == 200:
         return datamodels.Graph.parse_raw(resp.text)
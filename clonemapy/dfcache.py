@@ -0,0 +1,225 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements the DF cache of the agency which is shared by all local agents.
+
+If CLONEMAP_DF_CACHE_TTL is larger than 0 (seconds, default 0), the agents do not contact the DF
+directly but send their requests to the agency (/api/agency/dfcache/...). The results of service
+searches are cached for the TTL, keyed by MAS ID, description, node ID and distance. Concurrent
+identical searches are collapsed into one request to the DF. The graph of the MAS is cached in the
+same way; agents use it to answer distance bounded searches themselves (see module graphindex).
+Registrations and deregistrations of local agents are forwarded to the DF and invalidate all cached
+searches for the description of the service. Changes made by agents of other agencies become
+visible after the TTL at the latest. Failed searches, including error responses of the DF, are not
+cached.
+"""
+
+import threading
+import time
+from typing import Callable
+import clonemapy.datamodels as datamodels
+import clonemapy.df as df
+
+
+class _Pending:
+    """
+    search whose result is being requested from the DF
+    """
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def encode(svcs: list) -> str:
+    """
+    returns the JSON array of the services
+    """
+    return "[" + ",".join([i.json() for i in svcs]) + "]"
+
+
+class DFCache:
+    """
+    Caches the results of service searches in their JSON encoding
+
+    Attributes
+    ----------
+    ttl : float
+          time in seconds a search result is cached
+    hits : integer
+           number of searches answered from the cache
+    misses : integer
+             number of searches that required a request to the DF
+    coalesced : integer
+                number of searches that waited for the identical request of another search
+    invalidations : integer
+                    number of registrations and deregistrations that invalidated cached searches
+    """
+    def __init__(self, ttl: float):
+        super().__init__()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._entries = {}
+        self._pending = {}
+        self._descs = {}
+        self._lock = threading.Lock()
+
+    def search(self, masid: int, desc: str, nodeid: int = None, dist: float = None) -> str:
+        """
+        returns the services with matching description (within dist of node nodeid if given) as
+        JSON; exceptions of the request to the DF, including error responses, are raised for all
+        collapsed searches and are not cached
+        """
+        if nodeid is None:
+            return self._lookup((masid, desc, None, None),
+                                lambda: encode(df.get_svc(masid, desc, strict=True)))
+        return self._lookup((masid, desc, nodeid, dist),
+                            lambda: encode(df.get_local_svc(masid, desc, nodeid, dist,
+                                                            strict=True)))
+
+    def graph(self, masid: int) -> str:
+        """
+        returns the graph of the MAS as JSON or None if the DF has no graph
+        """
+        def fetch():
+            graph = df.get_graph(masid)
+            if graph is None:
+                return None
+            return graph.json()
+        return self._lookup((masid, None, None, None), fetch)
+
+    def _lookup(self, key: tuple, fetch: Callable[[], str]) -> str:
+        """
+        returns the cached result for key; the result is requested with fetch if it is not cached
+        or has expired and no identical request is pending
+        """
+        self._lock.acquire()
+        entry = self._entries.get(key, None)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self._lock.release()
+            return entry[1]
+        pending = self._pending.get(key, None)
+        if pending is not None:
+            self.coalesced += 1
+            self._lock.release()
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+        self.misses += 1
+        pending = _Pending()
+        self._pending[key] = pending
+        self._lock.release()
+        try:
+            pending.result = fetch()
+        except Exception as e:
+            pending.error = e
+        self._lock.acquire()
+        # the result is not cached if the search has been invalidated in the meantime or the DF
+        # has returned nothing (no graph)
+        if self._pending.get(key, None) is pending:
+            del self._pending[key]
+            if pending.error is None and pending.result is not None:
+                self._entries[key] = (time.monotonic() + self.ttl, pending.result)
+        self._lock.release()
+        pending.done.set()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def register(self, masid: int, svc: datamodels.Service) -> datamodels.Service:
+        """
+        registers the service with the DF and invalidates the searches for its description
+        """
+        svc = df.post_svc(masid, svc)
+        self._lock.acquire()
+        if svc.id != "":
+            self._descs[(masid, svc.id)] = svc.desc
+        self._lock.release()
+        self.invalidate(masid, svc.desc)
+        return svc
+
+    def deregister(self, masid: int, svcid: str):
+        """
+        deregisters the service with the DF and invalidates the searches for its description; all
+        searches of the MAS are invalidated if the service has not been registered via the cache
+        """
+        df.delete_svc(masid, svcid)
+        self._lock.acquire()
+        desc = self._descs.pop((masid, svcid), None)
+        self._lock.release()
+        self.invalidate(masid, desc)
+
+    def invalidate(self, masid: int, desc: str = None):
+        """
+        removes the cached searches for the description (all searches and the graph of the MAS if
+        desc is None)
+        """
+        now = time.monotonic()
+        self._lock.acquire()
+        self.invalidations += 1
+        for key in list(self._entries):
+            if key[0] == masid and (desc is None or key[1] == desc):
+                del self._entries[key]
+            elif self._entries[key][0] <= now:
+                del self._entries[key]
+        for key in list(self._pending):
+            if key[0] == masid and (desc is None or key[1] == desc):
+                del self._pending[key]
+        self._lock.release()
+
+    def stats(self) -> dict:
+        """
+        returns the search statistics and the number of cached searches
+        """
+        self._lock.acquire()
+        ret = {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+               "invalidations": self.invalidations, "cached": len(self._entries)}
+        self._lock.release()
+        return ret
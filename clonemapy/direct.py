@@ -0,0 +1,185 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements the direct delivery of messages among the agents of one agency.
+
+If CLONEMAP_DIRECT_DELIVERY is "ON" (default "OFF"), the agency creates a directory in which each
+local agent binds a unix datagram socket named by its ID (Endpoint). A message to an agent whose
+socket exists is sent to this socket in the compact binary encoding of the codec module and is
+neither passed through the queues of the agency nor through its dispatcher. Messages to all other
+agents and messages larger than MAX_SIZE bytes take the usual path via the agency. The agency
+removes the socket of an agent as soon as the agent is deleted, so that subsequent messages are
+routed by the agency again.
+
+Messages sent before the socket of the receiver has been bound take the path via the agency and
+may be overtaken by later messages that are delivered directly.
+
+The sender counts the messages it has delivered directly and reports the counts to the agency via
+the time series queue at least every REPORT_INTERVAL seconds (DeliveryReport). The agency adds them
+to its message metrics. Traced messages skip the stages of the agency; their stage msg_in covers
+the whole transfer.
+
+Unix sockets are not available on all platforms. Check AVAILABLE before using this module.
+"""
+
+import os
+import socket
+import threading
+import time
+from typing import Callable
+import clonemapy.codec as codec
+import clonemapy.message as message
+
+AVAILABLE = hasattr(socket, "AF_UNIX")
+MAX_SIZE = 65536
+REPORT_INTERVAL = 1
+
+
+class DeliveryReport:
+    """
+    Numbers of messages an agent has delivered directly to local agents since its last report
+
+    Attributes
+    ----------
+    sender : integer
+             ID of the sending agent
+    counts : dictionary of int
+             number of messages per receiver
+    """
+    __slots__ = ("sender", "counts")
+
+    def __init__(self, sender: int, counts: dict):
+        self.sender = sender
+        self.counts = counts
+
+    def __getstate__(self):
+        return (self.sender, self.counts)
+
+    def __setstate__(self, state):
+        self.sender, self.counts = state
+
+
+def path(directory: str, agentid: int) -> str:
+    """
+    returns the path of the socket of an agent
+    """
+    return os.path.join(directory, str(agentid))
+
+
+def remove(directory: str, agentid: int):
+    """
+    removes the socket of an agent; messages to the agent are not delivered directly anymore
+    """
+    try:
+        os.unlink(path(directory, agentid))
+    except FileNotFoundError:
+        pass
+
+
+class Endpoint:
+    """
+    Unix datagram socket of one agent for sending messages to and receiving messages from other
+    local agents; received messages are passed to handle in a seperate thread
+
+    Attributes
+    ----------
+    directory : string
+                directory containing the sockets of all local agents
+    agentid : integer
+              ID of the agent
+    """
+    def __init__(self, directory: str, agentid: int, handle: Callable[[message.Message], None],
+                 report: Callable[[DeliveryReport], None]):
+        super().__init__()
+        self.directory = directory
+        self.agentid = agentid
+        self._handle = handle
+        self._report = report
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._reporter = None
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # the socket of a previous agent with the same ID is replaced
+        remove(directory, agentid)
+        self._sock.bind(path(directory, agentid))
+        x = threading.Thread(target=self._receive, daemon=True)
+        x.start()
+
+    def send(self, msg: message.Message) -> bool:
+        """
+        sends the message directly to its receiver; returns False if the receiver has no socket or
+        the message is too large, i.e. if the message has to be sent via the agency
+        """
+        data = codec.encode(msg)
+        if len(data) > MAX_SIZE:
+            return False
+        try:
+            self._sock.sendto(data, path(self.directory, msg.receiver))
+        except OSError:
+            return False
+        recv = msg.receiver
+        self._lock.acquire()
+        self._counts[recv] = self._counts.get(recv, 0) + 1
+        if self._reporter is None:
+            self._reporter = threading.Thread(target=self._report_counts, daemon=True)
+            self._reporter.start()
+        self._lock.release()
+        return True
+
+    def _receive(self):
+        while True:
+            data = self._sock.recv(MAX_SIZE)
+            self._handle(codec.decode(data))
+
+    def _report_counts(self):
+        """
+        periodically reports the numbers of directly delivered messages
+        """
+        while True:
+            time.sleep(REPORT_INTERVAL)
+            self._lock.acquire()
+            counts = self._counts
+            self._counts = {}
+            self._lock.release()
+            if len(counts) > 0:
+                self._report(DeliveryReport(self.agentid, counts))
@@ -0,0 +1,168 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements an index of the graph of a MAS for answering distance bounded service
+searches without contacting the DF.
+
+The edges of the graph are undirected and stored in compressed sparse row (CSR) format: the
+neighbors of the node with index i are targets[offsets[i]:offsets[i+1]] with the corresponding
+weights. The shortest path distances from a node to all reachable nodes are computed with Dijkstra's
+algorithm and cached, since an agent usually searches from the node it is connected to.
+"""
+
+import heapq
+import threading
+from array import array
+import clonemapy.datamodels as datamodels
+
+
+class GraphIndex:
+    """
+    CSR representation of a graph with cached shortest path distances
+
+    Attributes
+    ----------
+    nodes : list of int
+            node IDs by index
+    index : dictionary of int
+            index of each node ID
+    offsets : array of int
+              start of the neighbors of each node in targets and weights (one more entry than
+              nodes)
+    targets : array of int
+              indices of the neighbors
+    weights : array of float
+              weights of the edges to the neighbors
+    max_cached : int
+                 maximum number of source nodes whose distances are cached
+    """
+    def __init__(self, graph: datamodels.Graph, max_cached: int = 1024):
+        super().__init__()
+        self.nodes = []
+        self.index = {}
+        for n in graph.node:
+            self._add_node(n.id)
+        for e in graph.edge:
+            self._add_node(e.n1)
+            self._add_node(e.n2)
+        num = len(self.nodes)
+        degree = [0]*num
+        for e in graph.edge:
+            degree[self.index[e.n1]] += 1
+            degree[self.index[e.n2]] += 1
+        self.offsets = array("l", [0]*(num + 1))
+        for i in range(num):
+            self.offsets[i+1] = self.offsets[i] + degree[i]
+        self.targets = array("l", [0]*self.offsets[num])
+        self.weights = array("d", [0]*self.offsets[num])
+        pos = list(self.offsets[:num])
+        for e in graph.edge:
+            n1 = self.index[e.n1]
+            n2 = self.index[e.n2]
+            for src, dst in ((n1, n2), (n2, n1)):
+                self.targets[pos[src]] = dst
+                self.weights[pos[src]] = e.weight
+                pos[src] += 1
+        self.max_cached = max_cached
+        self._distances = {}
+        self._lock = threading.Lock()
+
+    def _add_node(self, nodeid: int):
+        if nodeid not in self.index:
+            self.index[nodeid] = len(self.nodes)
+            self.nodes.append(nodeid)
+
+    def distances(self, source: int) -> dict:
+        """
+        returns the shortest path distance from the source node to each reachable node by node ID;
+        the source node is always included with distance 0, even if it is not part of the graph;
+        the returned dictionary is shared and must not be modified
+        """
+        self._lock.acquire()
+        ret = self._distances.get(source, None)
+        self._lock.release()
+        if ret is not None:
+            return ret
+        ret = {source: 0.0}
+        start = self.index.get(source, None)
+        if start is not None:
+            dist = self._dijkstra(start)
+            for i, d in enumerate(dist):
+                if d is not None:
+                    ret[self.nodes[i]] = d
+        self._lock.acquire()
+        if len(self._distances) >= self.max_cached:
+            self._distances.clear()
+        self._distances[source] = ret
+        self._lock.release()
+        return ret
+
+    def distance(self, source: int, target: int) -> float:
+        """
+        returns the shortest path distance between two nodes or None if target is not reachable
+        """
+        return self.distances(source).get(target, None)
+
+    def _dijkstra(self, start: int) -> list:
+        """
+        returns the distance of each node index from start (None if not reachable)
+        """
+        offsets = self.offsets
+        targets = self.targets
+        weights = self.weights
+        dist = [None]*len(self.nodes)
+        dist[start] = 0.0
+        heap = [(0.0, start)]
+        done = [False]*len(self.nodes)
+        while heap:
+            d, i = heapq.heappop(heap)
+            if done[i]:
+                continue
+            done[i] = True
+            for k in range(offsets[i], offsets[i+1]):
+                j = targets[k]
+                nd = d + weights[k]
+                if dist[j] is None or nd < dist[j]:
+                    dist[j] = nd
+                    heapq.heappush(heap, (nd, j))
+        return dist
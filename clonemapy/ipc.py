@@ -0,0 +1,350 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements queues based on shared memory ring buffers for the communication between the
+agency and the agent processes.
+
+Each ring buffer has exactly one producer and one consumer process. Messages (message.Message) are
+written to the ring in the compact binary encoding of the codec module; all other items are
+pickled. A semaphore counts the items in the ring and wakes up a waiting consumer. The outgoing
+rings of all agent processes share one semaphore so that the agency can wait for messages of all
+agents at once (RingGroup).
+
+Shared memory requires python 3.8 or newer. Check AVAILABLE before using this module.
+"""
+
+import pickle
+import queue
+import struct
+import threading
+import time
+import multiprocessing
+import clonemapy.codec as codec
+import clonemapy.message as message
+
+try:
+    from multiprocessing import shared_memory
+    from multiprocessing import resource_tracker
+    AVAILABLE = True
+except ImportError:
+    AVAILABLE = False
+
+_POS = struct.Struct("<Q")
+_LEN = struct.Struct("<I")
+_HEAD = 0
+_TAIL = 64
+_DATA = 128
+_WRAP = 0xFFFFFFFF
+_ACL = b"\x00"
+_PICKLE = b"\x01"
+
+
+class RingBuffer:
+    """
+    Ring buffer for variable sized records in shared memory (single producer, single consumer)
+
+    The read position (head) and the write position (tail) are stored at the beginning of the
+    shared memory and only ever increase. Each record consists of its length and its data. A record
+    never wraps around the end of the buffer; instead, the remaining space is skipped. The write
+    position is updated after the record has been written, which relies on the store order
+    guarantees of the CPU (e.g. x86).
+
+    Attributes
+    ----------
+    name : string
+           name of the shared memory
+    capacity : integer
+               size of data area in bytes
+    """
+    def __init__(self, size: int = 0, name: str = None):
+        super().__init__()
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size+_DATA)
+            _POS.pack_into(self._shm.buf, _HEAD, 0)
+            _POS.pack_into(self._shm.buf, _TAIL, 0)
+        else:
+            # processes started with spawn or forkserver share the resource tracker of the agency
+            # (as do forked ones); only a tracker of their own would remove the memory on exit
+            shared = resource_tracker._resource_tracker._fd is not None
+            self._shm = shared_memory.SharedMemory(name=name)
+            if not shared:
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+        self.name = self._shm.name
+        self.capacity = self._shm.size - _DATA
+        self._buf = self._shm.buf
+
+    def __reduce__(self):
+        return (RingBuffer, (0, self.name,))
+
+    def write(self, data: bytes) -> bool:
+        """
+        writes one record; returns False if there is not enough free space
+        """
+        size = len(data)
+        if size + _LEN.size > self.capacity:
+            raise ValueError("record of "+str(size)+" bytes exceeds capacity of ring buffer")
+        buf = self._buf
+        tail = _POS.unpack_from(buf, _TAIL)[0]
+        head = _POS.unpack_from(buf, _HEAD)[0]
+        off = tail % self.capacity
+        skip = 0
+        if self.capacity - off < size + _LEN.size:
+            skip = self.capacity - off
+        if self.capacity - (tail - head) < skip + size + _LEN.size:
+            return False
+        if skip > 0:
+            if skip >= _LEN.size:
+                _LEN.pack_into(buf, _DATA+off, _WRAP)
+            tail += skip
+            off = 0
+        buf[_DATA+off+_LEN.size:_DATA+off+_LEN.size+size] = data
+        _LEN.pack_into(buf, _DATA+off, size)
+        # publish record after it has been written completely
+        _POS.pack_into(buf, _TAIL, tail+_LEN.size+size)
+        return True
+
+    def read(self) -> bytes:
+        """
+        reads one record; returns None if the buffer is empty
+        """
+        buf = self._buf
+        head = _POS.unpack_from(buf, _HEAD)[0]
+        tail = _POS.unpack_from(buf, _TAIL)[0]
+        if head == tail:
+            return None
+        off = head % self.capacity
+        if self.capacity - off < _LEN.size or _LEN.unpack_from(buf, _DATA+off)[0] == _WRAP:
+            head += self.capacity - off
+            off = 0
+        size = _LEN.unpack_from(buf, _DATA+off)[0]
+        data = bytes(buf[_DATA+off+_LEN.size:_DATA+off+_LEN.size+size])
+        _POS.pack_into(buf, _HEAD, head+_LEN.size+size)
+        return data
+
+    def empty(self) -> bool:
+        return _POS.unpack_from(self._buf, _HEAD)[0] == _POS.unpack_from(self._buf, _TAIL)[0]
+
+    def close(self):
+        """
+        detaches from the shared memory
+        """
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+        removes the shared memory; it is freed as soon as all processes have detached from it; to
+        be called by the creating process
+        """
+        self._shm.unlink()
+
+
+def _encode(item) -> bytes:
+    if type(item) is message.Message:
+        return _ACL + codec.encode(item)
+    return _PICKLE + pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(data: bytes):
+    if data[:1] == _ACL:
+        return codec.decode(memoryview(data)[1:])
+    return pickle.loads(memoryview(data)[1:])
+
+
+class ShmQueue:
+    """
+    Queue with the interface of multiprocessing.Queue based on a shared memory ring buffer
+
+    The queue may be used by several threads, but only by one producer and one consumer process.
+    A producer blocks while the ring is full.
+
+    Attributes
+    ----------
+    ring : RingBuffer
+           ring buffer containing the items
+    """
+    poll_interval = 0.0001
+    max_poll_interval = 0.01
+    multi_consumer = False
+
+    def __init__(self, size: int, items: multiprocessing.Semaphore = None, ring: RingBuffer = None):
+        super().__init__()
+        if ring is None:
+            ring = RingBuffer(size)
+        if items is None:
+            items = multiprocessing.Semaphore(0)
+        self.ring = ring
+        self._items = items
+        self._put_lock = threading.Lock()
+        self._get_lock = threading.Lock()
+
+    def __getstate__(self):
+        return (self.ring, self._items)
+
+    def __setstate__(self, state):
+        self.ring, self._items = state
+        self._put_lock = threading.Lock()
+        self._get_lock = threading.Lock()
+
+    def put(self, item, block: bool = True, timeout: float = None):
+        """
+        adds item to the queue; raises queue.Full if the queue is still full after timeout or
+        immediately if block is False
+        """
+        data = _encode(item)
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+        self._put_lock.acquire()
+        try:
+            while not self.ring.write(data):
+                if not block or (deadline is not None and time.monotonic() > deadline):
+                    raise queue.Full
+                time.sleep(interval)
+                interval = min(interval*2, self.max_poll_interval)
+        finally:
+            self._put_lock.release()
+        self._items.release()
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        removes and returns an item from the queue; raises queue.Empty if there is no item
+        """
+        if not self._items.acquire(block, timeout):
+            raise queue.Empty
+        self._get_lock.acquire()
+        data = self.ring.read()
+        self._get_lock.release()
+        return _decode(data)
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def qsize(self) -> int:
+        return self._items.get_value()
+
+    def empty(self) -> bool:
+        return self.ring.empty()
+
+    def close(self):
+        self.ring.close()
+
+    def unlink(self):
+        self.ring.unlink()
+
+
+class RingGroup:
+    """
+    Consumer of several rings with one producer process each (e.g. the outgoing messages of all
+    agent processes); provides the get interface of multiprocessing.Queue
+
+    All rings of the group share one semaphore counting the items in all rings.
+    """
+    def __init__(self):
+        super().__init__()
+        self._items = multiprocessing.Semaphore(0)
+        self._rings = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def new_queue(self, size: int) -> ShmQueue:
+        """
+        creates a new ring in the group and returns the queue to be used by the producer process
+        """
+        q = ShmQueue(size, self._items)
+        self._lock.acquire()
+        self._rings.append(q.ring)
+        self._lock.release()
+        return q
+
+    def __contains__(self, q: ShmQueue) -> bool:
+        """
+        returns True if the ring of the queue belongs to the group
+        """
+        self._lock.acquire()
+        found = q.ring in self._rings
+        self._lock.release()
+        return found
+
+    def remove(self, q: ShmQueue):
+        """
+        removes the ring of the queue from the group and frees its memory; items remaining in the
+        ring are discarded
+        """
+        self._lock.acquire()
+        self._rings.remove(q.ring)
+        self._next = 0
+        self._lock.release()
+        q.unlink()
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        removes and returns an item from any ring of the group; rings are read round robin
+        """
+        if not self._items.acquire(block, timeout):
+            raise queue.Empty
+        while True:
+            # an item is published before it is counted, hence an item is available unless it has
+            # been discarded by remove
+            self._lock.acquire()
+            num = len(self._rings)
+            for i in range(num):
+                ring = self._rings[(self._next+i) % num]
+                data = ring.read()
+                if data is not None:
+                    self._next = (self._next+i+1) % num
+                    self._lock.release()
+                    return _decode(data)
+            self._lock.release()
+            if not self._items.acquire(block, timeout):
+                raise queue.Empty
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def qsize(self) -> int:
+        return self._items.get_value()
@@ -0,0 +1,256 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements the local mode, in which the agencies of one MAS are executed on a single
+machine without Kubernetes. The AMS is replaced by a stand-in (see standin), the logger and the DF
+either by stand-ins or by services reachable at a given host.
+
+Usage: python -m clonemapy.local config.json package.module:AgentClass
+
+The configuration file is a json object (all entries but agencies are optional):
+
+    {
+        "mas": {"id": 0, "name": "local", "custom": ""},
+        "ams": {"port": 9000},
+        "logger": {"active": true, "port": 11000, "echo": true,
+                   "msg": true, "app": true, "status": true, "debug": true},
+        "df": {"active": true, "host": "127.0.0.1:12000"},
+        "env": {"CLONEMAP_AGENTS_PER_WORKER": "10"},
+        "agencies": [
+            {"port": 10001, "agents": [{"name": "sensor", "count": 10, "nodeid": 0,
+                                        "type": "", "subtype": "", "custom": {"rate": 1}}]},
+            {"agents": [{"name": "controller"}], "env": {"CLONEMAP_IPC": "shm"}}
+        ]
+    }
+
+A port of 0 or no port selects an unused port. If a host is given for logger or DF, the service at
+that host is used instead of a stand-in. Agents with a count are added count times with the index
+appended to their name. The entries of env are set for all agencies, those of an agency only for
+that agency.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+import clonemapy.agent as agent
+import clonemapy.agency as agency
+import clonemapy.datamodels as datamodels
+import clonemapy.standin as standin
+
+
+def load_config(path: str) -> dict:
+    """
+    reads the configuration file
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_class(spec: str) -> agent.Agent:
+    """
+    returns the class given as "package.module:Class"
+    """
+    module, _, name = spec.partition(":")
+    if name == "":
+        raise ValueError("Invalid agent class " + spec + "; expected package.module:Class")
+    return getattr(importlib.import_module(module), name)
+
+
+def agent_specs(agents: list) -> list:
+    """
+    returns the agent specs of the agents of one agency in the configuration
+    """
+    specs = []
+    for ag in agents:
+        custom = ag.get("custom", None)
+        if custom is not None and not isinstance(custom, str):
+            custom = json.dumps(custom)
+        name = ag.get("name", "agent")
+        count = ag.get("count", None)
+        names = [name]
+        if count is not None:
+            names = [name + str(i) for i in range(count)]
+        for i in names:
+            specs.append(datamodels.AgentSpec(nodeid=ag.get("nodeid", 0), name=i,
+                                              type=ag.get("type", None),
+                                              subtype=ag.get("subtype", None), custom=custom))
+    return specs
+
+
+def run_agency(ag_class: agent.Agent, env: dict):
+    """
+    executes an agency; to be called in a separate process
+    """
+    os.environ.update(env)
+    agency.Agency(ag_class)
+
+
+class LocalMAS:
+    """
+    executes the agencies of one MAS on the local machine
+
+    Attributes
+    ----------
+    conf : dictionary
+           configuration (see module documentation)
+    ag_class : agent.Agent
+               class of the agents
+    ams : standin.StandInAMS
+          stand-in for the AMS
+    logger : standin.StandInLogger
+             stand-in for the logger; None if it is inactive or a host is configured
+    df : standin.StandInDF
+         stand-in for the DF; None if it is inactive or a host is configured
+    procs : list of multiprocessing.Process
+            process of each agency
+    """
+    def __init__(self, conf: dict, ag_class: agent.Agent):
+        super().__init__()
+        self.conf = conf
+        self.ag_class = ag_class
+        mas = conf.get("mas", {})
+        self.ams = standin.StandInAMS(mas.get("id", 0), mas.get("name", "local"),
+                                      conf.get("ams", {}).get("port", 0), mas.get("custom", ""))
+        self.logger = None
+        self.df = None
+        self.procs = []
+
+    def _service_env(self) -> dict:
+        """
+        starts the stand-ins of logger and DF and returns the corresponding environment
+        """
+        env = {"CLONEMAP_AMS_HOST": self.ams.host, "CLONEMAP_LOGGING": "OFF",
+               "CLONEMAP_DF": "OFF"}
+        log_conf = self.conf.get("logger", {})
+        if log_conf.get("active", False):
+            host = log_conf.get("host", "")
+            if host == "":
+                self.logger = standin.StandInLogger(log_conf.get("port", 0),
+                                                    echo=log_conf.get("echo", False))
+                self.logger.start()
+                host = self.logger.host
+            env["CLONEMAP_LOGGING"] = "ON"
+            env["CLONEMAP_LOGGER_HOST"] = host
+        df_conf = self.conf.get("df", {})
+        if df_conf.get("active", False):
+            host = df_conf.get("host", "")
+            if host == "":
+                self.df = standin.StandInDF(df_conf.get("port", 0))
+                self.df.start()
+                host = self.df.host
+            env["CLONEMAP_DF"] = "ON"
+            env["CLONEMAP_DF_HOST"] = host
+        return env
+
+    def start(self):
+        """
+        starts the stand-ins and one process per agency
+        """
+        self.ams.start()
+        env = {"CLONEMAP_MQTT": "OFF", "CLONEMAP_LOG_LEVEL": "info"}
+        env.update(self._service_env())
+        env.update(self.conf.get("env", {}))
+        log_conf = self.conf.get("logger", {})
+        logger_config = datamodels.LoggerConfig(active=log_conf.get("active", False),
+                                                msg=log_conf.get("msg", True),
+                                                app=log_conf.get("app", True),
+                                                status=log_conf.get("status", True),
+                                                debug=log_conf.get("debug", True))
+        first = 0
+        for agencyid, ag_conf in enumerate(self.conf.get("agencies", [])):
+            port = ag_conf.get("port", 0)
+            if port == 0:
+                port = standin.free_port()
+            name = "127.0.0.1:" + str(port)
+            specs = agent_specs(ag_conf.get("agents", []))
+            self.ams.add_agency(agencyid, name, specs, first, logger_config)
+            first += len(specs)
+            ag_env = dict(env)
+            ag_env.update({"CLONEMAP_AGENCY_HOSTNAME": self.ams.hostname(agencyid),
+                           "CLONEMAP_AGENCY_NAME": name, "CLONEMAP_AGENCY_PORT": str(port)})
+            ag_env.update(ag_conf.get("env", {}))
+            p = multiprocessing.Process(target=run_agency, args=(self.ag_class, ag_env))
+            p.start()
+            self.procs.append(p)
+            logging.info("Local: Started agency " + name + " with " + str(len(specs)) +
+                         " agents")
+
+    def wait(self):
+        """
+        blocks until all agencies have terminated
+        """
+        while any(p.is_alive() for p in self.procs):
+            time.sleep(0.5)
+
+    def stop(self):
+        """
+        terminates the agencies and the stand-ins
+        """
+        for p in self.procs:
+            if p.is_alive():
+                p.terminate()
+        for p in self.procs:
+            p.join()
+        self.procs = []
+        for service in (self.df, self.logger, self.ams):
+            if service is not None:
+                service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="execute the agencies of a MAS locally")
+    parser.add_argument("config", help="configuration file")
+    parser.add_argument("agent", help="agent class as package.module:Class")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s - [%(levelname)s] - %(message)s', level=logging.INFO)
+    mas = LocalMAS(load_config(args.config), load_class(args.agent))
+    mas.start()
+    try:
+        mas.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mas.stop()
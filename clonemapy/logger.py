@@ -46,12 +46,26 @@ This module implements necessary client methods for the cloneMAP logger
 import requests
 import json
 import logging
+import clonemapy.config as config
 import clonemapy.datamodels as datamodels
 import os
 import queue
-from typing import List
+import threading
+import time
+import collections
+import array
+from datetime import datetime
+from typing import Callable, List
 
-Host = "http://logger:11000"
+Host = "http://" + config.get_str("CLONEMAP_LOGGER_HOST", "logger:11000")
+
+
+def set_host(host: str):
+    """
+    sets the address of the logger (e.g. "127.0.0.1:11000")
+    """
+    global Host
+    Host = "http://" + host
 
 
 def alive() -> bool:
@@ -65,11 +79,7 @@ def post_logs(masid: int, logs: List[datamodels.LogMessage]):
     """
     post array of log messages to logger
     """
-    log_dicts = []
-    for i in logs:
-        log_dict = json.loads(i.json())
-        log_dicts.append(log_dict)
-    js = json.dumps(log_dicts)
+    js = "[" + ",".join([i.json() for i in logs]) + "]"
     url = Host+"/api/logging/"+str(masid)+"/list"
     resp = requests.post(url, data=js)
     if resp.status_code != 201:
@@ -110,6 +120,25 @@ def post_timeseries_data(masid: int, ts: List[datamodels.TimeSeriesData]):
                       resp.text)
 
 
+def post_timeseries_chunks(masid: int, chunks: list):
+    """
+    post the samples of a list of TimeSeriesChunk to the logger
+    """
+    samples = []
+    for chunk in chunks:
+        prefix = ('{"masid": ' + str(chunk.masid) + ', "agentid": ' + str(chunk.agentid) +
+                  ', "name": ' + json.dumps(chunk.name) + ', "timestamp": "')
+        for t, value in zip(chunk.timestamps, chunk.values):
+            samples.append(prefix + datetime.fromtimestamp(t).isoformat("T") + 'Z", "value": ' +
+                           json.dumps(value) + '}')
+    js = "[" + ",".join(samples) + "]"
+    url = Host+"/api/series/"+str(masid)
+    resp = requests.post(url, data=js)
+    if resp.status_code != 201:
+        logging.error("Logger error for POST "+url+" Code: "+str(resp.status_code)+", Body: " +
+                      resp.text)
+
+
 def put_state(masid: int, agentid: int, state: datamodels.State):
     """
     update state of agent
@@ -148,12 +177,70 @@ def get_state(masid: int, agentid: int) -> datamodels.State:
     return None
 
 
-def send_logs(masid: int, log_config: datamodels.LoggerConfig, log_queue: queue.Queue):
+class LogShipper:
     """
-    wait for logs in the queue and send them to logger (to be executed in seperate thread)
+    Collects logs in a bounded buffer and sends them to the logger in batches
+
+    A batch is sent as soon as batch_size logs are buffered or flush_interval has passed. If the
+    buffer is full, the overflow policy determines what happens to a new log:
+    - "block": the collector waits for free space, i.e. agents block once the log queue is full
+    - "drop_oldest": the oldest buffered log is dropped
+    - "drop_topic": the oldest buffered log with a topic in drop_topics is dropped; if there is no
+      such log, the new log is dropped if its topic is in drop_topics, else the oldest log
+
+    Attributes
+    ----------
+    masid : integer
+            ID of MAS
+    log_config : datamodels.LoggerConfig
+                 activation of log topics
+    batch_size : integer
+                 maximum number of logs per request (CLONEMAP_LOG_BATCH_SIZE, default 100)
+    flush_interval : float
+                     maximum time in seconds a log is buffered (CLONEMAP_LOG_FLUSH_INTERVAL in ms,
+                     default 500)
+    buffer_size : integer
+                  maximum number of buffered logs (CLONEMAP_LOG_BUFFER, default 10000)
+    overflow : string
+               overflow policy (CLONEMAP_LOG_OVERFLOW, default "block")
+    drop_topics : set of strings
+                  topics dropped first by the "drop_topic" policy (CLONEMAP_LOG_DROP_TOPICS,
+                  comma separated, default "msg,debug")
+    shipped : integer
+              number of logs sent to the logger
+    dropped : dictionary of integers
+              number of dropped logs per topic
     """
-    log_on = os.environ['CLONEMAP_LOGGING']
-    if log_on == "ON":
+    def __init__(self, masid: int, log_config: datamodels.LoggerConfig):
+        super().__init__()
+        self.masid = masid
+        self.log_config = log_config
+        self.batch_size = config.get_int("CLONEMAP_LOG_BATCH_SIZE", 100)
+        self.flush_interval = config.get_float("CLONEMAP_LOG_FLUSH_INTERVAL", 500)/1000
+        self.buffer_size = config.get_int("CLONEMAP_LOG_BUFFER", 10000)
+        self.overflow = config.get_str("CLONEMAP_LOG_OVERFLOW", "block")
+        if self.overflow not in ("block", "drop_oldest", "drop_topic"):
+            logging.error("Invalid log overflow policy " + self.overflow)
+            self.overflow = "block"
+        topics = config.get_str("CLONEMAP_LOG_DROP_TOPICS", "msg,debug")
+        self.drop_topics = set([i.strip() for i in topics.split(",") if i.strip() != ""])
+        self.shipped = 0
+        self.dropped = {}
+        self._buffer = collections.deque()
+        self._cond = threading.Condition()
+        self._python_logger = None
+        if os.environ['CLONEMAP_LOGGING'] != "ON":
+            self._python_logger = logging.getLogger("agentlogs")
+            self._python_logger.setLevel("DEBUG")
+
+    def run(self, log_queue: queue.Queue):
+        """
+        starts the shipping thread and collects logs from the queue (to be executed in seperate
+        thread)
+        """
+        x = threading.Thread(target=self._ship, daemon=True)
+        x.start()
+        log_config = self.log_config
         while True:
             log = log_queue.get()
             if ((log.topic == "msg" and not log_config.msg) or
@@ -161,34 +248,283 @@ def send_logs(masid: int, log_config: datamodels.LoggerConfig, log_queue: queue.
                     (log.topic == "debug" and not log_config.debug) or
                     (log.topic == "status" and not log_config.status)):
                 continue
+            self.add(log)
+
+    def add(self, log: datamodels.LogMessage):
+        """
+        adds one log to the buffer applying the overflow policy
+        """
+        self._cond.acquire()
+        if len(self._buffer) >= self.buffer_size:
+            if self.overflow == "block":
+                while len(self._buffer) >= self.buffer_size:
+                    self._cond.wait()
+            elif self.overflow == "drop_oldest":
+                self._drop(self._buffer.popleft())
+            else:
+                log = self._drop_by_topic(log)
+        if log is not None:
+            self._buffer.append(log)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        self._cond.release()
+
+    def stats(self) -> dict:
+        """
+        returns the number of shipped, dropped and buffered logs
+        """
+        self._cond.acquire()
+        ret = {"shipped": self.shipped, "dropped": dict(self.dropped),
+               "buffered": len(self._buffer)}
+        self._cond.release()
+        return ret
+
+    def _drop(self, log: datamodels.LogMessage):
+        self.dropped[log.topic] = self.dropped.get(log.topic, 0) + 1
+
+    def _drop_by_topic(self, log: datamodels.LogMessage) -> datamodels.LogMessage:
+        """
+        makes space for log according to the "drop_topic" policy; returns the log to be added or
+        None if log itself has been dropped
+        """
+        for i, temp in enumerate(self._buffer):
+            if temp.topic in self.drop_topics:
+                del self._buffer[i]
+                self._drop(temp)
+                return log
+        if log.topic in self.drop_topics:
+            self._drop(log)
+            return None
+        self._drop(self._buffer.popleft())
+        return log
+
+    def _ship(self):
+        """
+        sends batches of logs (to be executed in seperate thread)
+        """
+        while True:
+            self._cond.acquire()
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._buffer) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
             logs = []
-            logs.append(log)
-            post_logs(masid, logs)
+            while len(self._buffer) > 0 and len(logs) < self.batch_size:
+                logs.append(self._buffer.popleft())
+            self._cond.notify_all()
+            self._cond.release()
+            if len(logs) == 0:
+                continue
+            self._output(logs)
+
+    def _output(self, logs: List[datamodels.LogMessage]):
+        """
+        sends the logs to the logger or to the python logger if the logger is not active
+        """
+        if self._python_logger is None:
+            try:
+                post_logs(self.masid, logs)
+            except requests.RequestException as e:
+                logging.error("Logger error: " + str(e))
+                self._cond.acquire()
+                for log in logs:
+                    self._drop(log)
+                self._cond.release()
+                return
+        else:
+            for log in logs:
+                print_log(self._python_logger, log)
+        self._cond.acquire()
+        self.shipped += len(logs)
+        self._cond.release()
+
+
+def print_log(python_logger: logging.Logger, log: datamodels.LogMessage):
+    """
+    prints one log with the python logger
+    """
+    if log.topic == "error":
+        msg = "Agent"+str(log.agentid)+": " + str(log.msg)
+        if log.data is not None and log.data != "":
+            msg += " ("+log.data+")"
+        python_logger.error(msg)
+    elif log.topic == "debug":
+        msg = "Agent"+str(log.agentid)+": " + str(log.msg)
+        if log.data is not None and log.data != "":
+            msg += " ("+log.data+")"
+        python_logger.debug(msg)
     else:
-        python_logger = logging.getLogger("agentlogs")
-        python_logger.setLevel("DEBUG")
+        msg = "Agent"+str(log.agentid)+" ["+log.topic+"]: " + str(log.msg)
+        if log.data is not None and log.data != "":
+            msg += " ("+log.data+")"
+        python_logger.info(msg)
+
+
+def send_logs(masid: int, log_config: datamodels.LoggerConfig, log_queue: queue.Queue):
+    """
+    wait for logs in the queue and send them to logger (to be executed in seperate thread)
+    """
+    shipper = LogShipper(masid, log_config)
+    shipper.run(log_queue)
+
+
+class TimeSeriesChunk:
+    """
+    Samples of one time series of one agent stored in arrays
+
+    Attributes
+    ----------
+    masid : integer
+            ID of MAS
+    agentid : integer
+              ID of agent
+    name : string
+           name of time series
+    timestamps : array of float
+                 time of each sample in seconds since epoch
+    values : array of float
+             sample values
+    """
+    __slots__ = ("masid", "agentid", "name", "timestamps", "values")
+
+    def __init__(self, masid: int, agentid: int, name: str):
+        self.masid = masid
+        self.agentid = agentid
+        self.name = name
+        self.timestamps = array.array("d")
+        self.values = array.array("d")
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, timestamp: float, value: float):
+        self.timestamps.append(timestamp)
+        self.values.append(value)
+
+    def extend(self, chunk):
+        self.timestamps.extend(chunk.timestamps)
+        self.values.extend(chunk.values)
+
+
+class TimeSeriesShipper:
+    """
+    Buffers the time series samples of all agents in one TimeSeriesChunk per agent and series and
+    sends them to the logger in bulk
+
+    The samples are sent as soon as batch_size samples are buffered or flush_interval has passed.
+    Samples exceeding buffer_size are dropped.
+
+    Attributes
+    ----------
+    masid : integer
+            ID of MAS
+    batch_size : integer
+                 number of buffered samples which triggers sending (CLONEMAP_TS_BATCH_SIZE,
+                 default 5000)
+    flush_interval : float
+                     maximum time in seconds a sample is buffered (CLONEMAP_TS_FLUSH_INTERVAL in
+                     ms, default 1000)
+    buffer_size : integer
+                  maximum number of buffered samples (CLONEMAP_TS_BUFFER, default 100000)
+    shipped : integer
+              number of samples sent to the logger
+    dropped : integer
+              number of dropped samples
+    """
+    def __init__(self, masid: int):
+        self.masid = masid
+        self.batch_size = config.get_int("CLONEMAP_TS_BATCH_SIZE", 5000)
+        self.flush_interval = config.get_float("CLONEMAP_TS_FLUSH_INTERVAL", 1000)/1000
+        self.buffer_size = config.get_int("CLONEMAP_TS_BUFFER", 100000)
+        self.shipped = 0
+        self.dropped = 0
+        self._chunks = {}
+        self._num = 0
+        self._cond = threading.Condition()
+
+    def run(self, ts_queue: queue.Queue, on_other: Callable[[object], None] = None):
+        """
+        starts the shipping thread and collects samples from the queue (to be executed in seperate
+        thread); samples are discarded if the logger is not active; all other items received via
+        the queue (e.g. message traces) are passed to on_other
+        """
+        log_on = os.environ['CLONEMAP_LOGGING']
+        if log_on == "ON":
+            x = threading.Thread(target=self._ship, daemon=True)
+            x.start()
         while True:
-            log = log_queue.get()
-            if ((log.topic == "msg" and not log_config.msg) or
-                    (log.topic == "app" and not log_config.app) or
-                    (log.topic == "debug" and not log_config.debug) or
-                    (log.topic == "status" and not log_config.status)):
+            item = ts_queue.get()
+            if isinstance(item, (TimeSeriesChunk, datamodels.TimeSeriesData)):
+                if log_on == "ON":
+                    self.add(item)
+            elif on_other is not None:
+                on_other(item)
+
+    def add(self, item):
+        """
+        adds a TimeSeriesChunk or a single datamodels.TimeSeriesData sample to the buffer
+        """
+        if isinstance(item, datamodels.TimeSeriesData):
+            chunk = TimeSeriesChunk(item.masid, item.agentid, item.name)
+            chunk.append(item.timestamp.timestamp(), item.value)
+            item = chunk
+        self._cond.acquire()
+        if self._num + len(item) > self.buffer_size:
+            self.dropped += len(item)
+            self._cond.release()
+            return
+        key = (item.agentid, item.name)
+        chunk = self._chunks.get(key, None)
+        if chunk is None:
+            self._chunks[key] = item
+        else:
+            chunk.extend(item)
+        self._num += len(item)
+        if self._num >= self.batch_size:
+            self._cond.notify_all()
+        self._cond.release()
+
+    def stats(self) -> dict:
+        """
+        returns the number of shipped, dropped and buffered samples
+        """
+        self._cond.acquire()
+        ret = {"shipped": self.shipped, "dropped": self.dropped, "buffered": self._num}
+        self._cond.release()
+        return ret
+
+    def _ship(self):
+        """
+        sends the buffered samples (to be executed in seperate thread)
+        """
+        while True:
+            self._cond.acquire()
+            deadline = time.monotonic() + self.flush_interval
+            while self._num < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+            chunks = list(self._chunks.values())
+            num = self._num
+            self._chunks = {}
+            self._num = 0
+            self._cond.release()
+            if num == 0:
                 continue
-            if log.topic == "error":
-                msg = "Agent"+str(log.agentid)+": " + str(log.msg)
-                if log.data != "":
-                    msg += " ("+log.data+")"
-                python_logger.error(msg)
-            elif log.topic == "debug":
-                msg = "Agent"+str(log.agentid)+": " + str(log.msg)
-                if log.data != "":
-                    msg += " ("+log.data+")"
-                python_logger.debug(msg)
-            else:
-                msg = "Agent"+str(log.agentid)+" ["+log.topic+"]: " + str(log.msg)
-                if log.data != "":
-                    msg += " ("+log.data+")"
-                python_logger.info(msg)
+            try:
+                post_timeseries_chunks(self.masid, chunks)
+            except requests.RequestException as e:
+                logging.error("Logger error: " + str(e))
+                self._cond.acquire()
+                self.dropped += num
+                self._cond.release()
+                continue
+            self._cond.acquire()
+            self.shipped += num
+            self._cond.release()
 
 
 def send_timeseries_data(masid: int, ts_queue: queue.Queue):
@@ -196,12 +532,5 @@ def send_timeseries_data(masid: int, ts_queue: queue.Queue):
     wait for timeseries data in the queue and send them to logger (to be executed in seperate
     thread)
     """
-    log_on = os.environ['CLONEMAP_LOGGING']
-    while True:
-        ts = ts_queue.get()
-        if log_on == "ON":
-            tss = []
-            tss.append(ts)
-            post_logs(masid, tss)
-        else:
-            pass
+    shipper = TimeSeriesShipper(masid)
+    shipper.run(ts_queue)
@@ -0,0 +1,268 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements the internal representation of ACL messages.
+
+Within the agency and between the agency and its agents, messages are represented by Message
+objects instead of the pydantic model datamodels.ACLMessage. A Message stores the same fields in
+slots and is converted to and from an ACLMessage only at the agent API. Message objects are
+serialized to JSON compatible with ACLMessage without validation. Timestamps received via JSON are
+kept as strings and only parsed if the message is converted to an ACLMessage.
+
+A message to several receivers is represented by a Multicast. It is passed from the agent to the
+agency once and fanned out by the agency; the messages to all receivers at one remote agency are
+sent in one request, for which the message is encoded only once.
+
+Sampled messages additionally carry a trace, i.e. a list of (stage, time) pairs stamped on their way
+from sender to receiver (see module tracing). The trace is not part of ACLMessage; it is only
+included in the JSON representation if it is set.
+"""
+
+import json
+from datetime import datetime, timezone
+import clonemapy.datamodels as datamodels
+
+FIELDS = ("ts", "perf", "sender", "agencys", "receiver", "agencyr", "repto", "content", "lang",
+          "enc", "ont", "prot", "convid", "repwith", "inrepto", "repby")
+
+
+class Message:
+    """
+    ACL message used for routing within the agency; see datamodels.ACLMessage for the fields
+
+    Attributes
+    ----------
+    trace : list of tuple
+            stages passed by the message with time.monotonic() of each stage; None if the message
+            is not traced
+    """
+    __slots__ = FIELDS + ("trace",)
+
+    def __init__(self, receiver: int, content: str, ts=None, perf: int = 0, sender: int = 0,
+                 agencys: str = "", agencyr: str = "", repto: int = None, lang: str = None,
+                 enc: str = None, ont: str = None, prot: int = 0, convid: int = None,
+                 repwith: str = None, inrepto: str = None, repby: str = None,
+                 trace: list = None):
+        if ts is None:
+            ts = datetime.now()
+        self.ts = ts
+        self.perf = perf
+        self.sender = sender
+        self.agencys = agencys
+        self.receiver = receiver
+        self.agencyr = agencyr
+        self.repto = repto
+        self.content = content
+        self.lang = lang
+        self.enc = enc
+        self.ont = ont
+        self.prot = prot
+        self.convid = convid
+        self.repwith = repwith
+        self.inrepto = inrepto
+        self.repby = repby
+        self.trace = trace
+
+    def __getstate__(self):
+        return tuple([getattr(self, i) for i in FIELDS]) + (self.trace,)
+
+    def __setstate__(self, state):
+        for i, val in zip(FIELDS, state):
+            setattr(self, i, val)
+        self.trace = state[len(FIELDS)]
+
+    def __eq__(self, other):
+        if type(other) is not Message:
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __str__(self):
+        ret = "Sender: " + str(self.sender) + ";Receiver: " + str(self.receiver) + ";Timestamp: "
+        ret += str(self.ts) + ";Protocol: "
+        try:
+            ret += datamodels.FipaProtocol(self.prot).name
+        except ValueError:
+            ret += "Unknown(" + str(self.prot) + ")"
+        ret += ";Performative: "
+        try:
+            ret += datamodels.FipaPerformative(self.perf).name
+        except ValueError:
+            ret += "Unknown(" + str(self.perf) + ")"
+        ret += ";Content: " + self.content
+        return ret
+
+    def copy(self):
+        """
+        returns a shallow copy of the message
+        """
+        msg = Message.__new__(Message)
+        msg.__setstate__(self.__getstate__())
+        return msg
+
+    @classmethod
+    def from_acl(cls, acl: datamodels.ACLMessage):
+        """
+        creates a message from an ACLMessage
+        """
+        msg = cls.__new__(cls)
+        for i in FIELDS:
+            setattr(msg, i, getattr(acl, i))
+        msg.trace = None
+        return msg
+
+    def to_acl(self) -> datamodels.ACLMessage:
+        """
+        converts the message to an ACLMessage
+        """
+        fields = {}
+        for i in FIELDS:
+            fields[i] = getattr(self, i)
+        if isinstance(self.ts, str):
+            # timestamp has been received as string
+            return datamodels.ACLMessage(**fields)
+        # all other fields have been validated when the message was created
+        return datamodels.ACLMessage.construct(**fields)
+
+    @classmethod
+    def from_dict(cls, msg_dict: dict):
+        """
+        creates a message from a dict parsed from the JSON representation of an ACLMessage; the
+        timestamp is not parsed
+        """
+        msg = cls.__new__(cls)
+        for i in FIELDS:
+            setattr(msg, i, msg_dict.get(i, None))
+        msg.trace = msg_dict.get("trace", None)
+        if msg.ts is None:
+            msg.ts = datetime.now()
+        if msg.receiver is None or msg.content is None:
+            raise ValueError("receiver and content are required")
+        msg.perf = int(msg.perf or 0)
+        msg.sender = int(msg.sender or 0)
+        msg.receiver = int(msg.receiver)
+        msg.prot = int(msg.prot or 0)
+        msg.agencys = msg.agencys or ""
+        msg.agencyr = msg.agencyr or ""
+        return msg
+
+    def to_dict(self) -> dict:
+        """
+        returns the JSON compatible dict representation of the message
+        """
+        msg_dict = {}
+        for i in FIELDS:
+            msg_dict[i] = getattr(self, i)
+        if isinstance(self.ts, datetime):
+            ts = self.ts
+            if ts.tzinfo is not None:
+                # timestamps parsed from JSON are timezone aware
+                ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+            msg_dict["ts"] = ts.isoformat("T") + "Z"
+        if self.trace is not None:
+            msg_dict["trace"] = self.trace
+        return msg_dict
+
+    def to_json(self) -> str:
+        """
+        returns the JSON representation of the message (equal to ACLMessage.json() unless the
+        message is traced)
+        """
+        return json.dumps(self.to_dict())
+
+
+class Multicast:
+    """
+    message to several receivers
+
+    Attributes
+    ----------
+    msg : Message
+          message sent to each receiver; its receiver field is ignored
+    receivers : list of int
+                IDs of the receivers
+    """
+    __slots__ = ("msg", "receivers")
+
+    def __init__(self, msg: Message, receivers: list):
+        self.msg = msg
+        self.receivers = receivers
+
+    def __getstate__(self):
+        return (self.msg, self.receivers)
+
+    def __setstate__(self, state):
+        self.msg, self.receivers = state
+
+    def split(self) -> list:
+        """
+        returns a copy of the message for each receiver
+        """
+        msgs = []
+        for i in self.receivers:
+            msg = self.msg.copy()
+            msg.receiver = i
+            msgs.append(msg)
+        return msgs
+
+    def to_json(self) -> str:
+        """
+        returns the comma separated JSON representations of the message to each receiver; all
+        fields but the receiver are encoded once
+        """
+        msg_dict = self.msg.to_dict()
+        del msg_dict["receiver"]
+        tail = json.dumps(msg_dict)[1:]
+        return ",".join(['{"receiver": ' + str(i) + ', ' + tail for i in self.receivers])
+
+
+def expand(items: list) -> list:
+    """
+    returns the messages contained in a list of Message and Multicast
+    """
+    msgs = []
+    for i in items:
+        if type(i) is Multicast:
+            msgs.extend(i.split())
+        else:
+            msgs.append(i)
+    return msgs
@@ -0,0 +1,302 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements metrics of the agency in the Prometheus text exposition format.
+
+Counters, gauges and histograms are registered in a Registry and updated by the agency. Values that
+are already counted elsewhere (e.g. queue depths or the statistics of connection pools) are
+collected by callbacks when the metrics are rendered.
+"""
+
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    """
+    Metric family with a value for each combination of label values
+
+    Attributes
+    ----------
+    name : string
+           name of the metric
+    doc : string
+          help text
+    labelnames : tuple of string
+                 names of the labels
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = ()):
+        super().__init__()
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        returns the child for the given label values
+        """
+        values = tuple([str(i) for i in values])
+        child = self._children.get(values, None)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("wrong number of labels for " + self.name)
+            self._lock.acquire()
+            child = self._children.get(values, None)
+            if child is None:
+                child = self._new_child()
+                self._children[values] = child
+            self._lock.release()
+        return child
+
+    def remove(self, *values):
+        """
+        removes the child for the given label values
+        """
+        self._lock.acquire()
+        self._children.pop(tuple([str(i) for i in values]), None)
+        self._lock.release()
+
+    def _new_child(self):
+        return _Value()
+
+    def render(self, lines: list):
+        """
+        appends the text representation of the metric to lines
+        """
+        lines.append("# HELP " + self.name + " " + self.doc)
+        lines.append("# TYPE " + self.name + " " + self.type)
+        self._lock.acquire()
+        children = list(self._children.items())
+        self._lock.release()
+        for values, child in children:
+            child.render(self.name, _labels(self.labelnames, values), lines)
+
+
+class Counter(Metric):
+    """
+    monotonically increasing value
+    """
+    type = "counter"
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """
+    value that can go up and down
+    """
+    type = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    """
+    distribution of observed values in cumulative buckets
+
+    Attributes
+    ----------
+    buckets : tuple of float
+              upper bounds of the buckets (without +Inf)
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        self._lock.acquire()
+        self.value += amount
+        self._lock.release()
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self, name: str, labels: str, lines: list):
+        lines.append(name + _braces(labels) + " " + _format(self.value))
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0]*len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        self._lock.acquire()
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+        self._lock.release()
+
+    def render(self, name: str, labels: str, lines: list):
+        self._lock.acquire()
+        counts = list(self.counts)
+        total = self.sum
+        count = self.count
+        self._lock.release()
+        sep = ","
+        if labels == "":
+            sep = ""
+        cumulative = 0
+        for bound, num in zip(self.buckets, counts):
+            cumulative += num
+            lines.append(name + "_bucket{" + labels + sep + 'le="' + _format(bound) + '"} ' +
+                         str(cumulative))
+        lines.append(name + "_bucket{" + labels + sep + 'le="+Inf"} ' + str(count))
+        lines.append(name + "_sum" + _braces(labels) + " " + _format(total))
+        lines.append(name + "_count" + _braces(labels) + " " + str(count))
+
+
+class Registry:
+    """
+    Collection of metrics and callbacks rendered together
+    """
+    def __init__(self):
+        super().__init__()
+        self._metrics = []
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        adds a metric to the registry and returns it
+        """
+        self._lock.acquire()
+        self._metrics.append(metric)
+        self._lock.release()
+        return metric
+
+    def counter(self, name: str, doc: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, doc, labelnames))
+
+    def gauge(self, name: str, doc: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, doc, labelnames))
+
+    def histogram(self, name: str, doc: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, doc, labelnames, buckets))
+
+    def register_callback(self, callback):
+        """
+        adds a function which returns a list of metrics each time the registry is rendered
+        """
+        self._lock.acquire()
+        self._callbacks.append(callback)
+        self._lock.release()
+
+    def render(self) -> str:
+        """
+        returns all metrics in the Prometheus text format
+        """
+        self._lock.acquire()
+        metrics = list(self._metrics)
+        callbacks = list(self._callbacks)
+        self._lock.release()
+        for callback in callbacks:
+            metrics.extend(callback())
+        lines = []
+        for metric in metrics:
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(name + '="' + value + '"')
+    return ",".join(pairs)
+
+
+def _braces(labels: str) -> str:
+    if labels == "":
+        return ""
+    return "{" + labels + "}"
+
+
+def _format(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        if value > 0:
+            return "+Inf"
+        return "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
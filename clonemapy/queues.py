@@ -0,0 +1,336 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements overflow policies for the queues between agents, agency and the remote
+agencies.
+
+An OverflowQueue wraps a queue (queue.Queue, multiprocessing.Queue or ipc.ShmQueue) and decides what
+happens if an item is added to the full queue:
+
+- "block": the producer waits until there is space; the item is dropped if the queue is still full
+  after the timeout (0 waits forever)
+- "drop_newest": the new item is dropped
+- "drop_oldest": the oldest item in the queue is dropped to make room for the new item
+- "spill": the item is written to a temporary file of the producer process and moved to the queue
+  by a background thread as soon as there is space again; items keep their order
+
+The policy of each queue is set by the environment variables CLONEMAP_QUEUE_<NAME>_POLICY,
+CLONEMAP_QUEUE_<NAME>_SIZE and CLONEMAP_QUEUE_<NAME>_TIMEOUT (ms), where <NAME> is one of MSG_IN,
+MSG_OUT, LOG_OUT, TS_OUT and REMOTE. The directory for spilled items is set by
+CLONEMAP_QUEUE_SPILL_DIR.
+
+The high-water mark, the number of dropped items and the number of spilled items are kept in shared
+memory so that they include the producers in all agent processes.
+"""
+
+import os
+import queue
+import pickle
+import struct
+import logging
+import tempfile
+import threading
+import multiprocessing
+import clonemapy.config as config
+
+POLICIES = ("block", "drop_newest", "drop_oldest", "spill")
+
+_LEN = struct.Struct("<I")
+
+
+class OverflowQueue:
+    """
+    Queue applying an overflow policy when items are added to the wrapped queue; provides the
+    interface of multiprocessing.Queue
+
+    Attributes
+    ----------
+    queue : queue.Queue, multiprocessing.Queue or ipc.ShmQueue
+            wrapped queue; items added directly to this queue bypass the policy
+    name : string
+           name of the queue
+    policy : string
+             overflow policy (one of POLICIES)
+    timeout : float
+              maximum time in seconds a producer blocks (policy "block", None waits forever)
+    """
+    def __init__(self, q, name: str, policy: str = "block", timeout: float = None):
+        super().__init__()
+        if policy not in POLICIES:
+            logging.error("Invalid queue policy for " + name + ": " + policy)
+            policy = "block"
+        if policy == "drop_oldest" and not getattr(q, "multi_consumer", True):
+            # the producer must not consume from a queue with a single consumer
+            logging.error("Queue " + name + " does not support drop_oldest; using drop_newest")
+            policy = "drop_newest"
+        self.queue = q
+        self.name = name
+        self.policy = policy
+        self.timeout = timeout
+        self._high_water = multiprocessing.Value("q", 0)
+        self._dropped = multiprocessing.Value("q", 0)
+        self._spilled = multiprocessing.Value("q", 0)
+        self._init_local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for i in ("_lock", "_spill", "_drainer", "_pid"):
+            del state[i]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local()
+
+    def _init_local(self):
+        """
+        initializes the state which is local to the producer process
+        """
+        self._lock = threading.Lock()
+        self._spill = None
+        self._drainer = None
+        self._pid = os.getpid()
+
+    def put(self, item, block: bool = True, timeout: float = None) -> bool:
+        """
+        adds item to the queue according to the policy; returns False if an item has been dropped
+        """
+        if self.policy == "spill":
+            return self._put_spill(item)
+        try:
+            if self.policy == "block":
+                self.queue.put(item, True, self.timeout)
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            if self.policy != "drop_oldest":
+                self._count_drop()
+                return False
+            self._put_drop_oldest(item)
+            return False
+        self._update_high_water()
+        return True
+
+    def put_nowait(self, item) -> bool:
+        return self.put(item, False)
+
+    def get(self, block: bool = True, timeout: float = None):
+        return self.queue.get(block, timeout)
+
+    def get_nowait(self):
+        return self.queue.get(False)
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    def empty(self) -> bool:
+        return self.queue.empty()
+
+    def stats(self) -> dict:
+        """
+        returns the current depth, the high-water mark and the numbers of dropped and spilled items
+        """
+        try:
+            depth = self.queue.qsize()
+        except NotImplementedError:
+            depth = -1
+        return {"depth": depth, "high_water": self._high_water.value,
+                "dropped": self._dropped.value, "spilled": self._spilled.value}
+
+    def _count_drop(self):
+        with self._dropped.get_lock():
+            self._dropped.value += 1
+
+    def _update_high_water(self):
+        try:
+            depth = self.queue.qsize()
+        except NotImplementedError:
+            return
+        if depth > self._high_water.value:
+            with self._high_water.get_lock():
+                if depth > self._high_water.value:
+                    self._high_water.value = depth
+
+    def _put_drop_oldest(self, item):
+        """
+        removes the oldest items from the queue until item fits
+        """
+        while True:
+            try:
+                self.queue.get_nowait()
+                self._count_drop()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+                break
+            except queue.Full:
+                continue
+        self._update_high_water()
+
+    def _put_spill(self, item) -> bool:
+        """
+        adds item to the queue or to the spill file if the queue is full or items are waiting in
+        the spill file
+        """
+        if self._pid != os.getpid():
+            self._init_local()
+        self._lock.acquire()
+        try:
+            if self._spill is None or len(self._spill) == 0:
+                try:
+                    self.queue.put_nowait(item)
+                    self._update_high_water()
+                    return True
+                except queue.Full:
+                    pass
+            if self._spill is None:
+                self._spill = SpillFile(config.get_str("CLONEMAP_QUEUE_SPILL_DIR", None))
+            self._spill.push(item)
+            with self._spilled.get_lock():
+                self._spilled.value += 1
+            if self._drainer is None or not self._drainer.is_alive():
+                self._drainer = threading.Thread(target=self._drain, daemon=True)
+                self._drainer.start()
+        finally:
+            self._lock.release()
+        return True
+
+    def _drain(self):
+        """
+        moves spilled items to the queue (to be executed in seperate thread)
+        """
+        while True:
+            self._lock.acquire()
+            if len(self._spill) == 0:
+                self._drainer = None
+                self._lock.release()
+                return
+            item = self._spill.peek()
+            self._lock.release()
+            # new items are spilled as long as the spill file is not empty, hence the order is kept
+            while True:
+                try:
+                    self.queue.put(item, True, 0.1)
+                    break
+                except queue.Full:
+                    continue
+            self._lock.acquire()
+            self._spill.pop()
+            self._lock.release()
+            with self._spilled.get_lock():
+                self._spilled.value -= 1
+            self._update_high_water()
+
+
+class SpillFile:
+    """
+    FIFO of pickled items in a temporary file; the file is truncated whenever it runs empty
+    """
+    def __init__(self, directory: str = None):
+        super().__init__()
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._read = 0
+        self._write = 0
+        self._num = 0
+
+    def __len__(self):
+        return self._num
+
+    def push(self, item):
+        data = pickle.dumps(item)
+        self._file.seek(self._write)
+        self._file.write(_LEN.pack(len(data)))
+        self._file.write(data)
+        self._write = self._file.tell()
+        self._num += 1
+
+    def peek(self):
+        self._file.seek(self._read)
+        length, = _LEN.unpack(self._file.read(_LEN.size))
+        return pickle.loads(self._file.read(length))
+
+    def pop(self):
+        self._file.seek(self._read)
+        length, = _LEN.unpack(self._file.read(_LEN.size))
+        self._read += _LEN.size + length
+        self._num -= 1
+        if self._num == 0:
+            self._file.seek(0)
+            self._file.truncate()
+            self._read = 0
+            self._write = 0
+
+
+def wrap(name: str, q, default_policy: str = "block") -> OverflowQueue:
+    """
+    wraps q in an OverflowQueue with the policy configured for name
+    """
+    policy = config.get_str("CLONEMAP_QUEUE_" + name + "_POLICY", default_policy)
+    timeout = config.get_float("CLONEMAP_QUEUE_" + name + "_TIMEOUT", 0)/1000
+    if timeout <= 0:
+        timeout = None
+    return OverflowQueue(q, name, policy, timeout)
+
+
+def new_queue(name: str, size: int, factory=queue.Queue,
+              default_policy: str = "block") -> OverflowQueue:
+    """
+    creates a queue with factory and the size configured for name (size by default) and wraps it
+    in an OverflowQueue
+    """
+    size = config.get_int("CLONEMAP_QUEUE_" + name + "_SIZE", size)
+    return wrap(name, factory(size), default_policy)
+
+
+def merge_stats(stats: list) -> dict:
+    """
+    sums up the stats of several queues of the same kind; the high-water mark is the maximum
+    """
+    ret = {"depth": 0, "high_water": 0, "dropped": 0, "spilled": 0}
+    for i in stats:
+        ret["depth"] += max(i["depth"], 0)
+        ret["high_water"] = max(ret["high_water"], i["high_water"])
+        ret["dropped"] += i["dropped"]
+        ret["spilled"] += i["spilled"]
+    return ret
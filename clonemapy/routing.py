@@ -0,0 +1,137 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+This module implements the routing table of the agency. It maps the IDs of local agents to their
+handlers, the IDs of remote agents to the queue of their agency and the addresses of remote
+agencies to their queues.
+
+The table is optimized for lookups, which are done for each message, while the membership of
+agents and agencies changes rarely. Lookups do not acquire a lock. The dictionaries of local agents
+and remote agencies are copied on write: a writer copies the dictionary, modifies the copy and
+replaces the attribute, so that readers always see a complete dictionary that is never modified
+and may be iterated without lock. The remote agents are a cache that grows with the number of
+receivers; entries are set and removed in place, which is atomic for single operations on a
+dictionary. Writers are serialized by a lock.
+"""
+
+import threading
+
+
+class RoutingTable:
+    """
+    routing state of the agency
+
+    Attributes
+    ----------
+    local : dictionary of agency.AgentHandler
+            handler of each local agent by agent ID (copied on write)
+    remote : dictionary of queues.OverflowQueue
+             queue of the agency of each known remote agent by agent ID
+    agencies : dictionary of queues.OverflowQueue
+               queue of each remote agency by address (copied on write)
+    """
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.local = {}
+        self.remote = {}
+        self.agencies = {}
+
+    def local_agent(self, agentid: int):
+        """
+        returns the handler of the local agent or None
+        """
+        return self.local.get(agentid, None)
+
+    def add_local(self, agentid: int, handler):
+        """
+        adds the handler of a local agent
+        """
+        self._lock.acquire()
+        local = dict(self.local)
+        local[agentid] = handler
+        self.local = local
+        self._lock.release()
+
+    def remove_local(self, agentid: int):
+        """
+        removes the local agent and returns its handler or None if it does not exist
+        """
+        self._lock.acquire()
+        handler = self.local.get(agentid, None)
+        if handler is not None:
+            local = dict(self.local)
+            del local[agentid]
+            self.local = local
+        self._lock.release()
+        return handler
+
+    def set_remote(self, agentid: int, agency):
+        """
+        stores the queue of the agency of a remote agent
+        """
+        self.remote[agentid] = agency
+
+    def remove_remote(self, agentids: list):
+        """
+        removes the cached agencies of remote agents
+        """
+        for i in agentids:
+            self.remote.pop(i, None)
+
+    def agency(self, address: str, create=None):
+        """
+        returns the queue of the remote agency; if the agency is unknown and create is given, the
+        queue returned by create(address) is added, otherwise None is returned
+        """
+        agency = self.agencies.get(address, None)
+        if agency is not None or create is None:
+            return agency
+        self._lock.acquire()
+        agency = self.agencies.get(address, None)
+        if agency is None:
+            agency = create(address)
+            agencies = dict(self.agencies)
+            agencies[address] = agency
+            self.agencies = agencies
+        self._lock.release()
+        return agency
@@ -0,0 +1,556 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements in-process stand-ins for the clonemap services required by an agency. They
+allow to execute agencies outside of a Kubernetes cluster, e.g. for benchmarks or in the local mode
+(see local).
+
+StandInAMS serves the parts of the AMS API that are used by the agency: the configuration of each
+agency, the list of all agents and the address of single agents. The agencies are added with their
+agents before they are started; the agencies have to be configured with the environment variables
+CLONEMAP_AMS_HOST, CLONEMAP_AGENCY_HOSTNAME and CLONEMAP_AGENCY_NAME (see agency.Agency).
+
+StandInLogger and StandInDF keep logs, states and services in memory. They are used by setting
+CLONEMAP_LOGGER_HOST and CLONEMAP_DF_HOST of the agencies to their host.
+"""
+
+import json
+import socket
+import threading
+import logging
+import collections
+import http.server as server
+import socketserver
+from urllib.parse import unquote
+from typing import List
+import clonemapy.datamodels as datamodels
+import clonemapy.graphindex as graphindex
+
+
+class StandInHTTPServer(socketserver.ThreadingMixIn, server.HTTPServer):
+    """
+    http server handling each connection in a seperate thread
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandInService:
+    """
+    base class of the stand-ins; serves the requests with handler_class in a seperate thread
+
+    Attributes
+    ----------
+    port : integer
+           port of the http server
+    """
+    def __init__(self, handler_class, port: int = 0):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._httpd = StandInHTTPServer(("127.0.0.1", port), handler_class)
+        self._httpd.service = self
+        self.port = self._httpd.server_address[1]
+
+    @property
+    def host(self) -> str:
+        """
+        address of the http server
+        """
+        return "127.0.0.1:" + str(self.port)
+
+    def start(self):
+        """
+        starts the http server in a seperate thread
+        """
+        x = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        x.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StandInHandler(server.BaseHTTPRequestHandler):
+    """
+    base class of the handlers of the stand-ins
+    """
+    protocol_version = "HTTP/1.1"
+
+    def read_body(self) -> str:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length).decode()
+
+    def send_body(self, code: int, content_type: str, ret: str):
+        body = ret.encode()
+        self.send_response(code)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_result(self, code: int, ret: str):
+        """
+        sends ret as json or 404 if ret is None
+        """
+        if ret is None:
+            self.send_body(404, "text/plain", "Not Found")
+        else:
+            self.send_body(code, "application/json", ret)
+
+    def log_message(self, format, *args):
+        logging.debug("StandIn: " + format % args)
+
+
+class StandInAMS(StandInService):
+    """
+    Stand-in for the AMS of one MAS
+
+    Attributes
+    ----------
+    masid : integer
+            ID of MAS
+    mas_name : string
+               name of MAS
+    mas_custom : string
+                 custom configuration of MAS
+    agencies : dictionary of datamodels.AgencyInfoFull
+               configuration of each agency by agency ID
+    port : integer
+           port of the http server
+    """
+    def __init__(self, masid: int = 0, mas_name: str = "standin", port: int = 0,
+                 mas_custom: str = ""):
+        super().__init__(AMSHandler, port)
+        self.masid = masid
+        self.mas_name = mas_name
+        self.mas_custom = mas_custom
+        self.agencies = {}
+
+    def add_agency(self, agencyid: int, name: str, agents: List[datamodels.AgentSpec],
+                   first_id: int, logger_config: datamodels.LoggerConfig = None) -> list:
+        """
+        adds an agency executing the given agents; the agents get consecutive IDs starting at
+        first_id; returns the infos of the agents
+        """
+        if logger_config is None:
+            logger_config = datamodels.LoggerConfig()
+        infos = []
+        for i, spec in enumerate(agents):
+            status = datamodels.Status(code=datamodels.StatusCode.Running)
+            info = datamodels.AgentInfo(spec=spec, masid=self.masid, agencyid=agencyid, imid=0,
+                                        id=first_id+i, address=datamodels.Address(agency=name),
+                                        status=status)
+            infos.append(info)
+        agency = datamodels.AgencyInfoFull(masid=self.masid, id=agencyid, name=name, imid=0,
+                                           masname=self.mas_name, mascustom=self.mas_custom,
+                                           logger=logger_config, agents=infos)
+        self._lock.acquire()
+        self.agencies[agencyid] = agency
+        self._lock.release()
+        return infos
+
+    def hostname(self, agencyid: int) -> str:
+        """
+        returns the hostname of the agency to be used as CLONEMAP_AGENCY_HOSTNAME
+        """
+        return "mas-" + str(self.masid) + "-im-0-agency-" + str(agencyid)
+
+    def agency(self, agencyid: int) -> datamodels.AgencyInfoFull:
+        """
+        returns the configuration of the agency or None if it does not exist
+        """
+        self._lock.acquire()
+        agency = self.agencies.get(agencyid, None)
+        self._lock.release()
+        return agency
+
+    def agents(self) -> datamodels.Agents:
+        """
+        returns the agents of all agencies
+        """
+        self._lock.acquire()
+        instances = []
+        for agency in self.agencies.values():
+            instances.extend(agency.agents)
+        self._lock.release()
+        return datamodels.Agents(counter=len(instances), instances=instances)
+
+
+class AMSHandler(StandInHandler):
+    """
+    Handler for requests to the stand-in AMS
+    """
+    def do_GET(self):
+        """
+        handler function for GET requests
+        """
+        ams = self.server.service
+        path = self.path.split("/")
+        ret = None
+        # /api/clonemap/mas/{masid}/...
+        if len(path) >= 6 and path[1:4] == ["api", "clonemap", "mas"]:
+            if len(path) == 6 and path[5] == "agents":
+                ret = ams.agents().json()
+            elif len(path) == 8 and path[5] == "agents" and path[7] == "address":
+                for agent in ams.agents().instances:
+                    if str(agent.id) == path[6]:
+                        ret = agent.address.json()
+            elif len(path) == 9 and path[5] == "imgroup" and path[7] == "agency":
+                agency = ams.agency(int(path[8]))
+                if agency is not None:
+                    ret = agency.json()
+        elif self.path == "/api/alive":
+            ret = ""
+        self.send_result(200, ret)
+
+
+class StandInLogger(StandInService):
+    """
+    Stand-in for the logger; keeps the latest logs of each agent and topic and the latest state of
+    each agent; time series samples are only counted
+
+    Attributes
+    ----------
+    max_logs : integer
+               number of logs kept per agent and topic
+    echo : boolean
+           write received logs to the log of the process
+    logs : dictionary of collections.deque
+           latest logs (as dictionaries) by MAS ID, agent ID and topic
+    states : dictionary of dictionaries
+             latest state by MAS ID and agent ID
+    samples : integer
+              number of received time series samples
+    """
+    def __init__(self, port: int = 0, max_logs: int = 1000, echo: bool = False):
+        super().__init__(LoggerHandler, port)
+        self.max_logs = max_logs
+        self.echo = echo
+        self.logs = {}
+        self.states = {}
+        self.samples = 0
+
+    def add_logs(self, logs: list):
+        """
+        stores a list of log dictionaries
+        """
+        self._lock.acquire()
+        for log in logs:
+            key = (log.get("masid", 0), log.get("agentid", 0), log.get("topic", ""))
+            topic_logs = self.logs.get(key, None)
+            if topic_logs is None:
+                topic_logs = collections.deque(maxlen=self.max_logs)
+                self.logs[key] = topic_logs
+            topic_logs.append(log)
+        self._lock.release()
+        if self.echo:
+            for log in logs:
+                logging.info("Agent " + str(log.get("agentid", 0)) + " [" + log.get("topic", "") +
+                             "]: " + log.get("msg", "") + " " + str(log.get("data", "")))
+
+    def latest_logs(self, masid: int, agentid: int, topic: str, num: int) -> list:
+        """
+        returns the latest num logs of the agent and topic, the latest first
+        """
+        self._lock.acquire()
+        topic_logs = list(self.logs.get((masid, agentid, topic), ()))
+        self._lock.release()
+        topic_logs.reverse()
+        return topic_logs[:num]
+
+    def add_samples(self, num: int):
+        self._lock.acquire()
+        self.samples += num
+        self._lock.release()
+
+    def set_states(self, states: list):
+        """
+        stores a list of state dictionaries
+        """
+        self._lock.acquire()
+        for state in states:
+            self.states[(state.get("masid", 0), state.get("agentid", 0))] = state
+        self._lock.release()
+
+    def state(self, masid: int, agentid: int) -> dict:
+        """
+        returns the state of the agent or None if it does not exist
+        """
+        self._lock.acquire()
+        state = self.states.get((masid, agentid), None)
+        self._lock.release()
+        return state
+
+
+class LoggerHandler(StandInHandler):
+    """
+    Handler for requests to the stand-in logger
+    """
+    def do_GET(self):
+        """
+        handler function for GET requests
+        """
+        lg = self.server.service
+        path = self.path.split("/")
+        ret = None
+        try:
+            if self.path == "/api/alive":
+                ret = ""
+            elif len(path) == 8 and path[1:3] == ["api", "logging"] and path[6] == "latest":
+                ret = json.dumps(lg.latest_logs(int(path[3]), int(path[4]), path[5],
+                                                int(path[7])))
+            elif len(path) == 5 and path[1:3] == ["api", "state"]:
+                state = lg.state(int(path[3]), int(path[4]))
+                if state is not None:
+                    ret = json.dumps(state)
+        except ValueError:
+            self.send_body(400, "text/plain", "Bad Request")
+            return
+        self.send_result(200, ret)
+
+    def do_POST(self):
+        """
+        handler function for POST requests
+        """
+        lg = self.server.service
+        path = self.path.split("/")
+        ret = None
+        try:
+            body = json.loads(self.read_body())
+            if len(path) == 5 and path[1:3] == ["api", "logging"] and path[4] == "list":
+                lg.add_logs(body)
+                ret = ""
+            elif len(path) == 4 and path[1:3] == ["api", "series"]:
+                lg.add_samples(len(body))
+                ret = ""
+            elif len(path) == 5 and path[1:3] == ["api", "state"]:
+                if path[4] == "list":
+                    lg.set_states(body)
+                else:
+                    lg.set_states([body])
+                ret = ""
+        except (ValueError, AttributeError):
+            self.send_body(400, "text/plain", "Bad Request")
+            return
+        self.send_result(201, ret)
+
+
+class StandInDF(StandInService):
+    """
+    Stand-in for the DF; keeps the registered services and the graph of each MAS
+
+    Attributes
+    ----------
+    services : dictionary of dictionaries
+               registered services by MAS ID and service ID
+    graphs : dictionary of strings
+             graph of each MAS as json
+    """
+    def __init__(self, port: int = 0):
+        super().__init__(DFHandler, port)
+        self.services = {}
+        self.graphs = {}
+        self._indexes = {}
+        self._counter = 0
+
+    def register(self, masid: int, svc: dict) -> dict:
+        """
+        stores the service and returns it with its new ID
+        """
+        self._lock.acquire()
+        self._counter += 1
+        svc["id"] = str(self._counter)
+        svc["masid"] = masid
+        self.services.setdefault(masid, {})[svc["id"]] = svc
+        self._lock.release()
+        return svc
+
+    def deregister(self, masid: int, svcid: str) -> bool:
+        """
+        removes the service; returns False if it does not exist
+        """
+        self._lock.acquire()
+        svc = self.services.get(masid, {}).pop(svcid, None)
+        self._lock.release()
+        return svc is not None
+
+    def search(self, masid: int, desc: str) -> list:
+        """
+        returns all services of the MAS with matching description
+        """
+        self._lock.acquire()
+        svcs = [i for i in self.services.get(masid, {}).values() if i.get("desc", "") == desc]
+        self._lock.release()
+        return svcs
+
+    def search_local(self, masid: int, desc: str, nodeid: int, dist: float) -> list:
+        """
+        returns all services with matching description within distance of the node; without graph
+        only the services of the node itself are returned
+        """
+        self._lock.acquire()
+        index = self._indexes.get(masid, None)
+        self._lock.release()
+        dists = {nodeid: 0}
+        if index is not None:
+            dists = index.distances(nodeid)
+        svcs = []
+        for svc in self.search(masid, desc):
+            d = dists.get(svc.get("nodeid", 0), None)
+            if d is not None and d <= dist:
+                svc = dict(svc)
+                svc["dist"] = d
+                svcs.append(svc)
+        return svcs
+
+    def set_graph(self, masid: int, graph: str):
+        """
+        stores the graph of the MAS given as json
+        """
+        index = graphindex.GraphIndex(datamodels.Graph.parse_raw(graph))
+        self._lock.acquire()
+        self.graphs[masid] = graph
+        self._indexes[masid] = index
+        self._lock.release()
+
+    def graph(self, masid: int) -> str:
+        """
+        returns the graph of the MAS as json or None if it does not exist
+        """
+        self._lock.acquire()
+        graph = self.graphs.get(masid, None)
+        self._lock.release()
+        return graph
+
+
+class DFHandler(StandInHandler):
+    """
+    Handler for requests to the stand-in DF
+    """
+    def do_GET(self):
+        """
+        handler function for GET requests
+        """
+        df = self.server.service
+        path = [unquote(i) for i in self.path.split("/")]
+        ret = None
+        try:
+            if self.path == "/api/alive":
+                ret = ""
+            elif len(path) >= 5 and path[1:3] == ["api", "df"]:
+                masid = int(path[3])
+                if len(path) == 5 and path[4] == "graph":
+                    ret = df.graph(masid)
+                elif len(path) == 7 and path[4:6] == ["svc", "desc"]:
+                    ret = json.dumps(df.search(masid, path[6]))
+                elif len(path) == 11 and path[4:6] == ["svc", "desc"] and path[7] == "node":
+                    ret = json.dumps(df.search_local(masid, path[6], int(path[8]),
+                                                     float(path[10])))
+        except ValueError:
+            self.send_body(400, "text/plain", "Bad Request")
+            return
+        self.send_result(200, ret)
+
+    def do_POST(self):
+        """
+        handler function for POST requests
+        """
+        df = self.server.service
+        path = self.path.split("/")
+        ret = None
+        try:
+            if len(path) == 5 and path[1:3] == ["api", "df"]:
+                masid = int(path[3])
+                body = self.read_body()
+                if path[4] == "svc":
+                    ret = json.dumps(df.register(masid, json.loads(body)))
+                elif path[4] == "graph":
+                    datamodels.Graph.parse_raw(body)
+                    df.set_graph(masid, body)
+                    ret = ""
+        except (ValueError, TypeError):
+            self.send_body(400, "text/plain", "Bad Request")
+            return
+        self.send_result(201, ret)
+
+    def do_DELETE(self):
+        """
+        handler function for DELETE requests
+        """
+        df = self.server.service
+        path = [unquote(i) for i in self.path.split("/")]
+        ret = None
+        try:
+            if len(path) == 7 and path[1:3] == ["api", "df"] and path[4:6] == ["svc", "id"]:
+                if df.deregister(int(path[3]), path[6]):
+                    ret = ""
+        except ValueError:
+            self.send_body(400, "text/plain", "Bad Request")
+            return
+        self.send_result(200, ret)
+
+
+def agent_specs(num: int, custom: list = None) -> List[datamodels.AgentSpec]:
+    """
+    returns num agent specs; custom contains the custom configuration of each agent
+    """
+    specs = []
+    for i in range(num):
+        cust = None
+        if custom is not None:
+            cust = custom[i]
+            if not isinstance(cust, str):
+                cust = json.dumps(cust)
+        specs.append(datamodels.AgentSpec(nodeid=0, name="agent"+str(i), custom=cust))
+    return specs
+
+
+def free_port() -> int:
+    """
+    returns a currently unused tcp port
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
@@ -0,0 +1,148 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements the tracing of the latency of ACL messages.
+
+A share of CLONEMAP_TRACE_SAMPLE (0 to 1, default 0) of all messages sent by agents is traced. A
+traced message carries a list of (stage, time) pairs; each stage stamps the time at which it has
+finished processing the message:
+
+- send: message has been passed to ACL.send_message
+- msg_out: message has been taken from the queue of outgoing messages by the agency
+- dispatch: message has been routed and is added to the queue of its receiver or remote agency
+- remote_queue: message has been taken from the queue of the remote agency for sending
+- recv: request containing the message has been received by the remote agency
+- handle_post: message has been parsed and is added to the queue of its receiver
+- msg_in: message has been taken from the queue of incoming messages by the receiving agent
+- route: message has been routed to the behavior or queue of the receiving agent
+
+Times are taken from time.monotonic(), which is shared by all processes on one host, but not among
+hosts. Therefore, send and recv start a new segment and the latency of a stage is the time since the
+previous stamp within the same segment. The network latency between agencies is covered by the
+request latency measured by the sending agency.
+
+Once the message has been routed, the receiving agent reports the trace to the agency via the
+time series queue. The agency aggregates the latencies in one histogram per stage.
+"""
+
+import time
+import clonemapy.metrics as metrics
+
+SEGMENT_START = ("send", "recv")
+
+
+class TraceReport:
+    """
+    Trace of a message reported by the receiving agent to the agency
+
+    Attributes
+    ----------
+    trace : list of tuple
+            stages and times of the message
+    """
+    __slots__ = ("trace",)
+
+    def __init__(self, trace: list):
+        self.trace = trace
+
+    def __getstate__(self):
+        return self.trace
+
+    def __setstate__(self, state):
+        self.trace = state
+
+
+def start(msg, stage: str = "send", now: float = None):
+    """
+    starts a new segment of the trace of the message
+    """
+    if now is None:
+        now = time.monotonic()
+    if msg.trace is None:
+        msg.trace = []
+    msg.trace.append([stage, now])
+
+
+def stamp(msg, stage: str):
+    """
+    stamps the current time for stage if the message is traced
+    """
+    if msg.trace is not None:
+        msg.trace.append([stage, time.monotonic()])
+
+
+def durations(trace: list) -> list:
+    """
+    returns the latency of each stage of the trace as list of (stage, seconds)
+    """
+    ret = []
+    prev = None
+    for stage, t in trace:
+        if stage not in SEGMENT_START and prev is not None:
+            ret.append((stage, t - prev))
+        prev = t
+    return ret
+
+
+class Tracer:
+    """
+    Aggregates the traces reported by agents in a histogram per stage
+
+    Attributes
+    ----------
+    stages : metrics.Histogram
+             latency of each stage
+    """
+    def __init__(self, registry: metrics.Registry):
+        super().__init__()
+        self.stages = registry.histogram("clonemap_message_stage_seconds",
+                                         "Latency of the stages of traced messages", ("stage",))
+
+    def report(self, item):
+        """
+        adds a reported trace to the histograms; items other than TraceReport are ignored
+        """
+        if not isinstance(item, TraceReport):
+            return
+        for stage, duration in durations(item.trace):
+            self.stages.labels(stage).observe(duration)
@@ -0,0 +1,208 @@
+# Copyright 2020 Institute for Automation of Complex Power Systems,
+# E.ON Energy Research Center, RWTH Aachen University
+#
+# This project is licensed under either of
+# - Apache License, Version 2.0
+# - MIT License
+# at your option.
+#
+# Apache License, Version 2.0:
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# MIT License:
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module implements the http transport among agencies.
+
+Messages to a remote agency are sent via persistent HTTP/1.1 connections. For each remote agency a
+ConnectionPool is created which keeps a limited number of idle connections open and reuses them for
+subsequent requests.
+"""
+
+import http.client
+import threading
+import time
+import logging
+
+
+class ConnectionPool:
+    """
+    Pool of persistent http connections to one remote agency
+
+    Attributes
+    ----------
+    host : string
+           host of remote agency
+    port : integer
+           port of remote agency (10000 if address does not contain a port)
+    size : integer
+           maximum number of concurrently used connections
+    idle_timeout : float
+                   time in seconds after which an idle connection is closed instead of being
+                   reused; must be lower than the idle timeout of the server
+    timeout : float
+              socket timeout for requests in seconds
+    """
+    def __init__(self, address: str, size: int, idle_timeout: float, timeout: float = 60):
+        super().__init__()
+        host, sep, port = address.rpartition(":")
+        if sep == "" or not port.isdigit():
+            host = address
+            port = 10000
+        self.host = host
+        self.port = int(port)
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._created = 0
+        self._reused = 0
+        self._closed = 0
+        self._requests = 0
+
+    def request(self, method: str, path: str, body: str = None, headers: dict = None):
+        """
+        performs one request and returns the response status and body; blocks if all connections
+        are in use
+
+        If a reused connection turns out to be closed by the server (the server has closed it
+        before reading the request), the request is repeated once with a new connection. All other
+        errors, including timeouts, are raised to the caller since the request may have been
+        processed by the server.
+        """
+        if headers is None:
+            headers = {}
+        if isinstance(body, str):
+            body = body.encode()
+        self._slots.acquire()
+        try:
+            conn, reused = self._get_conn()
+            try:
+                resp, data = self._do_request(conn, method, path, body, headers)
+            except (BrokenPipeError, ConnectionResetError):
+                # http.client.RemoteDisconnected is a ConnectionResetError
+                self._discard(conn)
+                if not reused:
+                    raise
+                conn = self._new_conn()
+                try:
+                    resp, data = self._do_request(conn, method, path, body, headers)
+                except BaseException:
+                    self._discard(conn)
+                    raise
+            except BaseException:
+                self._discard(conn)
+                raise
+            if resp.will_close:
+                self._discard(conn)
+            else:
+                self._put_conn(conn)
+            return resp.status, data
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """
+        returns the reuse statistics of the pool
+        """
+        self._lock.acquire()
+        ret = {"requests": self._requests, "created": self._created, "reused": self._reused,
+               "closed": self._closed, "idle": len(self._idle)}
+        self._lock.release()
+        return ret
+
+    def close(self):
+        """
+        closes all idle connections
+        """
+        self._lock.acquire()
+        idle = self._idle
+        self._idle = []
+        self._closed += len(idle)
+        self._lock.release()
+        for conn, _ in idle:
+            conn.close()
+
+    def _do_request(self, conn: http.client.HTTPConnection, method: str, path: str, body: bytes,
+                    headers: dict):
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        self._lock.acquire()
+        self._requests += 1
+        self._lock.release()
+        return resp, data
+
+    def _get_conn(self):
+        """
+        returns an idle connection if available or a new connection otherwise; idle connections
+        which exceeded the idle timeout are closed
+        """
+        expired = []
+        conn = None
+        now = time.monotonic()
+        self._lock.acquire()
+        while len(self._idle) > 0:
+            temp, last_used = self._idle.pop()
+            if now - last_used < self.idle_timeout:
+                conn = temp
+                self._reused += 1
+                break
+            expired.append(temp)
+        self._closed += len(expired)
+        self._lock.release()
+        for temp in expired:
+            temp.close()
+        if conn is not None:
+            return conn, True
+        return self._new_conn(), False
+
+    def _new_conn(self) -> http.client.HTTPConnection:
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self._lock.acquire()
+        self._created += 1
+        self._lock.release()
+        return conn
+
+    def _put_conn(self, conn: http.client.HTTPConnection):
+        self._lock.acquire()
+        self._idle.append((conn, time.monotonic()))
+        self._lock.release()
+
+    def _discard(self, conn: http.client.HTTPConnection):
+        conn.close()
+        self._lock.acquire()
+        self._closed += 1
+        self._lock.release()
+        logging.debug("Transport: Closed connection to " + self.host)
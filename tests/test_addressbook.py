@@ -0,0 +1,101 @@
+import functools
+import threading
+import time
+import types
+import clonemapy.addressbook as addressbook
+import clonemapy.agency as agency
+import clonemapy.datamodels as datamodels
+import clonemapy.message as message
+import clonemapy.routing as routing
+
+
+class SlowQueue:
+    """
+    queue of a remote agency which blocks when the address book forwards buffered messages until
+    released
+    """
+    def __init__(self):
+        self.items = []
+        self.sender = threading.current_thread()
+        self.entered = threading.Semaphore(0)
+        self.proceed = threading.Semaphore(0)
+
+    def put(self, msg):
+        if msg.content.startswith("buffered") and threading.current_thread() is not self.sender:
+            self.entered.release()
+            self.proceed.acquire(timeout=1)
+        self.items.append(msg.content)
+
+
+def new_agency(monkeypatch, address: datamodels.Address):
+    requested = threading.Event()
+    monkeypatch.setattr(addressbook.ams, "get_agent_address",
+                        lambda host, masid, agentid: requested.wait(1) and address)
+    q = SlowQueue()
+    ag = types.SimpleNamespace(routes=routing.RoutingTable(), remote_agency=lambda addr: q)
+    ag.addresses = addressbook.AddressBook(
+        "ams", 0, "a", functools.partial(agency.Agency.address_resolved, ag),
+        functools.partial(agency.Agency.address_published, ag),
+        functools.partial(agency.Agency.addresses_changed, ag), 2, 10, max_pending=10)
+    return ag, q, requested
+
+
+def send(ag, content: str):
+    # fast path of the dispatcher (Agency.send_msg)
+    msg = message.Message(receiver=1, content=content)
+    recv_agency = ag.routes.remote.get(1, None)
+    if recv_agency is not None:
+        recv_agency.put(msg)
+    else:
+        agency.Agency.send_remote_msg(ag, msg)
+
+
+def wait_for(cond):
+    deadline = time.monotonic() + 1
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cond()
+
+
+def test_buffered_messages_keep_order(monkeypatch):
+    ag, q, requested = new_agency(monkeypatch, datamodels.Address(agency="b"))
+    send(ag, "buffered-0")
+    requested.set()
+    # first buffered message is being forwarded
+    assert q.entered.acquire(timeout=1)
+    send(ag, "buffered-1")
+    q.proceed.release()
+    # second buffered message is being forwarded
+    assert q.entered.acquire(timeout=1)
+    send(ag, "later")
+    q.proceed.release()
+    wait_for(lambda: len(q.items) == 3)
+    assert q.items == ["buffered-0", "buffered-1", "later"]
+    wait_for(lambda: 1 in ag.routes.remote)
+    send(ag, "direct")
+    assert q.items[-1] == "direct"
+    assert ag.addresses.stats()["pending"] == 0
+
+
+def test_invalid_address(monkeypatch):
+    ag, q, requested = new_agency(monkeypatch, datamodels.Address(agency=""))
+    requested.set()
+    send(ag, "a")
+    wait_for(lambda: ag.addresses.stats()["pending"] == 0)
+    send(ag, "b")
+    assert q.items == []
+    assert 1 not in ag.routes.remote
+    assert ag.addresses.stats()["negative"] == 1
+
+
+def test_pending_limit(monkeypatch):
+    ag, q, requested = new_agency(monkeypatch, datamodels.Address(agency="b"))
+    for i in range(15):
+        send(ag, "buffered-" + str(i))
+    assert ag.addresses.stats()["overflow"] == 5
+    requested.set()
+    for i in range(10):
+        assert q.entered.acquire(timeout=1)
+        q.proceed.release()
+    wait_for(lambda: len(q.items) == 10)
+    assert q.items == ["buffered-" + str(i) for i in range(10)]
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+import clonemapy.codec as codec
+import clonemapy.message as message
+
+
+@pytest.mark.parametrize("ts", [
+    datetime(2024, 5, 17, 12, 30, 45, 123456),
+    datetime(2024, 5, 17, 12, 30, 45, 123456, tzinfo=timezone.utc),
+    datetime(2024, 5, 17, 12, 30, 45, 123456, tzinfo=timezone(timedelta(hours=-5, minutes=-30))),
+    "2024-05-17T12:30:45.123456Z",
+])
+def test_timestamp(ts):
+    msg = message.Message(receiver=1, content="x", ts=ts)
+    ret = codec.decode(codec.encode(msg))
+    assert ret == msg
+    assert type(ret.ts) is type(ts)
+    if isinstance(ts, datetime):
+        assert ret.ts.utcoffset() == ts.utcoffset()
+
+
+def test_fields():
+    msg = message.Message(receiver=7, content="äöü", perf=3, sender=5, agencys="a-0", agencyr="b",
+                          repto=9, prot=2, lang="de", enc="utf-8", ont="o", convid=11,
+                          repwith="r", inrepto="i", repby="t")
+    assert codec.decode(codec.encode(msg)) == msg
+
+
+def test_optional_fields():
+    msg = message.Message(receiver=1, content="", repto=None, convid=None)
+    ret = codec.decode(codec.encode(msg))
+    assert ret == msg
+    assert ret.repto is None
+    assert ret.convid is None
+
+
+def test_trace():
+    msg = message.Message(receiver=1, content="x", trace=[["send", 1.5], ["dispatch", 2.25]])
+    ret = codec.decode(codec.encode(msg))
+    assert ret.trace == msg.trace
+    msg.trace = None
+    assert codec.decode(codec.encode(msg)).trace is None
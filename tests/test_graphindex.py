@@ -0,0 +1,46 @@
+import clonemapy.datamodels as datamodels
+import clonemapy.graphindex as graphindex
+
+
+def new_graph(nodes: list, edges: list) -> datamodels.Graph:
+    return datamodels.Graph(node=[datamodels.Node(id=i) for i in nodes],
+                            edge=[datamodels.Edge(n1=n1, n2=n2, weight=w) for n1, n2, w in edges])
+
+
+def test_shortest_paths():
+    # the direct edge 1-3 is longer than the path via 2
+    index = graphindex.GraphIndex(new_graph([1, 2, 3, 4], [(1, 2, 1.0), (2, 3, 1.5),
+                                                           (1, 3, 5.0), (3, 4, 2.0)]))
+    assert index.distances(1) == {1: 0.0, 2: 1.0, 3: 2.5, 4: 4.5}
+    assert index.distance(4, 1) == 4.5
+
+
+def test_unreachable():
+    index = graphindex.GraphIndex(new_graph([1, 2, 3], [(1, 2, 1.0)]))
+    assert index.distances(1) == {1: 0.0, 2: 1.0}
+    assert index.distance(1, 3) is None
+    assert index.distances(3) == {3: 0.0}
+
+
+def test_nodes_of_edges():
+    # nodes only referenced by edges are part of the graph
+    index = graphindex.GraphIndex(new_graph([], [(1, 2, 3.0)]))
+    assert index.distances(2) == {1: 3.0, 2: 0.0}
+
+
+def test_source_not_in_graph():
+    index = graphindex.GraphIndex(new_graph([1, 2], [(1, 2, 1.0)]))
+    assert index.distances(7) == {7: 0.0}
+    assert index.distance(7, 7) == 0.0
+    assert index.distance(7, 1) is None
+
+
+def test_cache():
+    index = graphindex.GraphIndex(new_graph([1, 2, 3], [(1, 2, 1.0), (2, 3, 1.0)]), max_cached=2)
+    first = index.distances(1)
+    assert index.distances(1) is first
+    index.distances(2)
+    index.distances(3)
+    # the cache has been cleared when it was full
+    assert index.distances(1) is not first
+    assert index.distances(1) == first
@@ -0,0 +1,81 @@
+import queue
+import pytest
+import clonemapy.ipc as ipc
+import clonemapy.message as message
+
+pytestmark = pytest.mark.skipif(not ipc.AVAILABLE, reason="shared memory not available")
+
+
+@pytest.fixture
+def ring():
+    r = ipc.RingBuffer(64)
+    yield r
+    r.close()
+    r.unlink()
+
+
+def test_ring_empty(ring):
+    assert ring.empty()
+    assert ring.read() is None
+
+
+def test_ring_full(ring):
+    assert ring.write(b"a"*28)
+    assert ring.write(b"b"*28)
+    assert not ring.write(b"c")
+    assert ring.read() == b"a"*28
+    assert ring.write(b"c"*28)
+    assert ring.read() == b"b"*28
+    assert ring.read() == b"c"*28
+    assert ring.empty()
+
+
+def test_ring_record_too_large(ring):
+    with pytest.raises(ValueError):
+        ring.write(b"x"*61)
+
+
+# records of 20 bytes leave 16 bytes at the end of the ring (wrap marker), records of 26 bytes
+# leave 4 bytes (wrap marker) and records of 27 bytes leave 2 bytes (too small for a marker)
+@pytest.mark.parametrize("size", [20, 26, 27])
+def test_ring_wrap(ring, size):
+    data = [bytes([i])*size for i in range(10)]
+    assert ring.write(data[0])
+    assert ring.write(data[1])
+    for i in range(2, len(data)):
+        assert ring.read() == data[i-2]
+        assert ring.write(data[i])
+    assert ring.read() == data[-2]
+    assert ring.read() == data[-1]
+    assert ring.read() is None
+
+
+def test_queue_roundtrip():
+    q = ipc.ShmQueue(1024)
+    msg = message.Message(receiver=1, content="hello", sender=2)
+    q.put(msg)
+    q.put(("start", 3))
+    assert q.get() == msg
+    assert q.get() == ("start", 3)
+    with pytest.raises(queue.Empty):
+        q.get_nowait()
+    q.close()
+    q.unlink()
+
+
+def test_group_remove_pending():
+    group = ipc.RingGroup()
+    q1 = group.new_queue(1024)
+    q2 = group.new_queue(1024)
+    q1.put("a")
+    q1.put("b")
+    q2.put("c")
+    group.remove(q1)
+    assert q1 not in group
+    assert q2 in group
+    assert group.get(timeout=1) == "c"
+    with pytest.raises(queue.Empty):
+        group.get_nowait()
+    q2.put("d")
+    assert group.get(timeout=1) == "d"
+    group.remove(q2)
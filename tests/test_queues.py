@@ -0,0 +1,98 @@
+import queue
+import time
+import clonemapy.queues as queues
+
+
+def drain(q) -> list:
+    ret = []
+    while True:
+        try:
+            ret.append(q.get_nowait())
+        except queue.Empty:
+            return ret
+
+
+def test_block_timeout():
+    q = queues.OverflowQueue(queue.Queue(2), "test", "block", 0.05)
+    assert q.put(1)
+    assert q.put(2)
+    start = time.monotonic()
+    assert not q.put(3)
+    assert time.monotonic() - start >= 0.05
+    assert drain(q) == [1, 2]
+    assert q.stats()["dropped"] == 1
+
+
+def test_drop_newest():
+    q = queues.OverflowQueue(queue.Queue(2), "test", "drop_newest")
+    assert q.put(1)
+    assert q.put(2)
+    assert not q.put(3)
+    assert drain(q) == [1, 2]
+    stats = q.stats()
+    assert stats["dropped"] == 1
+    assert stats["high_water"] == 2
+
+
+def test_drop_oldest():
+    q = queues.OverflowQueue(queue.Queue(2), "test", "drop_oldest")
+    for i in range(5):
+        q.put(i)
+    assert drain(q) == [3, 4]
+    assert q.stats()["dropped"] == 3
+
+
+def test_drop_oldest_single_consumer():
+    class SingleConsumerQueue(queue.Queue):
+        multi_consumer = False
+    q = queues.OverflowQueue(SingleConsumerQueue(2), "test", "drop_oldest")
+    assert q.policy == "drop_newest"
+
+
+def test_invalid_policy():
+    q = queues.OverflowQueue(queue.Queue(2), "test", "invalid")
+    assert q.policy == "block"
+
+
+def test_spill_keeps_order():
+    q = queues.OverflowQueue(queue.Queue(2), "test", "spill")
+    for i in range(10):
+        assert q.put(i)
+    assert q.stats()["spilled"] > 0
+    ret = [q.get(timeout=1) for i in range(10)]
+    assert ret == list(range(10))
+    # the count is decremented after the item has been moved to the queue
+    deadline = time.monotonic() + 1
+    while q.stats()["spilled"] > 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert q.stats()["spilled"] == 0
+
+
+def test_spill_file():
+    f = queues.SpillFile()
+    f.push("a")
+    f.push({"b": 1})
+    assert len(f) == 2
+    assert f.peek() == "a"
+    f.pop()
+    assert f.peek() == {"b": 1}
+    f.pop()
+    assert len(f) == 0
+    f.push("c")
+    assert f.peek() == "c"
+
+
+def test_new_queue_config(monkeypatch):
+    monkeypatch.setenv("CLONEMAP_QUEUE_TEST_SIZE", "3")
+    monkeypatch.setenv("CLONEMAP_QUEUE_TEST_POLICY", "drop_newest")
+    q = queues.new_queue("TEST", 10)
+    assert q.policy == "drop_newest"
+    for i in range(5):
+        q.put(i)
+    assert drain(q) == [0, 1, 2]
+
+
+def test_merge_stats():
+    stats = [{"depth": 2, "high_water": 5, "dropped": 1, "spilled": 0},
+             {"depth": -1, "high_water": 7, "dropped": 2, "spilled": 3}]
+    assert queues.merge_stats(stats) == {"depth": 2, "high_water": 7, "dropped": 3, "spilled": 3}